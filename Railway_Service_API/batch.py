@@ -0,0 +1,245 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Callable
+from urllib.parse import urlsplit
+
+from django.db import connections
+from django.http import HttpRequest, HttpResponseBase, QueryDict
+from django.urls import Resolver404, resolve
+from drf_spectacular.utils import extend_schema, OpenApiExample
+from rest_framework import serializers, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle, UserRateThrottle
+from rest_framework.views import APIView
+
+from Railway_Service_API import settings
+from Railway_Service_API.tracing import TracedViewMixin, start_span
+
+BATCH_NAMESPACES = ("railway", "user")
+
+# Headers of the batch request that must not leak into its sub-requests
+EXCLUDED_META_KEYS = (
+    "CONTENT_LENGTH",
+    "CONTENT_TYPE",
+    "HTTP_IF_NONE_MATCH",
+    "HTTP_IF_MODIFIED_SINCE",
+    "HTTP_IF_RANGE",
+    "HTTP_RANGE",
+    "wsgi.input",
+)
+
+
+class BatchSubRequestSerializer(serializers.Serializer):
+    url = serializers.CharField(max_length=2000)
+    etag = serializers.CharField(max_length=200, required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchSubRequestSerializer(
+        many=True, allow_empty=False, max_length=settings.BATCH_MAX_REQUESTS
+    )
+    parallel = serializers.BooleanField(default=False)
+
+
+class BatchResultSerializer(serializers.Serializer):
+    url = serializers.CharField()
+    status = serializers.IntegerField()
+    etag = serializers.CharField(required=False)
+    body = serializers.JSONField(allow_null=True)
+
+
+class BatchResponseSerializer(serializers.Serializer):
+    responses = BatchResultSerializer(many=True)
+
+
+class BatchRateThrottle(UserRateThrottle):
+    """Charge the user rate once for every sub-request of a batch.
+
+    Shares the history of UserRateThrottle, so a batch costs as much
+    of the user's quota as its requests sent one by one.
+    """
+
+    @staticmethod
+    def get_cost(request: Request) -> int:
+        items = None
+        if isinstance(request.data, dict):
+            items = request.data.get("requests")
+        if not isinstance(items, list):
+            return 1
+        return max(1, min(len(items), settings.BATCH_MAX_REQUESTS))
+
+    def allow_request(self, request: Request, view: APIView) -> bool:
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.history = self.cache.get(self.key, [])
+        self.now = self.timer()
+        while self.history and self.history[-1] <= self.now - self.duration:
+            self.history.pop()
+        cost = self.get_cost(request)
+        if len(self.history) + cost > self.num_requests:
+            return self.throttle_failure()
+        self.history[:0] = [self.now] * cost
+        self.cache.set(self.key, self.history, self.duration)
+        return True
+
+
+class BatchView(TracedViewMixin, APIView):
+    """Run several GET requests of the railway and user APIs at once.
+
+    The batch is authenticated once and counts against the user rate
+    once per sub-request, besides the rate of the batch scope. Its
+    sub-requests are dispatched to their views in this process with the
+    user of the batch and without further throttling. With ``parallel``
+    they run in up to BATCH_MAX_WORKERS threads. Streaming and file
+    responses, like the GTFS feed, can't be embedded and are rejected.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    throttle_classes = (ScopedRateThrottle, BatchRateThrottle)
+    throttle_scope = "batch"
+    views: dict = {}
+
+    @classmethod
+    def get_sub_view(cls, view: Callable) -> Callable:
+        """Return the view of a URL with throttling switched off"""
+        if view not in cls.views:
+            initkwargs = {**view.initkwargs, "throttle_classes": ()}
+            if hasattr(view, "actions"):
+                cls.views[view] = view.cls.as_view(view.actions, **initkwargs)
+            else:
+                cls.views[view] = view.cls.as_view(**initkwargs)
+        return cls.views[view]
+
+    @staticmethod
+    def get_error(url: str, code: int, detail: str) -> dict:
+        return {"url": url, "status": code, "body": {"detail": detail}}
+
+    @staticmethod
+    def release_response(response: HttpResponseBase) -> None:
+        """Close the files of a response that won't be sent.
+
+        Unlike response.close(), doesn't send request_finished, which
+        would close the database connections the batch still uses.
+        """
+        for closer in response._resource_closers:
+            closer()
+        response._resource_closers.clear()
+
+    def build_sub_request(
+            self, request: Request, path: str, query: str, etag: str | None
+    ) -> HttpRequest:
+        sub_request = HttpRequest()
+        sub_request.method = "GET"
+        sub_request.path = sub_request.path_info = path
+        sub_request.META = {
+            key: value
+            for key, value in request.META.items()
+            if key not in EXCLUDED_META_KEYS
+        }
+        sub_request.META.update(
+            {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": path,
+                "QUERY_STRING": query,
+                "HTTP_ACCEPT": "application/json",
+            }
+        )
+        if etag:
+            sub_request.META["HTTP_IF_NONE_MATCH"] = etag
+        sub_request.GET = QueryDict(query)
+        sub_request.COOKIES = request.COOKIES
+        # Authenticated once by the batch, read by DRF's Request
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+        return sub_request
+
+    def run_sub_request(self, request: Request, item: dict) -> dict:
+        url = item["url"]
+        parts = urlsplit(url)
+        try:
+            match = resolve(parts.path)
+        except Resolver404:
+            return self.get_error(url, status.HTTP_404_NOT_FOUND, "Not found.")
+        if (
+            match.namespace not in BATCH_NAMESPACES
+            or not hasattr(match.func, "cls")
+        ):
+            return self.get_error(
+                url,
+                status.HTTP_400_BAD_REQUEST,
+                "Only REST endpoints of the railway and user APIs "
+                "can be batched.",
+            )
+        sub_request = self.build_sub_request(
+            request, parts.path, parts.query, item.get("etag")
+        )
+        sub_request.resolver_match = match
+        with start_span("batch.request", url=url):
+            response = self.get_sub_view(match.func)(
+                sub_request, *match.args, **match.kwargs
+            )
+        if response.streaming:
+            self.release_response(response)
+            return self.get_error(
+                url,
+                status.HTTP_400_BAD_REQUEST,
+                "Streaming and file responses can't be batched.",
+            )
+        result = {
+            "url": url,
+            "status": response.status_code,
+            "body": getattr(response, "data", None),
+        }
+        if response.has_header("ETag"):
+            result["etag"] = response["ETag"]
+        return result
+
+    def run_in_thread(self, request: Request, item: dict) -> dict:
+        try:
+            return self.run_sub_request(request, item)
+        finally:
+            # Worker threads don't finish requests, which closes them
+            connections.close_all()
+
+    @extend_schema(
+        request=BatchSerializer,
+        responses=BatchResponseSerializer,
+        examples=[
+            OpenApiExample(
+                name="home screen",
+                request_only=True,
+                value={
+                    "requests": [
+                        {"url": "/api/v1/railway/stations/"},
+                        {"url": "/api/v1/railway/train_types/"},
+                        {"url": "/api/v1/railway/trips/?route=1"},
+                        {"url": "/api/v1/railway/orders/"},
+                    ],
+                    "parallel": True,
+                },
+            )
+        ],
+    )
+    def post(self, request: Request) -> Response:
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data["requests"]
+        if not serializer.validated_data["parallel"] or len(items) == 1:
+            results = [self.run_sub_request(request, item) for item in items]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=min(settings.BATCH_MAX_WORKERS, len(items))
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        copy_context().run, self.run_in_thread, request, item
+                    )
+                    for item in items
+                ]
+                results = [future.result() for future in futures]
+        return Response({"responses": results})
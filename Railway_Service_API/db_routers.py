@@ -0,0 +1,57 @@
+import random
+from contextvars import ContextVar
+
+from django.http import HttpRequest, HttpResponse
+
+from Railway_Service_API import settings
+
+read_from_replica = ContextVar("read_from_replica", default=False)
+
+PRIMARY_PIN_COOKIE = "primary_pin"
+
+
+def pin_to_primary(response: HttpResponse, user) -> None:
+    """Send the user's reads to the primary for PRIMARY_PIN_SECONDS.
+
+    The pin is a signed cookie naming the user, so it holds across
+    workers without shared state. Clients that don't keep cookies
+    aren't pinned and may read stale data from a lagging replica.
+    """
+    response.set_signed_cookie(
+        PRIMARY_PIN_COOKIE,
+        user.pk,
+        salt=PRIMARY_PIN_COOKIE,
+        max_age=settings.PRIMARY_PIN_SECONDS,
+        httponly=True,
+        samesite="Lax",
+    )
+
+
+def is_pinned_to_primary(request: HttpRequest) -> bool:
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return False
+    return request.get_signed_cookie(
+        PRIMARY_PIN_COOKIE,
+        default=None,
+        salt=PRIMARY_PIN_COOKIE,
+        max_age=settings.PRIMARY_PIN_SECONDS,
+    ) == str(user.pk)
+
+
+class PrimaryReplicaRouter:
+    """Route reads flagged by ``read_from_replica`` to a replica"""
+
+    def db_for_read(self, model, **hints) -> str:
+        if settings.DATABASE_REPLICAS and read_from_replica.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return "default"
+
+    def db_for_write(self, model, **hints) -> str:
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, **hints) -> bool:
+        return db == "default"
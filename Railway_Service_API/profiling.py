@@ -0,0 +1,190 @@
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse
+from drf_spectacular.utils import extend_schema
+from rest_framework import serializers
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from Railway_Service_API import settings
+
+PROFILE_NAME_PATTERN = re.compile(
+    r"^(?P<created_at>\d{8}T\d{6})-(?P<view>\w+)-(?P<action>\w+)"
+    r"-(?P<duration>\d+)ms-[0-9a-f]{8}\.prof$"
+)
+
+# cProfile can't run in two threads at once, other requests are skipped
+profiler_lock = threading.Lock()
+
+
+def is_profile_requested(request: HttpRequest) -> bool:
+    """Return whether a staff user asked to profile the request"""
+    if settings.PROFILING_HEADER not in request.headers:
+        return False
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+def get_view_tags(request: HttpRequest) -> tuple[str, str]:
+    """Return the view class name and the action that served a request"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved", request.method.lower()
+    view = getattr(match.func, "cls", match.func)
+    action = getattr(match.func, "actions", None) or {}
+    return (
+        view.__name__,
+        action.get(request.method.lower(), request.method.lower()),
+    )
+
+
+def remove_old_profiles(directory: Path) -> None:
+    profiles = sorted(directory.glob("*.prof"), reverse=True)
+    for path in profiles[settings.PROFILING_MAX_FILES:]:
+        path.unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """Run sampled requests under cProfile and keep their profiles.
+
+    Requests are profiled at PROFILING_SAMPLE_RATE, and always when a
+    staff user authenticated by JWT sends the PROFILING_HEADER header.
+    Profiles are written to PROFILING_DIR in ``pstats`` format, named
+    after the view and action, and the newest PROFILING_MAX_FILES are
+    kept. The name is returned in the ``X-Profile-Name`` header.
+
+    Requests on the async path (ASGI) pass through unprofiled: cProfile
+    follows a single thread, while such a request moves between the
+    event loop, shared with other requests, and sync_to_async threads.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not (
+            random.random() < settings.PROFILING_SAMPLE_RATE
+            or is_profile_requested(request)
+        ) or not profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        started_at = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            profiler_lock.release()
+        duration = round((time.perf_counter() - started_at) * 1000)
+        view, action = get_view_tags(request)
+        name = (
+            f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{view}-{action}"
+            f"-{duration}ms-{uuid.uuid4().hex[:8]}.prof"
+        )
+        directory = settings.PROFILING_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        temporary_path = directory / f".{name}.tmp"
+        profiler.dump_stats(temporary_path)
+        os.replace(temporary_path, directory / name)
+        remove_old_profiles(directory)
+        response["X-Profile-Name"] = name
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        return await self.get_response(request)
+
+
+class ProfileSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    view = serializers.CharField()
+    action = serializers.CharField()
+    duration_ms = serializers.IntegerField()
+    created_at = serializers.DateTimeField()
+    size = serializers.IntegerField()
+    url = serializers.URLField()
+
+
+class ProfileListView(APIView):
+    """List the stored request profiles, newest first"""
+
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(responses=ProfileSerializer(many=True))
+    def get(self, request: Request) -> Response:
+        profiles = []
+        for path in sorted(
+            settings.PROFILING_DIR.glob("*.prof"), reverse=True
+        ):
+            match = PROFILE_NAME_PATTERN.match(path.name)
+            if match is None:
+                continue
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            profiles.append(
+                {
+                    "name": path.name,
+                    "view": match["view"],
+                    "action": match["action"],
+                    "duration_ms": int(match["duration"]),
+                    "created_at": datetime.strptime(
+                        match["created_at"], "%Y%m%dT%H%M%S"
+                    ).replace(tzinfo=timezone.utc),
+                    "size": size,
+                    "url": reverse(
+                        "profile-detail",
+                        args=[path.name],
+                        request=request,
+                    ),
+                }
+            )
+        return Response(ProfileSerializer(profiles, many=True).data)
+
+
+class ProfileDownloadView(APIView):
+    """Download a profile, to be opened with ``pstats`` or snakeviz"""
+
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(responses={(200, "application/octet-stream"): bytes})
+    def get(self, request: Request, name: str) -> FileResponse:
+        if not PROFILE_NAME_PATTERN.match(name):
+            raise Http404
+        try:
+            profile_file = open(settings.PROFILING_DIR / name, "rb")
+        except OSError:
+            raise Http404 from None
+        return FileResponse(
+            profile_file,
+            as_attachment=True,
+            filename=name,
+            content_type="application/octet-stream",
+        )
@@ -0,0 +1,168 @@
+import gzip
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from django.views import View
+from drf_spectacular.renderers import (
+    OpenApiJsonRenderer,
+    OpenApiYamlRenderer,
+)
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.views import SpectacularAPIView
+
+from Railway_Service_API import settings
+
+SCHEMA_FORMATS = {
+    "yaml": ("schema.yaml", "application/vnd.oai.openapi"),
+    "json": ("schema.json", "application/vnd.oai.openapi+json"),
+}
+MANIFEST_NAME = "manifest.json"
+SOURCE_PACKAGES = ("Railway_Service_API", "railway", "user")
+
+
+@lru_cache
+def get_code_version() -> str:
+    """Return CODE_VERSION or a digest of the project's Python sources"""
+    if settings.CODE_VERSION:
+        return settings.CODE_VERSION
+    digest = hashlib.sha256()
+    for package in SOURCE_PACKAGES:
+        for path in sorted((settings.BASE_DIR / package).rglob("*.py")):
+            digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def write_atomically(path: Path, content: bytes) -> None:
+    temporary_path = path.with_name(f".{path.name}.tmp")
+    temporary_path.write_bytes(content)
+    os.replace(temporary_path, path)
+
+
+def read_manifest(directory: Path) -> dict | None:
+    try:
+        return json.loads((directory / MANIFEST_NAME).read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def build_schema(directory: Path) -> dict:
+    """Render the OpenAPI schema once into YAML and JSON build artifacts.
+
+    Every format is written together with a gzip copy, and the
+    manifest is replaced last, so readers never see a partial build.
+    """
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    renderers = {
+        "yaml": OpenApiYamlRenderer(),
+        "json": OpenApiJsonRenderer(),
+    }
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = {"code_version": get_code_version(), "etags": {}}
+    for schema_format, renderer in renderers.items():
+        content = renderer.render(schema, renderer_context={})
+        file_name, _ = SCHEMA_FORMATS[schema_format]
+        write_atomically(directory / file_name, content)
+        write_atomically(
+            directory / f"{file_name}.gz", gzip.compress(content, mtime=0)
+        )
+        digest = hashlib.sha256(content).hexdigest()
+        # Each encoding of a representation needs its own ETag
+        manifest["etags"][schema_format] = {
+            "identity": quote_etag(digest),
+            "gzip": quote_etag(f"{digest}-gzip"),
+        }
+    write_atomically(
+        directory / MANIFEST_NAME, json.dumps(manifest).encode()
+    )
+    return manifest
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Tell whether an Accept-Encoding header allows gzip.
+
+    An explicit gzip entry wins over the * wildcard, and either is
+    refused by a q-value of 0.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+class PrecompiledSchemaView(View):
+    """Serve the schema built by ``manage.py build_schema``.
+
+    Falls back to generating the schema per request like
+    SpectacularAPIView while the artifact is missing or was built for
+    another code version.
+    """
+
+    fallback_view = staticmethod(SpectacularAPIView.as_view())
+    cache: dict = {}
+
+    def load_artifact(self, schema_format: str, compressed: bool) -> bytes:
+        file_name, _ = SCHEMA_FORMATS[schema_format]
+        if compressed:
+            file_name = f"{file_name}.gz"
+        key = (get_code_version(), file_name)
+        if key not in self.cache:
+            path = settings.SCHEMA_BUILD_DIR / file_name
+            self.cache[key] = path.read_bytes()
+        return self.cache[key]
+
+    @staticmethod
+    def get_format(request: HttpRequest) -> str:
+        requested_format = request.GET.get("format", None)
+        if requested_format in SCHEMA_FORMATS:
+            return requested_format
+        if "json" in request.headers.get("Accept", ""):
+            return "json"
+        return "yaml"
+
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        manifest = read_manifest(settings.SCHEMA_BUILD_DIR)
+        if not manifest or manifest["code_version"] != get_code_version():
+            return self.fallback_view(request, *args, **kwargs)
+        schema_format = self.get_format(request)
+        compressed = accepts_gzip(request.headers.get("Accept-Encoding", ""))
+        etag = manifest["etags"][schema_format][
+            "gzip" if compressed else "identity"
+        ]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={settings.SCHEMA_MAX_AGE}",
+            "Vary": "Accept, Accept-Encoding",
+        }
+        # GET compares weakly, so W/ tags of proxies match too
+        tags = {
+            tag.removeprefix("W/")
+            for tag in parse_etags(request.headers.get("If-None-Match", ""))
+        }
+        if etag in tags or "*" in tags:
+            return HttpResponseNotModified(headers=headers)
+        if compressed:
+            headers["Content-Encoding"] = "gzip"
+        try:
+            content = self.load_artifact(schema_format, compressed)
+        except OSError:
+            return self.fallback_view(request, *args, **kwargs)
+        _, content_type = SCHEMA_FORMATS[schema_format]
+        return HttpResponse(
+            content, content_type=content_type, headers=headers
+        )
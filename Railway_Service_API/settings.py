@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "Railway_Service_API.profiling.ProfilingMiddleware",
+    "Railway_Service_API.tracing.TracingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -88,6 +90,27 @@ DATABASES = {
     }
 }
 
+# Comma-separated hosts of read replicas of the default database.
+# The same host as POSTGRES_HOST can be used to try the routing locally.
+DATABASE_REPLICAS = []
+
+for replica_index, replica_host in enumerate(
+    host.strip()
+    for host in os.environ.get("POSTGRES_REPLICA_HOSTS", "").split(",")
+    if host.strip()
+):
+    replica_alias = f"replica_{replica_index}"
+    DATABASES[replica_alias] = {
+        **DATABASES["default"],
+        "HOST": replica_host,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(replica_alias)
+
+DATABASE_ROUTERS = ["Railway_Service_API.db_routers.PrimaryReplicaRouter"]
+
+PRIMARY_PIN_SECONDS = 15
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -149,7 +172,8 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_THROTTLE_RATES": {
         "anon": "250/day",
-        "user": "1500/day"
+        "user": "1500/day",
+        "batch": "500/day"
     }
 }
 
@@ -171,3 +195,91 @@ SPECTACULAR_SETTINGS = {
         "defaultModelExpandDepth": 2,
     },
 }
+
+CODE_VERSION = os.environ.get("CODE_VERSION", "")
+
+SCHEMA_BUILD_DIR = Path(
+    os.environ.get("SCHEMA_BUILD_DIR", BASE_DIR / "build" / "schema")
+)
+
+SCHEMA_MAX_AGE = 3600
+
+TIMETABLE_SNAPSHOT_DIR = Path(
+    os.environ.get(
+        "TIMETABLE_SNAPSHOT_DIR", BASE_DIR / "build" / "timetable"
+    )
+)
+
+TIMETABLE_SEARCH_MAX_IDS = 1000
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+SEAT_HOLD_DURATION = timedelta(minutes=10)
+
+SEAT_HOLD_LIMIT = 10
+
+TRIP_AVAILABILITY_MAX_IDS = 100
+
+FARE_TABLE_CHECK_SECONDS = 30
+
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+# "railway.streams.PostgresBackend" shares seat events between processes
+SEAT_STREAM_BACKEND = os.environ.get(
+    "SEAT_STREAM_BACKEND", "railway.streams.InProcessBackend"
+)
+
+SEAT_STREAM_HEARTBEAT = 15
+
+SEAT_STREAM_QUEUE_SIZE = 100
+
+# Tokens passed in the query string of the seat stream, ends up in logs
+SEAT_STREAM_TOKEN_LIFETIME = timedelta(minutes=1)
+
+# Share of requests traced, incoming "traceparent" headers are followed
+TRACING_SAMPLE_RATE = float(os.environ.get("TRACING_SAMPLE_RATE", 0))
+
+# "Railway_Service_API.tracing.FileExporter" appends spans to TRACING_FILE
+TRACING_EXPORTER = os.environ.get(
+    "TRACING_EXPORTER", "Railway_Service_API.tracing.ConsoleExporter"
+)
+
+TRACING_FILE = Path(
+    os.environ.get("TRACING_FILE", BASE_DIR / "build" / "traces.jsonl")
+)
+
+# Share of requests profiled, staff can ask for a profile with the header
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+
+PROFILING_HEADER = "X-Profile"
+
+PROFILING_DIR = Path(
+    os.environ.get("PROFILING_DIR", BASE_DIR / "build" / "profiles")
+)
+
+PROFILING_MAX_FILES = 200
+
+BATCH_MAX_REQUESTS = 10
+
+BATCH_MAX_WORKERS = 4
+
+# Past trips departed within this many days feed the booking curves
+FORECAST_HISTORY_DAYS = 365
+
+# Sales earlier than this many days before departure count as one day
+FORECAST_HORIZON_DAYS = 120
+
+GTFS_EXPORT_DIR = Path(
+    os.environ.get("GTFS_EXPORT_DIR", BASE_DIR / "build" / "gtfs")
+)
+
+GTFS_AGENCY_NAME = os.environ.get("GTFS_AGENCY_NAME", "Railway Service")
+
+GTFS_AGENCY_URL = os.environ.get("GTFS_AGENCY_URL", "https://example.com")
+
+GTFS_MAX_AGE = 900
+
+# Shortest time between the arrival of a train and its next departure
+TRAIN_TURNAROUND_BUFFER = timedelta(minutes=20)
+
+TRIP_DELAY_MAX_MINUTES = 24 * 60
@@ -0,0 +1,300 @@
+import json
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.fields import empty
+
+from Railway_Service_API import settings
+
+current_span = ContextVar("current_span", default=None)
+
+STATEMENT_MAX_LENGTH = 2000
+
+TRACEPARENT_PATTERN = re.compile(
+    r"^00-(?P<trace_id>[0-9a-f]{32})-(?P<span_id>[0-9a-f]{16})"
+    r"-(?P<flags>[0-9a-f]{2})$"
+)
+
+
+def get_attribute_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """Timed operation of a trace, exported in OTLP/JSON span format"""
+
+    def __init__(
+            self,
+            name: str,
+            trace_id: str,
+            parent_id: str | None,
+            spans: list,
+            attributes: dict,
+    ) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.spans = spans
+        self.attributes = dict(attributes)
+        self.error = None
+        self.start_time = time.time_ns()
+        self.end_time = None
+        spans.append(self)
+
+    def start_child(self, name: str, attributes: dict) -> "Span":
+        return Span(name, self.trace_id, self.span_id, self.spans, attributes)
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+
+    def finish(self) -> None:
+        self.end_time = time.time_ns()
+
+    def to_dict(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time or time.time_ns()),
+            "attributes": [
+                {"key": key, "value": get_attribute_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 0},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error:
+            span["status"] = {"code": 2, "message": self.error}
+        return span
+
+
+class ConsoleExporter:
+    """Write every finished trace to stdout, one span per line"""
+
+    def export(self, spans: list[Span]) -> None:
+        sys.stdout.write(
+            "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+        )
+        sys.stdout.flush()
+
+
+class FileExporter:
+    """Append every finished trace to TRACING_FILE, one span per line"""
+
+    lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        lines = "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+        settings.TRACING_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock, open(settings.TRACING_FILE, "a") as file:
+            file.write(lines)
+
+
+def get_exporter():
+    return import_string(settings.TRACING_EXPORTER)()
+
+
+@contextmanager
+def start_span(name: str, **attributes) -> Iterator[Span | None]:
+    """Time the block as a child of the current span.
+
+    Yields None without recording anything outside of a sampled trace.
+    """
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    span = parent.start_child(name, attributes)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as error:
+        span.record_error(error)
+        raise
+    finally:
+        current_span.reset(token)
+        span.finish()
+
+
+def trace_query(
+        execute: Callable, sql: str, params, many: bool, context: dict
+):
+    with start_span(
+        "db.query",
+        **{
+            "db.system": context["connection"].vendor,
+            "db.name": context["connection"].alias,
+            "db.statement": sql[:STATEMENT_MAX_LENGTH],
+        }
+    ):
+        return execute(sql, params, many, context)
+
+
+class TracingMiddleware:
+    """Start a root span for sampled requests and export it at the end.
+
+    A W3C ``traceparent`` header continues the trace of the caller and
+    carries its sampling decision. Other requests are sampled at
+    TRACING_SAMPLE_RATE. Database queries of sampled requests are
+    recorded as child spans.
+
+    Both sync and async requests are traced. Connections are per
+    thread, so on the async path the queries are traced in the thread
+    that ``sync_to_async`` runs them in.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def get_trace_context(request: HttpRequest) -> tuple | None:
+        match = TRACEPARENT_PATTERN.match(
+            request.headers.get("traceparent", "")
+        )
+        if match:
+            if not int(match["flags"], 16) & 1:
+                return None
+            return match["trace_id"], match["span_id"]
+        if random.random() >= settings.TRACING_SAMPLE_RATE:
+            return None
+        return secrets.token_hex(16), None
+
+    def start_trace(self, request: HttpRequest) -> Span | None:
+        trace_context = self.get_trace_context(request)
+        if trace_context is None:
+            return None
+        trace_id, parent_id = trace_context
+        return Span(
+            f"{request.method} {request.path}",
+            trace_id,
+            parent_id,
+            [],
+            {"http.method": request.method, "http.target": request.path},
+        )
+
+    @staticmethod
+    @contextmanager
+    def activate(root: Span) -> Iterator[None]:
+        token = current_span.set(root)
+        try:
+            yield
+        except BaseException as error:
+            root.record_error(error)
+            raise
+        finally:
+            current_span.reset(token)
+            root.finish()
+            get_exporter().export(root.spans)
+
+    @staticmethod
+    def trace_queries(stack: ExitStack) -> None:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(trace_query))
+
+    @staticmethod
+    def finish_response(
+            request: HttpRequest, response: HttpResponse, root: Span
+    ) -> HttpResponse:
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            root.name = f"{request.method} {match.view_name}"
+            root.set_attribute("http.route", match.route)
+        root.set_attribute("http.status_code", response.status_code)
+        response["traceparent"] = f"00-{root.trace_id}-{root.span_id}-01"
+        return response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        root = self.start_trace(request)
+        if root is None:
+            return self.get_response(request)
+        with self.activate(root):
+            with ExitStack() as stack:
+                self.trace_queries(stack)
+                response = self.get_response(request)
+            return self.finish_response(request, response, root)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        root = self.start_trace(request)
+        if root is None:
+            return await self.get_response(request)
+        with self.activate(root):
+            stack = ExitStack()
+            await sync_to_async(self.trace_queries)(stack)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+            return self.finish_response(request, response, root)
+
+    def process_template_response(
+            self, request: HttpRequest, response: HttpResponse
+    ) -> HttpResponse:
+        parent = current_span.get()
+        if parent is not None:
+            span = parent.start_child("render", {})
+            response.add_post_render_callback(lambda _: span.finish())
+        return response
+
+
+class TracedViewMixin:
+    """Record authentication, permission and throttle checks as spans"""
+
+    def perform_authentication(self, request) -> None:
+        with start_span("drf.authentication"):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request) -> None:
+        with start_span("drf.permissions"):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj) -> None:
+        with start_span("drf.object_permissions"):
+            super().check_object_permissions(request, obj)
+
+    def check_throttles(self, request) -> None:
+        with start_span("drf.throttles"):
+            super().check_throttles(request)
+
+
+class TracedValidationMixin:
+    """Record the validation of a serializer as a span"""
+
+    def run_validation(self, data=empty):
+        with start_span(
+            "serializer.validation", serializer=type(self).__name__
+        ):
+            return super().run_validation(data)
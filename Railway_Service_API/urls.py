@@ -16,18 +16,32 @@ Including another URLconf
 """
 
 from django.contrib import admin
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path, include
 from drf_spectacular.views import (
-    SpectacularAPIView,
     SpectacularSwaggerView,
     SpectacularRedocView
 )
 
+from Railway_Service_API.batch import BatchView
+from Railway_Service_API.profiling import (
+    ProfileDownloadView,
+    ProfileListView,
+)
+from Railway_Service_API.schema import PrecompiledSchemaView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/railway/", include("railway.urls", namespace="railway")),
     path("api/v1/user/", include("user.urls", namespace="user")),
-    path("api/v1/schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("api/v1/batch/", BatchView.as_view(), name="batch"),
+    path("api/v1/profiles/", ProfileListView.as_view(), name="profile-list"),
+    path(
+        "api/v1/profiles/<str:name>/",
+        ProfileDownloadView.as_view(),
+        name="profile-detail",
+    ),
+    path("api/v1/schema/", PrecompiledSchemaView.as_view(), name="schema"),
     path(
         "api/v1/doc/swagger/",
         SpectacularSwaggerView.as_view(url_name="schema"),
@@ -39,3 +53,6 @@ urlpatterns = [
         name="redoc",
     ),
 ]
+
+# Served by runserver itself, not by ASGI servers; only while DEBUG
+urlpatterns += staticfiles_urlpatterns()
@@ -1,21 +1,151 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import QuerySet
+from django.http import HttpRequest
 
 from railway.models import (
     TrainType,
     Train,
+    Fare,
     Crew,
     Station,
     Route,
     Trip,
     Order,
-    Ticket
+    Ticket,
+    ArchivedTrip,
+    ArchivedTicket,
 )
+from railway.cancellations import cancel_order, release_tickets
+from railway.paginations import EstimatedCountPaginator
 
-admin.site.register(TrainType)
-admin.site.register(Train)
-admin.site.register(Crew)
-admin.site.register(Station)
-admin.site.register(Route)
-admin.site.register(Trip)
-admin.site.register(Order)
-admin.site.register(Ticket)
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist of a table too large to be counted on every page"""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(TrainType)
+class TrainTypeAdmin(admin.ModelAdmin):
+    search_fields = ("name__exact",)
+
+
+@admin.register(Train)
+class TrainAdmin(admin.ModelAdmin):
+    list_display = ("name", "train_type", "cargo_num", "places_in_cargo")
+    list_select_related = ("train_type",)
+    search_fields = ("name__exact",)
+    autocomplete_fields = ("train_type",)
+
+
+@admin.register(Fare)
+class FareAdmin(admin.ModelAdmin):
+    list_display = ("train_type", "distance_from", "price")
+    list_select_related = ("train_type",)
+    autocomplete_fields = ("train_type",)
+
+
+@admin.register(Crew)
+class CrewAdmin(admin.ModelAdmin):
+    search_fields = ("name__exact",)
+
+
+@admin.register(Station)
+class StationAdmin(admin.ModelAdmin):
+    list_display = ("name", "latitude", "longitude")
+    search_fields = ("name__exact",)
+
+
+@admin.register(Route)
+class RouteAdmin(admin.ModelAdmin):
+    list_display = ("id", "source", "destination", "distance")
+    list_select_related = ("source", "destination")
+    search_fields = ("source__name__exact",)
+    autocomplete_fields = ("source", "destination")
+
+
+@admin.register(Trip)
+class TripAdmin(LargeTableAdmin):
+    list_display = (
+        "id",
+        "route",
+        "train",
+        "departure_time",
+        "arrival_time",
+        "cancelled_at",
+    )
+    list_select_related = ("train", "route__source", "route__destination")
+    search_fields = ("train__name__exact",)
+    autocomplete_fields = ("route", "train", "crews")
+    # Set by cancelling the bookings of the trip, which releases seats
+    readonly_fields = ("cancelled_at",)
+    ordering = ("-departure_time",)
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "created_at", "cancelled_at")
+    list_select_related = ("user",)
+    search_fields = ("user__username__exact",)
+    raw_id_fields = ("user",)
+    actions = ("cancel_orders",)
+
+    @admin.action(description="Cancel selected orders and release seats")
+    def cancel_orders(self, request: HttpRequest, queryset: QuerySet) -> None:
+        cancelled_orders = released_tickets = 0
+        for order in queryset:
+            try:
+                _, released = cancel_order(order, ValidationError)
+            except ValidationError as error:
+                self.message_user(
+                    request,
+                    f"Order {order.pk}: {'; '.join(error.messages)}",
+                    messages.WARNING,
+                )
+                continue
+            cancelled_orders += 1
+            released_tickets += released
+        self.message_user(
+            request,
+            f"Cancelled {cancelled_orders} orders "
+            f"and released {released_tickets} tickets",
+        )
+
+    @transaction.atomic
+    def delete_queryset(
+            self, request: HttpRequest, queryset: QuerySet
+    ) -> None:
+        """Release the seats of the orders before deleting them"""
+        release_tickets(Ticket.objects.filter(order__in=queryset))
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(Ticket)
+class TicketAdmin(LargeTableAdmin):
+    list_display = ("id", "cargo", "seat", "price", "trip", "order")
+    list_select_related = (
+        "trip__train",
+        "trip__route__source",
+        "trip__route__destination",
+        "order__user",
+    )
+    search_fields = ("order__user__username__exact",)
+    raw_id_fields = ("trip", "order")
+
+
+@admin.register(ArchivedTrip)
+class ArchivedTripAdmin(LargeTableAdmin):
+    list_display = ("id", "route", "train", "departure_time", "arrival_time")
+    list_select_related = ("train", "route__source", "route__destination")
+    raw_id_fields = ("route", "train", "crews")
+    ordering = ("-departure_time",)
+
+
+@admin.register(ArchivedTicket)
+class ArchivedTicketAdmin(LargeTableAdmin):
+    list_display = ("id", "cargo", "seat", "price", "trip", "order")
+    list_select_related = ("trip", "order__user")
+    raw_id_fields = ("trip", "order")
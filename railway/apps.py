@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RailwayConfig(AppConfig):
     name = "railway"
+
+    def ready(self) -> None:
+        import railway.signals  # noqa: F401
@@ -0,0 +1,116 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, QuerySet
+from django.utils import timezone
+
+from railway.models import (
+    ArchivedTicket,
+    Order,
+    ResourceVersion,
+    Route,
+    RouteDailyLoad,
+    SeatHold,
+    Ticket,
+    Trip,
+    delete_rows,
+)
+from railway.signals import get_load_key, tickets_deleted
+from railway.streams import publish_seat_changes
+
+
+def release_tickets(tickets: QuerySet) -> tuple[list[int], int]:
+    """Delete tickets with one statement and cancel the emptied orders.
+
+    Availability, route loads, versions and seat streams are updated
+    through ``tickets_deleted``, as the ticket signals are bypassed.
+    Orders left without tickets are marked cancelled with one UPDATE.
+    Returns ids of the cancelled orders and the number of released
+    tickets. Must run inside a transaction.
+    """
+    rows = list(
+        tickets.select_for_update().order_by().values_list(
+            "order_id", "trip_id", "cargo", "seat"
+        )
+    )
+    if not rows:
+        return [], 0
+    delete_rows(tickets)
+    tickets_deleted([seat for _, *seat in rows])
+    order_ids = {order_id for order_id, *_ in rows}
+    emptied_orders = (
+        Order.objects
+        .filter(id__in=order_ids, cancelled_at__isnull=True)
+        .exclude(Exists(Ticket.objects.filter(order_id=OuterRef("pk"))))
+        .exclude(
+            Exists(ArchivedTicket.objects.filter(order_id=OuterRef("pk")))
+        )
+    )
+    cancelled_order_ids = sorted(
+        emptied_orders.order_by().values_list("id", flat=True)
+    )
+    Order.objects.filter(id__in=cancelled_order_ids).update(
+        cancelled_at=timezone.now()
+    )
+    return cancelled_order_ids, len(rows)
+
+
+@transaction.atomic
+def cancel_order(order: Order, error_to_raise) -> tuple[list[int], int]:
+    """Cancel an order whose trips have not departed yet"""
+    order = Order.objects.select_for_update().get(pk=order.pk)
+    if order.cancelled_at is not None:
+        raise error_to_raise({"order": "The order is already cancelled"})
+    if (
+        order.archived_tickets.exists()
+        or order.tickets.filter(trip__departure_time__lte=timezone.now())
+        .exists()
+    ):
+        raise error_to_raise(
+            {"order": "Orders with departed trips can't be cancelled"}
+        )
+    cancelled_order_ids, released_tickets = release_tickets(
+        Ticket.objects.filter(order=order)
+    )
+    if not cancelled_order_ids:
+        # An order without tickets, e.g. emptied by a cancelled trip
+        Order.objects.filter(pk=order.pk).update(cancelled_at=timezone.now())
+    return [order.pk], released_tickets
+
+
+@transaction.atomic
+def cancel_trip_bookings(trip: Trip, error_to_raise) -> tuple[list[int], int]:
+    """Cancel a trip that has not departed yet and release its seats.
+
+    The trip stays, marked cancelled: it is left out of listings,
+    searches, feeds and route loads, and takes no new bookings. Its
+    tickets and holds are released in the same transaction.
+    """
+    # Serializes cancellations of the trip with each other and with
+    # orders, whose tickets lock the trip row against updates
+    trip = Trip.objects.select_for_update().select_related("train").get(
+        pk=trip.pk
+    )
+    if trip.cancelled_at is not None:
+        raise error_to_raise({"trip": "The trip is already cancelled"})
+    if trip.departure_time <= timezone.now():
+        raise error_to_raise({"trip": "Departed trips can't be cancelled"})
+    Trip.objects.filter(pk=trip.pk).update(cancelled_at=timezone.now())
+    RouteDailyLoad.apply_changes(
+        {
+            get_load_key(trip.route_id, trip.departure_time): [
+                -1, -trip.train.capacity, 0
+            ]
+        }
+    )
+    keys = [
+        ResourceVersion.get_key(Trip),
+        ResourceVersion.get_key(Trip, trip.pk),
+        ResourceVersion.get_key(Route, trip.route_id),
+    ]
+    holds = SeatHold.objects.filter(trip=trip)
+    held_seats = list(holds.values_list("trip_id", "cargo", "seat"))
+    if held_seats:
+        delete_rows(holds)
+        publish_seat_changes(held_seats, "freed")
+        keys.append(ResourceVersion.get_key(SeatHold))
+    ResourceVersion.bump(keys)
+    return release_tickets(Ticket.objects.filter(trip=trip))
@@ -0,0 +1,80 @@
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from Railway_Service_API import settings
+from railway.models import Fare, ResourceVersion
+
+
+class FareTable:
+    """In-memory fare bands of every train type.
+
+    The table is loaded with a single query and reloaded when the "fare"
+    ResourceVersion changes. Changes made by this process invalidate it
+    at once through a signal, those of other processes are noticed within
+    FARE_TABLE_CHECK_SECONDS.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.bands = {}
+        self.version = None
+        self.loaded = False
+        self.checked_at = 0.0
+
+    @staticmethod
+    def get_current_version() -> int | None:
+        return (
+            ResourceVersion.objects
+            .filter(key=ResourceVersion.get_key(Fare))
+            .values_list("version", flat=True)
+            .first()
+        )
+
+    def load(self, version: int | None) -> None:
+        bands = defaultdict(lambda: ([], []))
+        for train_type_id, distance_from, price in (
+            Fare.objects
+            .order_by("train_type_id", "distance_from")
+            .values_list("train_type_id", "distance_from", "price")
+        ):
+            distances, prices = bands[train_type_id]
+            distances.append(distance_from)
+            prices.append(price)
+        self.bands = dict(bands)
+        self.version = version
+        self.loaded = True
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if (
+            self.loaded
+            and now - self.checked_at < settings.FARE_TABLE_CHECK_SECONDS
+        ):
+            return
+        with self.lock:
+            if (
+                self.loaded
+                and now - self.checked_at < settings.FARE_TABLE_CHECK_SECONDS
+            ):
+                return
+            version = self.get_current_version()
+            if not self.loaded or version != self.version:
+                self.load(version)
+            self.checked_at = now
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.loaded = False
+
+    def get_price(self, train_type_id: int, distance: int) -> Decimal | None:
+        """Return the fare of a trip, None if the train type has no band"""
+        self.refresh()
+        distances, prices = self.bands.get(train_type_id, ((), ()))
+        index = bisect_right(distances, distance) - 1
+        return prices[index] if index >= 0 else None
+
+
+fare_table = FareTable()
@@ -0,0 +1,239 @@
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+from Railway_Service_API import settings
+from railway.models import ArchivedTicket, ArchivedTrip, Ticket, Trip
+
+DAY_SECONDS = 86400
+
+TRIP_DTYPE = np.dtype(
+    [
+        ("id", "<i8"),
+        ("group", "<i8"),
+        ("departure", "<i8"),
+        ("capacity", "<i8"),
+    ]
+)
+
+TICKET_DTYPE = np.dtype([("trip", "<i8"), ("created_at", "<i8")])
+
+
+def get_group(route_id: int, departure_time: datetime) -> int:
+    """Key trips by route and local weekday of the departure"""
+    return route_id * 7 + timezone.localtime(departure_time).weekday()
+
+
+def load_trips(queryset: QuerySet) -> np.ndarray:
+    """Return trips of the queryset sorted by id"""
+    trips = np.fromiter(
+        (
+            (
+                trip_id,
+                get_group(route_id, departure_time),
+                int(departure_time.timestamp()),
+                capacity,
+            )
+            for trip_id, route_id, departure_time, capacity in (
+                queryset
+                .annotate(
+                    capacity=(
+                        F("train__cargo_num") * F("train__places_in_cargo")
+                    )
+                )
+                .filter(capacity__gt=0)
+                .order_by()
+                .values_list("id", "route_id", "departure_time", "capacity")
+                .iterator(chunk_size=10000)
+            )
+        ),
+        dtype=TRIP_DTYPE,
+    )
+    return np.sort(trips, order="id")
+
+
+def load_tickets(queryset: QuerySet) -> np.ndarray:
+    return np.fromiter(
+        (
+            (trip_id, int(created_at.timestamp()))
+            for trip_id, created_at in (
+                queryset
+                .order_by()
+                .values_list("trip_id", "order__created_at")
+                .iterator(chunk_size=10000)
+            )
+        ),
+        dtype=TICKET_DTYPE,
+    )
+
+
+def load_history(since: datetime, until: datetime) -> tuple:
+    """Return past trips and their tickets, archived ones included"""
+    trips, tickets = [], []
+    for trip_model, ticket_model in (
+        (Trip, Ticket),
+        (ArchivedTrip, ArchivedTicket),
+    ):
+        period = {
+            "departure_time__range": (since, until),
+            "cancelled_at__isnull": True,
+        }
+        trips.append(load_trips(trip_model.objects.filter(**period)))
+        tickets.append(
+            load_tickets(
+                ticket_model.objects.filter(
+                    **{f"trip__{key}": value for key, value in period.items()}
+                )
+            )
+        )
+    # Archived trips keep their ids, so the two sets never overlap
+    return np.sort(np.concatenate(trips), order="id"), np.concatenate(tickets)
+
+
+def get_trip_positions(
+        trips: np.ndarray, tickets: np.ndarray
+) -> np.ndarray:
+    """Return the index of the trip of every ticket, -1 if it is unknown"""
+    if not len(trips):
+        return np.full(len(tickets), -1)
+    positions = np.minimum(
+        np.searchsorted(trips["id"], tickets["trip"]), len(trips) - 1
+    )
+    return np.where(trips["id"][positions] == tickets["trip"], positions, -1)
+
+
+def fit_booking_curves(
+        trips: np.ndarray, tickets: np.ndarray, horizon: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Average the booking curves of past trips per route and weekday.
+
+    ``curves[group, day]`` is the mean share of the seats sold at least
+    ``day`` days before departure, sales earlier than ``horizon`` days
+    are counted at the horizon. Returns the group keys, the curves and
+    the number of trips behind each curve.
+    """
+    positions = get_trip_positions(trips, tickets)
+    known = positions >= 0
+    positions = positions[known]
+    lead_days = np.clip(
+        (trips["departure"][positions] - tickets["created_at"][known])
+        // DAY_SECONDS,
+        0,
+        horizon,
+    )
+    sales = np.bincount(
+        positions * (horizon + 1) + lead_days,
+        minlength=len(trips) * (horizon + 1),
+    ).reshape(len(trips), horizon + 1)
+    booked = np.minimum(
+        np.cumsum(sales[:, ::-1], axis=1)[:, ::-1]
+        / trips["capacity"][:, None],
+        1,
+    )
+    groups, group_index = np.unique(trips["group"], return_inverse=True)
+    curves = np.zeros((len(groups), horizon + 1))
+    np.add.at(curves, group_index, booked)
+    counts = np.bincount(group_index, minlength=len(groups))
+    return groups, curves / np.maximum(counts, 1)[:, None], counts
+
+
+def project_sellouts(
+        trips: np.ndarray,
+        sold: np.ndarray,
+        now: int,
+        groups: np.ndarray,
+        curves: np.ndarray,
+        counts: np.ndarray,
+        horizon: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Project the bookings of upcoming trips with an additive pickup.
+
+    The seats a trip is still expected to sell from now on are those
+    sold on average by trips of its route and weekday over the same
+    days. Trips of groups without history use the mean of all curves.
+    Returns the sell-out timestamps (-1 if the trip is not expected to
+    sell out), projected load factors and history sizes.
+    """
+    fallback = (
+        (curves * counts[:, None]).sum(axis=0) / counts.sum()
+        if counts.sum()
+        else np.zeros(horizon + 1)
+    )
+    positions = np.minimum(
+        np.searchsorted(groups, trips["group"]), max(len(groups) - 1, 0)
+    )
+    if len(groups):
+        known = groups[positions] == trips["group"]
+        trip_curves = np.where(
+            known[:, None], curves[positions], fallback[None, :]
+        )
+        history_trips = np.where(known, counts[positions], 0)
+    else:
+        trip_curves = np.tile(fallback, (len(trips), 1))
+        history_trips = np.zeros(len(trips), dtype=np.int64)
+    lead_now = np.clip((trips["departure"] - now) // DAY_SECONDS, 0, horizon)
+    rows = np.arange(len(trips))
+    booked_now = sold / trips["capacity"]
+    projected = (
+        booked_now[:, None]
+        + trip_curves
+        - trip_curves[rows, lead_now][:, None]
+    )
+    days = np.arange(horizon + 1)
+    sold_out = (
+        (projected >= 1) | np.isclose(projected, 1)
+    ) & (days[None, :] <= lead_now[:, None])
+    # The sell-out is the furthest day before departure reaching capacity
+    sellout_lead = horizon - np.argmax(sold_out[:, ::-1], axis=1)
+    sellout_at = np.where(
+        sold_out.any(axis=1),
+        np.maximum(trips["departure"] - sellout_lead * DAY_SECONDS, now),
+        -1,
+    )
+    load_factors = np.clip(projected[:, 0], 0, 1)
+    return sellout_at, load_factors, history_trips
+
+
+def forecast_sellouts(now: datetime | None = None) -> list[dict]:
+    """Return forecasts of every upcoming trip as TripForecast fields"""
+    now = now or timezone.now()
+    horizon = settings.FORECAST_HORIZON_DAYS
+    history, tickets = load_history(
+        now - timedelta(days=settings.FORECAST_HISTORY_DAYS), now
+    )
+    groups, curves, counts = fit_booking_curves(history, tickets, horizon)
+    upcoming = load_trips(
+        Trip.objects.active().filter(departure_time__gt=now)
+    )
+    positions = get_trip_positions(
+        upcoming,
+        load_tickets(Ticket.objects.filter(trip__departure_time__gt=now)),
+    )
+    sold = np.bincount(positions[positions >= 0], minlength=len(upcoming))
+    sellout_at, load_factors, history_trips = project_sellouts(
+        upcoming, sold, int(now.timestamp()), groups, curves, counts, horizon
+    )
+    return [
+        {
+            "trip_id": int(trip_id),
+            "tickets_sold": int(tickets_sold),
+            "projected_load_factor": round(float(load_factor), 4),
+            "projected_sellout_at": (
+                datetime.fromtimestamp(int(timestamp), UTC)
+                if timestamp >= 0
+                else None
+            ),
+            "history_trips": int(trips_count),
+            "computed_at": now,
+        }
+        for trip_id, tickets_sold, load_factor, timestamp, trips_count in zip(
+            upcoming["id"],
+            sold,
+            load_factors,
+            sellout_at,
+            history_trips,
+            strict=True,
+        )
+    ]
@@ -0,0 +1,393 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import uuid
+import zipfile
+from datetime import datetime, time
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from drf_spectacular.utils import extend_schema
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import APIView
+
+from Railway_Service_API import settings
+from Railway_Service_API.tracing import TracedViewMixin
+from Railway_Service_API.schema import (
+    MANIFEST_NAME,
+    read_manifest,
+    write_atomically,
+)
+from railway.models import ResourceVersion, Route, Station, Trip
+
+FRAGMENTS_DIR = "routes"
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+CHUNK_SIZE = 64 * 1024
+
+# Rail service in the GTFS route_type enumeration
+ROUTE_TYPE_RAIL = 2
+
+
+def get_gtfs_time(moment: datetime, service_day: datetime) -> str:
+    """Format a time since the service day, past 24:00 for night trips"""
+    seconds = int((moment - service_day).total_seconds())
+    return (
+        f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    )
+
+
+def get_route_versions() -> dict[int, int]:
+    prefix = f"{ResourceVersion.get_key(Route)}:"
+    versions = dict.fromkeys(Route.objects.values_list("id", flat=True), 0)
+    for key, version in ResourceVersion.objects.filter(
+        key__startswith=prefix
+    ).values_list("key", "version"):
+        route_id = int(key.removeprefix(prefix))
+        if route_id in versions:
+            versions[route_id] = version
+    return versions
+
+
+def get_shared_versions() -> dict[str, int]:
+    """Versions of the tables written into the feed as a whole"""
+    keys = [ResourceVersion.get_key(model) for model in (Station, Route)]
+    versions = dict(
+        ResourceVersion.objects
+        .filter(key__in=keys)
+        .values_list("key", "version")
+    )
+    return {key: versions.get(key, 0) for key in keys}
+
+
+def build_fragments(route_ids: list[int]) -> dict[int, dict]:
+    """Return trips, stop times and service days of the routes"""
+    fragments = {
+        route_id: {"trips": [], "stop_times": [], "service_days": set()}
+        for route_id in route_ids
+    }
+    for (
+        trip_id,
+        route_id,
+        source_id,
+        destination_id,
+        departure_time,
+        arrival_time,
+    ) in (
+        Trip.objects
+        .active()
+        .filter(route_id__in=route_ids)
+        .order_by("departure_time", "id")
+        .values_list(
+            "id",
+            "route_id",
+            "route__source_id",
+            "route__destination_id",
+            "departure_time",
+            "arrival_time",
+        )
+        .iterator(chunk_size=10000)
+    ):
+        fragment = fragments[route_id]
+        service_date = timezone.localdate(departure_time)
+        service_day = timezone.make_aware(
+            datetime.combine(service_date, time.min)
+        )
+        service_id = service_date.strftime("%Y%m%d")
+        fragment["service_days"].add(service_id)
+        fragment["trips"].append([route_id, service_id, trip_id])
+        departure = get_gtfs_time(departure_time, service_day)
+        arrival = get_gtfs_time(arrival_time, service_day)
+        fragment["stop_times"] += [
+            [trip_id, departure, departure, source_id, 1],
+            [trip_id, arrival, arrival, destination_id, 2],
+        ]
+    for fragment in fragments.values():
+        fragment["service_days"] = sorted(fragment["service_days"])
+    return fragments
+
+
+def write_csv(
+        archive: zipfile.ZipFile,
+        name: str,
+        header: tuple,
+        rows: Iterator,
+) -> None:
+    with archive.open(name, "w") as file:
+        text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+        writer = csv.writer(text, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(rows)
+        text.flush()
+        text.detach()
+
+
+def assemble_feed(path: Path, fragments: list[dict]) -> None:
+    stations = Station.objects.order_by("id").values_list(
+        "id", "name", "latitude", "longitude"
+    )
+    routes = Route.objects.order_by("id").values_list(
+        "id", "source__name", "destination__name"
+    )
+    service_days = sorted(
+        {day for fragment in fragments for day in fragment["service_days"]}
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        write_csv(
+            archive,
+            "agency.txt",
+            ("agency_id", "agency_name", "agency_url", "agency_timezone"),
+            [
+                (
+                    1,
+                    settings.GTFS_AGENCY_NAME,
+                    settings.GTFS_AGENCY_URL,
+                    settings.TIME_ZONE,
+                )
+            ],
+        )
+        write_csv(
+            archive,
+            "stops.txt",
+            ("stop_id", "stop_name", "stop_lat", "stop_lon"),
+            stations,
+        )
+        write_csv(
+            archive,
+            "routes.txt",
+            ("route_id", "agency_id", "route_long_name", "route_type"),
+            (
+                (route_id, 1, f"{source} - {destination}", ROUTE_TYPE_RAIL)
+                for route_id, source, destination in routes
+            ),
+        )
+        write_csv(
+            archive,
+            "calendar_dates.txt",
+            ("service_id", "date", "exception_type"),
+            ((day, day, 1) for day in service_days),
+        )
+        write_csv(
+            archive,
+            "trips.txt",
+            ("route_id", "service_id", "trip_id"),
+            (row for fragment in fragments for row in fragment["trips"]),
+        )
+        write_csv(
+            archive,
+            "stop_times.txt",
+            (
+                "trip_id",
+                "arrival_time",
+                "departure_time",
+                "stop_id",
+                "stop_sequence",
+            ),
+            (row for fragment in fragments for row in fragment["stop_times"]),
+        )
+
+
+def build_gtfs(directory: Path, force: bool = False) -> tuple[dict, int]:
+    """Bring the GTFS feed up to date and return its manifest.
+
+    Trips of a route are kept as a JSON fragment, which is only rebuilt
+    after the per-route ResourceVersion of the route changed. The feed
+    is assembled again from the fragments when any of them, a station
+    or a route changed, and the manifest naming the new file is
+    replaced last. Returns the manifest and the number of rebuilt
+    routes.
+    """
+    versions = get_route_versions()
+    shared_versions = get_shared_versions()
+    previous = read_manifest(directory) or {}
+    previous_routes = {
+        int(route_id): version
+        for route_id, version in previous.get("routes", {}).items()
+    }
+    fragments_dir = directory / FRAGMENTS_DIR
+    fragments_dir.mkdir(parents=True, exist_ok=True)
+    stale_route_ids = [
+        route_id
+        for route_id, version in versions.items()
+        if force
+        or previous_routes.get(route_id) != version
+        or not (fragments_dir / f"{route_id}.json").exists()
+    ]
+    if (
+        not stale_route_ids
+        and versions.keys() == previous_routes.keys()
+        and shared_versions == previous.get("shared")
+        and (directory / previous.get("file", "")).is_file()
+    ):
+        return previous, 0
+    for route_id, fragment in build_fragments(stale_route_ids).items():
+        write_atomically(
+            fragments_dir / f"{route_id}.json", json.dumps(fragment).encode()
+        )
+    for path in fragments_dir.glob("*.json"):
+        if int(path.stem) not in versions:
+            path.unlink(missing_ok=True)
+    fragments = [
+        json.loads((fragments_dir / f"{route_id}.json").read_bytes())
+        for route_id in sorted(versions)
+    ]
+    file_name = f"gtfs-{uuid.uuid4().hex}.zip"
+    assemble_feed(directory / file_name, fragments)
+    digest = hashlib.sha256()
+    with open(directory / file_name, "rb") as feed_file:
+        while chunk := feed_file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    manifest = {
+        "file": file_name,
+        "etag": quote_etag(digest.hexdigest()),
+        "built_at": timezone.now().isoformat(),
+        "routes": versions,
+        "shared": shared_versions,
+    }
+    write_atomically(
+        directory / MANIFEST_NAME, json.dumps(manifest).encode()
+    )
+    for path in directory.glob("gtfs-*.zip"):
+        if path.name != file_name:
+            path.unlink(missing_ok=True)
+    return manifest, len(stale_route_ids)
+
+
+def read_file_range(
+        feed_file: BinaryIO, start: int, length: int
+) -> Iterator[bytes]:
+    with feed_file:
+        feed_file.seek(start)
+        while length > 0:
+            chunk = feed_file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Return first and last byte of a single range, None if unsatisfiable"""
+    match = RANGE_PATTERN.match(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        if not int(last):
+            return None
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last:
+        return None
+    return first, last
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Use the first renderer whatever the client accepts"""
+
+    def select_parser(self, request: Request, parsers: list):
+        return parsers[0]
+
+    def select_renderer(
+            self,
+            request: Request,
+            renderers: list[BaseRenderer],
+            format_suffix: str | None = None,
+    ) -> tuple[BaseRenderer, str]:
+        return renderers[0], renderers[0].media_type
+
+
+class GtfsFeedView(TracedViewMixin, APIView):
+    """Serve the GTFS feed built by ``manage.py build_gtfs_feed``.
+
+    The feed holds the public timetable only and is fetched by partner
+    journey planners without accounts, so it is open to anonymous
+    clients, within the default throttle rates. The feed is served
+    whatever the Accept header, errors are rendered as JSON.
+
+    Supports conditional requests by ETag and single byte ranges, so
+    partners can skip unchanged feeds and resume broken downloads.
+    """
+
+    permission_classes = (AllowAny,)
+    renderer_classes = (JSONRenderer,)
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    @extend_schema(
+        operation_id="railway_gtfs_retrieve",
+        responses={
+            (200, "application/zip"): bytes,
+            (206, "application/zip"): bytes,
+            304: None,
+            416: None,
+        }
+    )
+    def get(self, request: Request, *args, **kwargs) -> HttpResponse:
+        directory = settings.GTFS_EXPORT_DIR
+        manifest = read_manifest(directory)
+        if not manifest:
+            raise Http404("The GTFS feed has not been built yet")
+        etag = manifest["etag"]
+        headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            "Cache-Control": f"public, max-age={settings.GTFS_MAX_AGE}",
+        }
+        if_none_match = {
+            tag.removeprefix("W/")
+            for tag in parse_etags(request.headers.get("If-None-Match", ""))
+        }
+        if etag in if_none_match or "*" in if_none_match:
+            return HttpResponseNotModified(headers=headers)
+        try:
+            # Opened at once, so a rebuild can't remove it while served
+            feed_file = open(directory / manifest["file"], "rb")
+        except OSError:
+            raise Http404("The GTFS feed has not been built yet") from None
+        size = os.fstat(feed_file.fileno()).st_size
+        range_header = request.headers.get("Range")
+        if range_header and request.headers.get("If-Range", etag) == etag:
+            byte_range = parse_range(range_header, size)
+            if byte_range is None:
+                feed_file.close()
+                return HttpResponse(
+                    status=416,
+                    headers={**headers, "Content-Range": f"bytes */{size}"},
+                )
+            first, last = byte_range
+            return StreamingHttpResponse(
+                read_file_range(feed_file, first, last - first + 1),
+                status=206,
+                content_type="application/zip",
+                headers={
+                    **headers,
+                    "Content-Length": str(last - first + 1),
+                    "Content-Range": f"bytes {first}-{last}/{size}",
+                },
+            )
+        response = FileResponse(
+            feed_file,
+            as_attachment=True,
+            filename="gtfs.zip",
+            content_type="application/zip",
+        )
+        for header, value in headers.items():
+            response[header] = value
+        return response
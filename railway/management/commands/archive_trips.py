@@ -0,0 +1,111 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from railway.models import (
+    Crew,
+    Route,
+    Trip,
+    Ticket,
+    SeatHold,
+    TripForecast,
+    ArchivedTrip,
+    ArchivedTicket,
+    ResourceVersion,
+    delete_rows,
+)
+
+
+class Command(BaseCommand):
+    """Django command to move departed trips into the archive tables."""
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=90,
+            help="Archive trips that arrived more than given number "
+                 "of days ago",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of trips archived per transaction",
+        )
+
+    @staticmethod
+    @transaction.atomic
+    def archive_batch(trip_ids: list[int]) -> int:
+        trips = Trip.objects.filter(id__in=trip_ids)
+        route_ids = set(trips.values_list("route_id", flat=True))
+        ArchivedTrip.objects.bulk_create(
+            ArchivedTrip(**values)
+            for values in trips.select_for_update().values(
+                "id",
+                "departure_time",
+                "arrival_time",
+                "route_id",
+                "train_id",
+                "cancelled_at",
+            )
+        )
+        crew_links = Trip.crews.through.objects.filter(trip_id__in=trip_ids)
+        archived_crew_link = ArchivedTrip.crews.through
+        archived_crew_link.objects.bulk_create(
+            archived_crew_link(archivedtrip_id=trip_id, crew_id=crew_id)
+            for trip_id, crew_id in crew_links.values_list(
+                "trip_id", "crew_id"
+            )
+        )
+        tickets = Ticket.objects.filter(trip_id__in=trip_ids)
+        archived_tickets = ArchivedTicket.objects.bulk_create(
+            (
+                ArchivedTicket(**values)
+                for values in tickets.values(
+                    "id", "cargo", "seat", "trip_id", "order_id", "price"
+                )
+            ),
+            batch_size=5000,
+        )
+        # Archived trips and tickets stay counted in RouteDailyLoad,
+        # so the rows are deleted without firing the model signals
+        holds = SeatHold.objects.filter(trip_id__in=trip_ids)
+        forecasts = TripForecast.objects.filter(trip_id__in=trip_ids)
+        for queryset in (tickets, holds, forecasts, crew_links, trips):
+            delete_rows(queryset)
+        ResourceVersion.bump(
+            [
+                ResourceVersion.get_key(model)
+                for model in (Trip, Ticket, SeatHold, Crew)
+            ]
+            + [ResourceVersion.get_key(Trip, trip_id) for trip_id in trip_ids]
+            + [
+                ResourceVersion.get_key(Route, route_id)
+                for route_id in route_ids
+            ]
+        )
+        return len(archived_tickets)
+
+    def handle(self, *args, **options) -> None:
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        archived_trips = archived_tickets = 0
+        while True:
+            trip_ids = list(
+                Trip.objects
+                .filter(arrival_time__lt=cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[:options["batch_size"]]
+            )
+            if not trip_ids:
+                break
+            archived_tickets += self.archive_batch(trip_ids)
+            archived_trips += len(trip_ids)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {archived_trips} trips "
+                f"and {archived_tickets} tickets"
+            )
+        )
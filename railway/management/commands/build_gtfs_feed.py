@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Railway_Service_API import settings
+from railway.gtfs import build_gtfs
+
+
+class Command(BaseCommand):
+    """Django command to update the GTFS feed of the timetable."""
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild the trips of every route, changed or not",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and update the feed every given "
+                 "number of seconds",
+        )
+
+    def build(self, force: bool) -> None:
+        directory = settings.GTFS_EXPORT_DIR
+        manifest, rebuilt_routes = build_gtfs(directory, force)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"GTFS feed {manifest['file']} is up to date, "
+                f"{rebuilt_routes} routes rebuilt"
+            )
+        )
+
+    def handle(self, *args, **options) -> None:
+        while True:
+            self.build(options["force"])
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
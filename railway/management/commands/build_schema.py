@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from Railway_Service_API import settings
+from Railway_Service_API.schema import (
+    build_schema,
+    get_code_version,
+    read_manifest,
+)
+
+
+class Command(BaseCommand):
+    """Django command to prebuild the OpenAPI schema served by the API."""
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--if-stale",
+            action="store_true",
+            help="Only build when the schema was built for another version",
+        )
+
+    def handle(self, *args, **options) -> None:
+        directory = settings.SCHEMA_BUILD_DIR
+        manifest = read_manifest(directory)
+        if (
+            options["if_stale"]
+            and manifest
+            and manifest["code_version"] == get_code_version()
+        ):
+            self.stdout.write("Schema is up to date")
+            return
+        manifest = build_schema(directory)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Schema for version {manifest['code_version']} "
+                f"built in {directory}"
+            )
+        )
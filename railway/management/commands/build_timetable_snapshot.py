@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Railway_Service_API import settings
+from Railway_Service_API.schema import read_manifest
+from railway.timetable import build_timetable, is_stale
+
+
+class Command(BaseCommand):
+    """Django command to build the timetable snapshot used by trip search."""
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--if-stale",
+            action="store_true",
+            help="Only build when trips or routes changed since last build",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and rebuild a stale snapshot every given "
+                 "number of seconds",
+        )
+
+    def build(self, if_stale: bool) -> None:
+        directory = settings.TIMETABLE_SNAPSHOT_DIR
+        if if_stale and not is_stale(read_manifest(directory)):
+            self.stdout.write("Timetable snapshot is up to date")
+            return
+        manifest = build_timetable(directory)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Timetable snapshot of {manifest['trips']} trips "
+                f"built in {directory}"
+            )
+        )
+
+    def handle(self, *args, **options) -> None:
+        while True:
+            self.build(options["if_stale"] or bool(options["interval"]))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Railway_Service_API import settings
+from railway.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    """Django command to delete expired order idempotency keys."""
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of keys deleted per query",
+        )
+
+    def handle(self, *args, **options) -> None:
+        expired_keys = IdempotencyKey.objects.filter(
+            created_at__lt=timezone.now() - settings.IDEMPOTENCY_KEY_TTL
+        )
+        deleted = 0
+        while True:
+            batch = list(
+                expired_keys.order_by("created_at")
+                .values_list("id", flat=True)[:options["batch_size"]]
+            )
+            if not batch:
+                break
+            IdempotencyKey.objects.filter(id__in=batch).delete()
+            deleted += len(batch)
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys")
+        )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from railway.forecasting import forecast_sellouts
+from railway.models import TripForecast
+
+
+class Command(BaseCommand):
+    """Django command to project sell-out dates of all upcoming trips."""
+
+    def handle(self, *args, **options) -> None:
+        started_at = time.perf_counter()
+        forecasts = [
+            TripForecast(**values) for values in forecast_sellouts()
+        ]
+        with transaction.atomic():
+            TripForecast.objects.all().delete()
+            TripForecast.objects.bulk_create(forecasts, batch_size=5000)
+        sellouts = sum(
+            forecast.projected_sellout_at is not None
+            for forecast in forecasts
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Forecast {len(forecasts)} trips, {sellouts} expected "
+                f"to sell out, in {time.perf_counter() - started_at:.2f}s"
+            )
+        )
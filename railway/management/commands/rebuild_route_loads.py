@@ -0,0 +1,68 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.core.management.base import BaseCommand
+
+from railway.models import (
+    ArchivedTicket,
+    ArchivedTrip,
+    RouteDailyLoad,
+    Ticket,
+    Trip,
+)
+
+
+class Command(BaseCommand):
+    """Django command to rebuild route load factors from scratch."""
+
+    @transaction.atomic
+    def handle(self, *args, **options) -> None:
+        loads = defaultdict(dict)
+        for trip_model in (Trip, ArchivedTrip):
+            # Cancelled trips were taken out of the loads when cancelled
+            for row in (
+                trip_model.objects
+                .filter(cancelled_at__isnull=True)
+                .annotate(date=TruncDate("departure_time"))
+                .values("route_id", "date")
+                .annotate(
+                    trips_count=Count("id"),
+                    seats_offered=Sum(
+                        F("train__cargo_num") * F("train__places_in_cargo")
+                    ),
+                )
+            ):
+                load = loads[(row["route_id"], row["date"])]
+                load["trips_count"] = (
+                    load.get("trips_count", 0) + row["trips_count"]
+                )
+                load["seats_offered"] = (
+                    load.get("seats_offered", 0) + row["seats_offered"]
+                )
+        for ticket_model in (Ticket, ArchivedTicket):
+            for row in (
+                ticket_model.objects
+                .annotate(
+                    route_id=F("trip__route_id"),
+                    date=TruncDate("trip__departure_time"),
+                )
+                .values("route_id", "date")
+                .annotate(tickets_sold=Count("id"))
+            ):
+                load = loads[(row["route_id"], row["date"])]
+                load["tickets_sold"] = (
+                    load.get("tickets_sold", 0) + row["tickets_sold"]
+                )
+        RouteDailyLoad.objects.all().delete()
+        RouteDailyLoad.objects.bulk_create(
+            [
+                RouteDailyLoad(route_id=route_id, date=date, **values)
+                for (route_id, date), values in loads.items()
+            ],
+            batch_size=5000,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {len(loads)} route load rows")
+        )
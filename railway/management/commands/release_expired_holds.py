@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from railway.models import SeatHold
+
+
+class Command(BaseCommand):
+    """Django command to release expired seat holds in batches."""
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of holds released per query",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and sweep every given number of seconds",
+        )
+
+    def release_expired_holds(self, batch_size: int) -> int:
+        released = 0
+        while True:
+            batch = list(
+                SeatHold.objects
+                .filter(expires_at__lte=timezone.now())
+                .order_by("expires_at")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not batch:
+                return released
+            SeatHold.objects.filter(id__in=batch).delete()
+            released += len(batch)
+
+    def handle(self, *args, **options) -> None:
+        while True:
+            released = self.release_expired_holds(options["batch_size"])
+            self.stdout.write(f"Released {released} expired seat holds")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS("Expired seat holds released!"))
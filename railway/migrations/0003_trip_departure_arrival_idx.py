@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="trip",
+            name="crews",
+            field=models.ManyToManyField(
+                blank=True, related_name="trips", to="railway.crew"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(
+                fields=["departure_time", "arrival_time"],
+                name="trip_departure_arrival_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0003_trip_departure_arrival_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(
+                fields=["train", "departure_time"], name="trip_train_departure_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:42
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0005_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="request_hash",
+            field=models.CharField(default="", max_length=64),
+        ),
+        migrations.AlterField(
+            model_name="idempotencykey",
+            name="response_body",
+            field=models.JSONField(
+                encoder=django.core.serializers.json.DjangoJSONEncoder, null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="idempotencykey",
+            name="response_status",
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0007_seathold"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RouteDailyLoad",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("trips_count", models.IntegerField(default=0)),
+                ("seats_offered", models.IntegerField(default=0)),
+                ("tickets_sold", models.IntegerField(default=0)),
+                (
+                    "route",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_loads",
+                        to="railway.route",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("date", "route"),
+                "indexes": [
+                    models.Index(fields=["date"], name="routedailyload_date_idx")
+                ],
+                "unique_together": {("route", "date")},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0010_archivedtrip_archivedticket"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedticket",
+            name="price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=8, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=8, null=True
+            ),
+        ),
+        migrations.CreateModel(
+            name="Fare",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("distance_from", models.PositiveIntegerField()),
+                ("price", models.DecimalField(decimal_places=2, max_digits=8)),
+                (
+                    "train_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fares",
+                        to="railway.traintype",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("train_type", "distance_from"),
+                "unique_together": {("train_type", "distance_from")},
+            },
+        ),
+    ]
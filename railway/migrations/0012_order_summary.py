@@ -0,0 +1,77 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:13
+
+from collections import defaultdict
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def build_order_summaries(apps, schema_editor):
+    Order = apps.get_model("railway", "Order")
+    ticket_models = (
+        apps.get_model("railway", "Ticket"),
+        apps.get_model("railway", "ArchivedTicket"),
+    )
+    order_ids = list(Order.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(order_ids), BATCH_SIZE):
+        batch = order_ids[start : start + BATCH_SIZE]
+        summaries = defaultdict(list)
+        for ticket_model in ticket_models:
+            for ticket in ticket_model.objects.filter(order_id__in=batch).values(
+                "order_id",
+                "id",
+                "cargo",
+                "seat",
+                "price",
+                "trip_id",
+                "trip__route__source__name",
+                "trip__route__destination__name",
+                "trip__train__name",
+                "trip__departure_time",
+                "trip__arrival_time",
+            ):
+                summaries[ticket["order_id"]].append(
+                    {
+                        "id": ticket["id"],
+                        "cargo": ticket["cargo"],
+                        "seat": ticket["seat"],
+                        "price": ticket["price"],
+                        "trip": ticket["trip_id"],
+                        "departure_station": ticket["trip__route__source__name"],
+                        "arrival_station": ticket["trip__route__destination__name"],
+                        "train_name": ticket["trip__train__name"],
+                        "departure_time": ticket["trip__departure_time"],
+                        "arrival_time": ticket["trip__arrival_time"],
+                    }
+                )
+        for summary in summaries.values():
+            summary.sort(key=lambda item: (item["trip"], item["cargo"], item["seat"]))
+        Order.objects.bulk_update(
+            [
+                Order(id=order_id, summary=summary)
+                for order_id, summary in summaries.items()
+            ],
+            ["summary"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0011_fare_ticket_price"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="summary",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                encoder=django.core.serializers.json.DjangoJSONEncoder,
+            ),
+        ),
+        migrations.RunPython(build_order_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0012_order_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TripForecast",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tickets_sold", models.IntegerField()),
+                ("projected_load_factor", models.FloatField()),
+                ("projected_sellout_at", models.DateTimeField(blank=True, null=True)),
+                ("history_trips", models.IntegerField()),
+                ("computed_at", models.DateTimeField()),
+                (
+                    "trip",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="forecast",
+                        to="railway.trip",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("trip",),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0013_tripforecast"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="cancelled_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
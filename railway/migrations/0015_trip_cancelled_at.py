@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0014_order_cancelled_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedtrip",
+            name="cancelled_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="cancelled_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
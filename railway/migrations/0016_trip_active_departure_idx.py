@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("railway", "0015_trip_cancelled_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(
+                condition=models.Q(("cancelled_at__isnull", True)),
+                fields=["departure_time"],
+                name="trip_active_departure_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,177 @@
+import hashlib
+from datetime import datetime
+from typing import Callable
+
+from django.utils.http import (
+    http_date,
+    parse_etags,
+    parse_http_date_safe,
+    quote_etag,
+)
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from Railway_Service_API.db_routers import (
+    is_pinned_to_primary,
+    pin_to_primary,
+    read_from_replica,
+)
+from railway.models import ResourceVersion
+from railway.serializers import get_query_param_set
+
+
+class ConditionalGetMixin:
+    """Answer list and retrieve requests with ETag and Last-Modified.
+
+    The validators are derived from the ResourceVersion counters of
+    ``version_models``, so a matching conditional request is answered
+    with 304 after a single counter lookup, before the resource is
+    queried or serialized.
+    """
+
+    version_models = ()
+
+    def get_version_keys(self) -> list[str]:
+        return [
+            ResourceVersion.get_key(model) for model in self.version_models
+        ]
+
+    def get_unversioned_state(self) -> tuple[str, datetime | None]:
+        """Return state that changes without a write, e.g. by expiring.
+
+        The second item tells when that state last changed, and dates
+        Last-Modified like the updates of the versions do.
+        """
+        return "", None
+
+    def get_validators(self, request: Request) -> tuple[str, datetime | None]:
+        digest = hashlib.sha256()
+        last_modified = None
+        for key, version, updated_at in (
+            ResourceVersion.objects
+            .filter(key__in=self.get_version_keys())
+            .order_by("key")
+            .values_list("key", "version", "updated_at")
+        ):
+            digest.update(f"{key}={version};".encode())
+            if last_modified is None or updated_at > last_modified:
+                last_modified = updated_at
+        state, changed_at = self.get_unversioned_state()
+        if changed_at and (
+            last_modified is None or changed_at > last_modified
+        ):
+            last_modified = changed_at
+        digest.update(state.encode())
+        digest.update(request.get_full_path().encode())
+        digest.update(request.accepted_media_type.encode())
+        return quote_etag(digest.hexdigest()), last_modified
+
+    @staticmethod
+    def is_not_modified(
+            request: Request, etag: str, last_modified: datetime | None
+    ) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            # GET compares weakly, so W/ tags of proxies match too
+            tags = {
+                tag.removeprefix("W/") for tag in parse_etags(if_none_match)
+            }
+            return etag in tags or "*" in tags
+        if_modified_since = parse_http_date_safe(
+            request.headers.get("If-Modified-Since")
+        )
+        return bool(
+            if_modified_since
+            and last_modified
+            and int(last_modified.timestamp()) <= if_modified_since
+        )
+
+    def conditional_response(
+            self,
+            handler: Callable[..., Response],
+            request: Request,
+            *args,
+            **kwargs
+    ) -> Response:
+        etag, last_modified = self.get_validators(request)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if last_modified:
+            headers["Last-Modified"] = http_date(last_modified.timestamp())
+        if self.is_not_modified(request, etag, last_modified):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers=headers
+            )
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class SparseFieldsMixin:
+    """Let ``get_queryset`` skip the joins of fields left out of a response.
+
+    Mirrors the ``?fields=`` and ``?expand=`` handling of
+    DynamicFieldsModelSerializer.
+    """
+
+    def is_field_requested(self, name: str) -> bool:
+        fields = get_query_param_set(self.request, "fields")
+        return fields is None or name in fields
+
+    def is_field_expanded(self, name: str) -> bool:
+        expand = get_query_param_set(self.request, "expand")
+        return self.is_field_requested(name) and (
+            expand is None or name in expand
+        )
+
+
+class ReplicaReadMixin:
+    """Serve ``replica_actions`` from read replicas.
+
+    Read-only actions using POST for their payload may be listed too.
+
+    Users who have just written through the API are pinned to the
+    primary for a short while, so they always read their own writes.
+    """
+
+    replica_actions = ("list", "retrieve")
+
+    def dispatch(self, request, *args, **kwargs):
+        token = read_from_replica.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            read_from_replica.reset(token)
+
+    def initial(self, request: Request, *args, **kwargs) -> None:
+        super().initial(request, *args, **kwargs)
+        if (
+            self.action in self.replica_actions
+            and not is_pinned_to_primary(request)
+        ):
+            read_from_replica.set(True)
+
+    def finalize_response(
+            self, request: Request, response: Response, *args, **kwargs
+    ) -> Response:
+        if (
+            request.method not in SAFE_METHODS
+            and self.action not in self.replica_actions
+            and response.status_code < status.HTTP_400_BAD_REQUEST
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(response, request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
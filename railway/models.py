@@ -1,7 +1,34 @@
+import hashlib
+import json
+from collections import Counter
+from datetime import datetime
+
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
 
 from Railway_Service_API import settings
+from Railway_Service_API.tracing import start_span
+
+
+def delete_rows(queryset: models.QuerySet) -> int:
+    """Delete the rows of ``queryset`` in one statement.
+
+    Unlike ``QuerySet.delete()`` the rows aren't loaded, and neither
+    signals nor cascades run, so callers handle both themselves.
+    Returns the number of deleted rows.
+    """
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    pk_column = connection.ops.quote_name(queryset.model._meta.pk.column)
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {pk_column} IN ({sql})", params
+        )
+        return cursor.rowcount
 
 
 class TrainType(models.Model):
@@ -33,6 +60,31 @@ class Train(models.Model):
         ordering = ("name",)
 
 
+class Fare(models.Model):
+    """Price of a ticket on trips at least ``distance_from`` long.
+
+    The fares of a train type form distance bands: a trip costs the price
+    of the band with the greatest ``distance_from`` not above its route
+    distance.
+    """
+
+    train_type = models.ForeignKey(
+        TrainType, on_delete=models.CASCADE, related_name="fares"
+    )
+    distance_from = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=8, decimal_places=2)
+
+    def __str__(self) -> str:
+        return (
+            f"Train type: {self.train_type_id}. "
+            f"From {self.distance_from} km: {self.price}."
+        )
+
+    class Meta:
+        unique_together = ("train_type", "distance_from")
+        ordering = ("train_type", "distance_from")
+
+
 class Crew(models.Model):
     name = models.CharField(max_length=255, unique=True)
 
@@ -72,6 +124,58 @@ class Route(models.Model):
         return f"{self.source.name} -> {self.destination.name}"
 
 
+class TripQuerySet(models.QuerySet):
+    def active(self) -> "TripQuerySet":
+        """Exclude cancelled trips"""
+        return self.filter(cancelled_at__isnull=True)
+
+    def with_tickets_available(self) -> "TripQuerySet":
+        sold_tickets = (
+            Ticket.objects
+            .filter(trip=OuterRef("pk"))
+            .order_by()
+            .values("trip")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        held_seats = (
+            SeatHold.objects
+            .filter(trip=OuterRef("pk"), expires_at__gt=Now())
+            .order_by()
+            .values("trip")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return self.annotate(
+            tickets_available=F("train__cargo_num")
+            * F("train__places_in_cargo")
+            - Coalesce(Subquery(sold_tickets), 0)
+            - Coalesce(Subquery(held_seats), 0)
+        )
+
+    def get_taken_seats_by_cargo(self) -> Counter:
+        """Count sold and actively held seats per (trip id, cargo)"""
+        trips = self.values("id")
+        sold_seats = (
+            Ticket.objects
+            .filter(trip__in=trips)
+            .order_by()
+            .values_list("trip_id", "cargo")
+            .annotate(seats=Count("id"))
+        )
+        held_seats = (
+            SeatHold.objects
+            .filter(trip__in=trips, expires_at__gt=Now())
+            .order_by()
+            .values_list("trip_id", "cargo")
+            .annotate(seats=Count("id"))
+        )
+        taken_seats = Counter()
+        for trip_id, cargo, seats in sold_seats.union(held_seats, all=True):
+            taken_seats[trip_id, cargo] += seats
+        return taken_seats
+
+
 class Trip(models.Model):
     departure_time = models.DateTimeField()
     arrival_time = models.DateTimeField()
@@ -82,6 +186,9 @@ class Trip(models.Model):
         Train, on_delete=models.CASCADE, related_name="trips"
     )
     crews = models.ManyToManyField(Crew, related_name="trips", blank=True)
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+
+    objects = TripQuerySet.as_manager()
 
     def __str__(self) -> str:
         return (
@@ -91,6 +198,119 @@ class Trip(models.Model):
             f"Time: {self.departure_time} -> {self.arrival_time}."
         )
 
+    @staticmethod
+    def validate_crews(
+            crews: list[Crew],
+            departure_time: datetime,
+            arrival_time: datetime,
+            error_to_raise,
+            exclude_pk: int | None = None,
+    ) -> None:
+        if departure_time >= arrival_time:
+            raise error_to_raise(
+                {
+                    "arrival_time": "arrival_time must be "
+                    "later than departure_time"
+                }
+            )
+        if not crews:
+            return
+        busy_crews = (
+            Trip.crews.through.objects
+            .filter(
+                crew__in=crews,
+                trip__departure_time__lt=arrival_time,
+                trip__arrival_time__gt=departure_time,
+                trip__cancelled_at__isnull=True,
+            )
+            .exclude(trip_id=exclude_pk)
+            .order_by("crew__name", "trip_id")
+            .values_list("crew__name", "trip_id")
+        )
+        messages = [
+            f"Crew {crew_name} is already assigned "
+            f"to overlapping trip {trip_id}"
+            for crew_name, trip_id in busy_crews
+        ]
+        if messages:
+            raise error_to_raise({"crews": messages})
+
+    @staticmethod
+    def validate_train(
+            train: Train,
+            route: Route,
+            departure_time: datetime,
+            arrival_time: datetime,
+            error_to_raise,
+            exclude_pk: int | None = None,
+    ) -> None:
+        trips = (
+            Trip.objects
+            .active()
+            .filter(train=train)
+            .exclude(pk=exclude_pk)
+            .values(
+                "id",
+                "departure_time",
+                "arrival_time",
+                "route__source_id",
+                "route__destination_id",
+            )
+        )
+        previous_trip = (
+            trips.filter(departure_time__lt=departure_time)
+            .order_by("-departure_time")
+            .first()
+        )
+        next_trip = (
+            trips.filter(departure_time__gte=departure_time)
+            .order_by("departure_time")
+            .first()
+        )
+        messages = []
+        if previous_trip:
+            if previous_trip["arrival_time"] > departure_time:
+                messages.append(
+                    f"Train {train.name} is still on trip "
+                    f"{previous_trip['id']} at departure time"
+                )
+            elif previous_trip["route__destination_id"] != route.source_id:
+                messages.append(
+                    f"Train {train.name} arrives at another station "
+                    f"after previous trip {previous_trip['id']}"
+                )
+        if next_trip:
+            if next_trip["departure_time"] < arrival_time:
+                messages.append(
+                    f"Train {train.name} is already assigned "
+                    f"to overlapping trip {next_trip['id']}"
+                )
+            elif next_trip["route__source_id"] != route.destination_id:
+                messages.append(
+                    f"Next trip {next_trip['id']} of train {train.name} "
+                    f"leaves from another station"
+                )
+        if messages:
+            raise error_to_raise({"train": messages})
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=("departure_time", "arrival_time"),
+                name="trip_departure_arrival_idx",
+            ),
+            models.Index(
+                fields=("train", "departure_time"),
+                name="trip_train_departure_idx",
+            ),
+            # Serves filters on active trips only, such as the trip list
+            models.Index(
+                fields=("departure_time",),
+                condition=Q(cancelled_at__isnull=True),
+                name="trip_active_departure_idx",
+            ),
+        ]
+
 
 class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -99,14 +319,51 @@ class Order(models.Model):
         on_delete=models.CASCADE,
         related_name="orders"
     )
+    # Tickets with their trip details as booked, never updated afterwards
+    summary = models.JSONField(
+        encoder=DjangoJSONEncoder, default=list, blank=True
+    )
+    cancelled_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self) -> str:
         return f"Owner: {self.user.username}. Created at: {self.created_at}."
 
+    @property
+    def all_tickets(self) -> list:
+        """Return the tickets of the order, including archived ones"""
+        return [*self.tickets.all(), *self.archived_tickets.all()]
+
     class Meta:
         ordering = ("-created_at",)
 
 
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys"
+    )
+    # SHA-256 of the request body, a key can't be reused for another one
+    request_hash = models.CharField(max_length=64, default="")
+    # Empty only until the transaction creating the order commits
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return f"Key: {self.key}. Owner: {self.user_id}."
+
+    @staticmethod
+    def get_request_hash(data) -> str:
+        return hashlib.sha256(
+            json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+        ).hexdigest()
+
+    class Meta:
+        unique_together = ("user", "key")
+
+
 class Ticket(models.Model):
     cargo = models.IntegerField()
     seat = models.IntegerField()
@@ -116,6 +373,9 @@ class Ticket(models.Model):
     order = models.ForeignKey(
         Order, on_delete=models.CASCADE, related_name="tickets"
     )
+    price = models.DecimalField(
+        max_digits=8, decimal_places=2, null=True, blank=True
+    )
 
     def __str__(self) -> str:
         return (
@@ -152,9 +412,254 @@ class Ticket(models.Model):
         )
 
     def save(self, *args, **kwargs) -> None:
-        self.full_clean()
+        with start_span("model.full_clean", model="Ticket"):
+            self.full_clean()
         super().save(*args, **kwargs)
 
+    @classmethod
+    def insert_free_seats(cls, tickets: list["Ticket"]) -> dict[tuple, int]:
+        """Insert tickets in one statement, skipping already taken seats.
+
+        Returns ids of the inserted tickets by (trip id, cargo, seat).
+        Model validation and signals are bypassed.
+        """
+        columns = ("cargo", "seat", "trip_id", "order_id", "price")
+        seat_columns = ("trip_id", "cargo", "seat")
+        quote_name = connection.ops.quote_name
+        placeholders = ", ".join(
+            ["(%s)" % ", ".join(["%s"] * len(columns))] * len(tickets)
+        )
+        sql = (
+            f"INSERT INTO {quote_name(cls._meta.db_table)} "
+            f"({', '.join(map(quote_name, columns))}) "
+            f"VALUES {placeholders} "
+            f"ON CONFLICT ({', '.join(map(quote_name, seat_columns))}) "
+            f"DO NOTHING "
+            f"RETURNING {', '.join(map(quote_name, seat_columns))}, "
+            f"{quote_name('id')}"
+        )
+        params = [
+            getattr(ticket, column) for ticket in tickets for column in columns
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {
+                (trip_id, cargo, seat): ticket_id
+                for trip_id, cargo, seat, ticket_id in cursor.fetchall()
+            }
+
+    class Meta:
+        unique_together = ("cargo", "seat", "trip")
+        ordering = ("cargo", "seat")
+
+
+class ArchivedTrip(models.Model):
+    """Trip moved out of the hot tables by ``manage.py archive_trips``.
+
+    Keeps the id of the archived trip, so tickets and order history can
+    refer to it the same way as before.
+    """
+
+    # Named like the implicit primary key it replaces
+    id = models.BigIntegerField(primary_key=True)  # noqa: VNE003
+    departure_time = models.DateTimeField()
+    arrival_time = models.DateTimeField()
+    route = models.ForeignKey(
+        Route, on_delete=models.CASCADE, related_name="archived_trips"
+    )
+    train = models.ForeignKey(
+        Train, on_delete=models.CASCADE, related_name="archived_trips"
+    )
+    crews = models.ManyToManyField(
+        Crew, related_name="archived_trips", blank=True
+    )
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return (
+            f"Archived trip {self.id}. "
+            f"Time: {self.departure_time} -> {self.arrival_time}."
+        )
+
+
+class ArchivedTicket(models.Model):
+    # Named like the implicit primary key it replaces
+    id = models.BigIntegerField(primary_key=True)  # noqa: VNE003
+    cargo = models.IntegerField()
+    seat = models.IntegerField()
+    trip = models.ForeignKey(
+        ArchivedTrip, on_delete=models.CASCADE, related_name="tickets"
+    )
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="archived_tickets"
+    )
+    price = models.DecimalField(
+        max_digits=8, decimal_places=2, null=True, blank=True
+    )
+
+    def __str__(self) -> str:
+        return (
+            f"Cargo: {self.cargo}. "
+            f"Seat: {self.seat}. "
+            f"Archived trip: {self.trip_id}."
+        )
+
+    class Meta:
+        ordering = ("cargo", "seat")
+
+
+class SeatHold(models.Model):
+    cargo = models.IntegerField()
+    seat = models.IntegerField()
+    trip = models.ForeignKey(
+        Trip, on_delete=models.CASCADE, related_name="holds"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="seat_holds"
+    )
+    expires_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return (
+            f"Cargo: {self.cargo}. "
+            f"Seat: {self.seat}. "
+            f"Expires at: {self.expires_at}."
+        )
+
     class Meta:
         unique_together = ("cargo", "seat", "trip")
         ordering = ("cargo", "seat")
+        indexes = [
+            models.Index(
+                fields=("trip", "expires_at"),
+                name="seathold_trip_expires_idx",
+            ),
+            models.Index(
+                fields=("expires_at",),
+                name="seathold_expires_idx",
+            ),
+        ]
+
+
+class RouteDailyLoad(models.Model):
+    route = models.ForeignKey(
+        Route, on_delete=models.CASCADE, related_name="daily_loads"
+    )
+    date = models.DateField()
+    trips_count = models.IntegerField(default=0)
+    seats_offered = models.IntegerField(default=0)
+    tickets_sold = models.IntegerField(default=0)
+
+    @property
+    def load_factor(self) -> float | None:
+        if not self.seats_offered:
+            return None
+        return round(self.tickets_sold / self.seats_offered, 4)
+
+    def __str__(self) -> str:
+        return f"Route: {self.route_id}. Date: {self.date}."
+
+    @classmethod
+    def apply_changes(cls, changes: dict[tuple, list[int]]) -> None:
+        """Add [trips, seats, tickets] deltas to rows keyed by route and day"""
+        for (route_id, day), (trips, seats, tickets) in changes.items():
+            if not (trips or seats or tickets):
+                continue
+            rows = cls.objects.filter(route_id=route_id, date=day)
+            if rows.update(
+                trips_count=F("trips_count") + trips,
+                seats_offered=F("seats_offered") + seats,
+                tickets_sold=F("tickets_sold") + tickets,
+            ) or min(trips, seats, tickets) < 0:
+                # Nothing to subtract from: the row was never built
+                # or is being deleted together with its route
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        route_id=route_id,
+                        date=day,
+                        trips_count=trips,
+                        seats_offered=seats,
+                        tickets_sold=tickets,
+                    )
+            except IntegrityError:
+                rows.update(
+                    trips_count=F("trips_count") + trips,
+                    seats_offered=F("seats_offered") + seats,
+                    tickets_sold=F("tickets_sold") + tickets,
+                )
+
+    class Meta:
+        unique_together = ("route", "date")
+        ordering = ("date", "route")
+        indexes = [
+            models.Index(fields=("date",), name="routedailyload_date_idx"),
+        ]
+
+
+class TripForecast(models.Model):
+    """Sell-out projection of an upcoming trip.
+
+    Written by ``manage.py forecast_sellouts`` from the booking curves
+    of past trips of the same route and weekday.
+    """
+
+    trip = models.OneToOneField(
+        Trip, on_delete=models.CASCADE, related_name="forecast"
+    )
+    tickets_sold = models.IntegerField()
+    projected_load_factor = models.FloatField()
+    projected_sellout_at = models.DateTimeField(null=True, blank=True)
+    history_trips = models.IntegerField()
+    computed_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return (
+            f"Trip: {self.trip_id}. "
+            f"Sell-out: {self.projected_sellout_at}."
+        )
+
+    class Meta:
+        ordering = ("trip",)
+
+
+class ResourceVersion(models.Model):
+    key = models.CharField(max_length=255, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.key}: {self.version}"
+
+    @staticmethod
+    def get_key(model: type[models.Model], pk: int | None = None) -> str:
+        key = model._meta.label_lower
+        return key if pk is None else f"{key}:{pk}"
+
+    @classmethod
+    def bump(cls, keys: list[str]) -> None:
+        """Increment the counters of the keys once the transaction commits.
+
+        Bumping after the commit never lets a reader cache old data under
+        a new version, and keeps the hot counter rows locked only for the
+        duration of a single UPDATE.
+        """
+        keys = sorted(set(keys))
+        transaction.on_commit(lambda: cls._increment(keys))
+
+    @classmethod
+    def _increment(cls, keys: list[str]) -> None:
+        now = timezone.now()
+        for key in keys:
+            rows = cls.objects.filter(key=key)
+            if rows.update(version=F("version") + 1, updated_at=now):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(key=key, version=1)
+            except IntegrityError:
+                rows.update(version=F("version") + 1, updated_at=now)
@@ -1,6 +1,38 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
 from rest_framework.pagination import PageNumberPagination
 
+from Railway_Service_API import settings
+
 
 class OrderPagination(PageNumberPagination):
     page_size = 10
     max_page_size = 100
+
+
+class EstimatedCountPaginator(Paginator):
+    """Admin paginator that doesn't COUNT unfiltered large tables.
+
+    Postgres' planner estimate of the table size is used instead once it
+    exceeds ESTIMATED_COUNT_THRESHOLD rows.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if (
+            isinstance(queryset, QuerySet)
+            and not queryset.query.where
+            and connections[queryset.db].vendor == "postgresql"
+        ):
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= settings.ESTIMATED_COUNT_THRESHOLD:
+                return int(row[0])
+        return super().count
@@ -0,0 +1,267 @@
+import heapq
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Case, Count, DurationField, F, Value, When
+
+from Railway_Service_API import settings
+from railway.models import ResourceVersion, Route, RouteDailyLoad, Trip
+from railway.signals import get_load_key, new_load_changes
+
+
+def find_crew_conflicts(start: datetime, end: datetime) -> list[dict]:
+    """Return every pair of overlapping trips sharing a crew in a period.
+
+    Assignments are streamed from the database ordered by crew and
+    departure time, so each crew is checked with a single sweep that
+    keeps only the trips still running in a heap keyed by arrival time.
+    """
+    assignments = (
+        Trip.crews.through.objects
+        .filter(
+            trip__departure_time__lt=end,
+            trip__arrival_time__gt=start,
+            trip__cancelled_at__isnull=True,
+        )
+        .order_by("crew_id", "trip__departure_time", "trip_id")
+        .values_list(
+            "crew_id",
+            "crew__name",
+            "trip_id",
+            "trip__departure_time",
+            "trip__arrival_time",
+        )
+    )
+    conflicts = []
+    for (crew_id, crew_name), rows in groupby(
+        assignments.iterator(chunk_size=5000), key=itemgetter(0, 1)
+    ):
+        running = []
+        for _, _, trip_id, departure_time, arrival_time in rows:
+            while running and running[0][0] <= departure_time:
+                heapq.heappop(running)
+            for other_arrival_time, other_trip_id in running:
+                conflicts.append(
+                    {
+                        "crew": crew_id,
+                        "crew_name": crew_name,
+                        "trip": other_trip_id,
+                        "conflicting_trip": trip_id,
+                        "overlap_start": departure_time,
+                        "overlap_end": min(
+                            arrival_time, other_arrival_time
+                        ),
+                    }
+                )
+            heapq.heappush(running, (arrival_time, trip_id))
+    return conflicts
+
+
+def get_train_rotations(start: datetime, end: datetime) -> list[dict]:
+    """Return every train's trips in a period as an ordered chain.
+
+    A trip is marked as not ``connected`` when it leaves from a station
+    other than the one where the previous trip of the train ended.
+    """
+    trips = (
+        Trip.objects
+        .active()
+        .filter(departure_time__lt=end, arrival_time__gt=start)
+        .select_related("train", "route__source", "route__destination")
+        .order_by("train__name", "departure_time", "id")
+    )
+    rotations = []
+    for train, train_trips in groupby(trips, key=lambda trip: trip.train):
+        chain = []
+        previous_destination_id = None
+        for trip in train_trips:
+            chain.append(
+                {
+                    "id": trip.id,
+                    "departure_station": trip.route.source.name,
+                    "arrival_station": trip.route.destination.name,
+                    "departure_time": trip.departure_time,
+                    "arrival_time": trip.arrival_time,
+                    "connected": previous_destination_id in (
+                        None, trip.route.source_id
+                    ),
+                }
+            )
+            previous_destination_id = trip.route.destination_id
+        rotations.append(
+            {"train": train.id, "train_name": train.name, "trips": chain}
+        )
+    return rotations
+
+
+def find_train_conflicts(
+        train_id: int, start: datetime, end: datetime
+) -> list[dict]:
+    """Return consecutive trips of a train with too short a turnaround"""
+    trips = (
+        Trip.objects
+        .active()
+        .filter(
+            train_id=train_id,
+            departure_time__lt=end,
+            arrival_time__gt=start,
+        )
+        .order_by("departure_time", "id")
+        .values_list("id", "departure_time", "arrival_time")
+    )
+    conflicts = []
+    previous = None
+    for trip_id, departure_time, arrival_time in trips:
+        if previous is not None:
+            previous_id, previous_arrival_time = previous
+            turnaround = departure_time - previous_arrival_time
+            if turnaround < settings.TRAIN_TURNAROUND_BUFFER:
+                conflicts.append(
+                    {
+                        "trip": previous_id,
+                        "conflicting_trip": trip_id,
+                        "turnaround": turnaround,
+                    }
+                )
+        if previous is None or arrival_time > previous[1]:
+            previous = trip_id, arrival_time
+    return conflicts
+
+
+def get_delay_shifts(trip: Trip, delay: timedelta) -> dict[int, dict]:
+    """Return the new times of the trips moved by a delay, keyed by id.
+
+    The delayed trip moves by the whole delay. Each later trip of the
+    train moves by the shift of the one before less the slack of its
+    turnaround over TRAIN_TURNAROUND_BUFFER, so slack in the rotation
+    absorbs the delay, and the first trip left in place ends the chain.
+    A turnaround already shorter than the buffer passes the shift on
+    unchanged rather than being stretched to the buffer. Rows are
+    locked as they are read.
+    """
+    shifts = {}
+    arrival_time = None
+    for trip_id, route_id, departure_time, trip_arrival_time in (
+        Trip.objects
+        .active()
+        .select_for_update()
+        .filter(
+            train_id=trip.train_id, departure_time__gte=trip.departure_time
+        )
+        .order_by("departure_time", "id")
+        .values_list("id", "route_id", "departure_time", "arrival_time")
+        .iterator(chunk_size=100)
+    ):
+        if arrival_time is None:
+            if trip_id != trip.id:
+                continue
+            shift = delay
+        else:
+            slack = max(
+                departure_time - arrival_time
+                - settings.TRAIN_TURNAROUND_BUFFER,
+                timedelta(),
+            )
+            shift = max(shift - slack, timedelta())
+            if not shift:
+                break
+        arrival_time = trip_arrival_time
+        shifts[trip_id] = {
+            "id": trip_id,
+            "route": route_id,
+            "departure_time": departure_time + shift,
+            "arrival_time": trip_arrival_time + shift,
+            "shift": shift,
+        }
+    return shifts
+
+
+def move_route_loads(shifts: dict[int, dict]) -> None:
+    """Move trips, seats and tickets of shifted trips to their new day"""
+    changes = new_load_changes()
+    for trip_id, cargo_num, places_in_cargo, tickets_sold in (
+        Trip.objects
+        .filter(id__in=shifts)
+        .annotate(tickets_sold=Count("tickets"))
+        .values_list(
+            "id",
+            "train__cargo_num",
+            "train__places_in_cargo",
+            "tickets_sold",
+        )
+    ):
+        trip = shifts[trip_id]
+        key = get_load_key(trip["route"], trip["departure_time"])
+        previous_key = get_load_key(
+            trip["route"], trip["departure_time"] - trip["shift"]
+        )
+        if key == previous_key:
+            continue
+        for load_key, sign in ((previous_key, -1), (key, 1)):
+            changes[load_key][0] += sign
+            changes[load_key][1] += sign * cargo_num * places_in_cargo
+            changes[load_key][2] += sign * tickets_sold
+    RouteDailyLoad.apply_changes(changes)
+
+
+def involves_any(conflicts: list[dict], trip_ids: dict) -> list[dict]:
+    return [
+        conflict
+        for conflict in conflicts
+        if conflict["trip"] in trip_ids
+        or conflict["conflicting_trip"] in trip_ids
+    ]
+
+
+@transaction.atomic
+def propagate_delay(trip: Trip, delay: timedelta, error_to_raise) -> dict:
+    """Delay a trip and the downstream trips of its train in one UPDATE.
+
+    Route loads move with trips changing their departure day, and the
+    versions written by trip signals are bumped, as the UPDATE bypasses
+    them. Returns the moved trips, and crew and train conflicts
+    involving them.
+    """
+    # Locked first, so the chain starts from its current times
+    trip = Trip.objects.select_for_update().filter(pk=trip.pk).first()
+    if trip is None:
+        raise error_to_raise({"trip": "The trip no longer exists"})
+    if trip.cancelled_at is not None:
+        raise error_to_raise({"trip": "Cancelled trips can't be delayed"})
+    shifts = get_delay_shifts(trip, delay)
+    shift = Case(
+        *[
+            When(id=trip_id, then=Value(moved_trip["shift"]))
+            for trip_id, moved_trip in shifts.items()
+        ],
+        output_field=DurationField(),
+    )
+    Trip.objects.filter(id__in=shifts).update(
+        departure_time=F("departure_time") + shift,
+        arrival_time=F("arrival_time") + shift,
+    )
+    move_route_loads(shifts)
+    moved_trips = list(shifts.values())
+    ResourceVersion.bump(
+        [ResourceVersion.get_key(Trip)]
+        + [ResourceVersion.get_key(Trip, trip_id) for trip_id in shifts]
+        + [
+            ResourceVersion.get_key(Route, moved_trip["route"])
+            for moved_trip in moved_trips
+        ]
+    )
+    start = moved_trips[0]["departure_time"]
+    end = moved_trips[-1]["arrival_time"]
+    buffer = settings.TRAIN_TURNAROUND_BUFFER
+    return {
+        "trips": moved_trips,
+        "crew_conflicts": involves_any(
+            find_crew_conflicts(start, end), shifts
+        ),
+        "train_conflicts": involves_any(
+            find_train_conflicts(trip.train_id, start - buffer, end + buffer),
+            shifts,
+        ),
+    }
@@ -1,8 +1,18 @@
-from django.db import transaction
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.exceptions import ValidationError
-from rest_framework.relations import SlugRelatedField
+from rest_framework.relations import PrimaryKeyRelatedField, SlugRelatedField
 
+from Railway_Service_API import settings
+from Railway_Service_API.tracing import TracedValidationMixin
+from railway.fares import fare_table
+from railway.signals import tickets_created
 from railway.models import (
     TrainType,
     Train,
@@ -11,17 +21,105 @@ from railway.models import (
     Trip,
     Crew,
     Order,
-    Ticket
+    Ticket,
+    SeatHold,
+    RouteDailyLoad,
+    TripForecast,
+    ResourceVersion,
+    delete_rows,
 )
 
 
-class TrainTypeSerializer(serializers.ModelSerializer):
+def seats_filter(seats: list[dict]) -> Q:
+    query = Q()
+    for seat in seats:
+        query |= Q(trip=seat["trip"], cargo=seat["cargo"], seat=seat["seat"])
+    return query
+
+
+def get_query_param_set(request, name: str) -> set[str] | None:
+    """Parse a comma-separated query parameter like ``?fields=id,name``"""
+    if request is None or name not in request.query_params:
+        return None
+    return {
+        value.strip()
+        for value in request.query_params[name].split(",")
+        if value.strip()
+    }
+
+
+class DynamicFieldsModelSerializer(
+    TracedValidationMixin,
+    serializers.ModelSerializer
+):
+    """Support ``?fields=`` and ``?expand=`` on safe requests.
+
+    ``fields`` limits the top-level fields of the response. ``expand``
+    lists the nested fields to render in full: nested fields declared in
+    ``collapsed_fields`` that are not listed are rendered by the field
+    returned from the mapped factory instead. Without ``expand`` every
+    nested field keeps its default representation.
+    """
+
+    collapsed_fields = {}
+
+    def is_root(self) -> bool:
+        return self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer)
+            and self.parent.parent is None
+        )
+
+    def get_fields(self) -> dict:
+        fields = super().get_fields()
+        request = self.context.get("request", None)
+        if (
+            request is None
+            or request.method not in SAFE_METHODS
+            or not self.is_root()
+        ):
+            return fields
+        expand = get_query_param_set(request, "expand")
+        if expand is not None:
+            for name, collapsed_field in self.collapsed_fields.items():
+                if name in fields and name not in expand:
+                    fields[name] = collapsed_field()
+        requested_fields = get_query_param_set(request, "fields")
+        if requested_fields is not None:
+            fields = {
+                name: field
+                for name, field in fields.items()
+                if name in requested_fields
+            }
+        return fields
+
+
+class TripFareField(serializers.DecimalField):
+    """Read-only ticket price of a trip from the in-memory fare table"""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(
+            max_digits=8,
+            decimal_places=2,
+            read_only=True,
+            allow_null=True,
+            source="*",
+            **kwargs
+        )
+
+    def to_representation(self, trip: Trip) -> str | None:
+        price = fare_table.get_price(
+            trip.train.train_type_id, trip.route.distance
+        )
+        return None if price is None else super().to_representation(price)
+
+
+class TrainTypeSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = TrainType
         fields = ("id", "name",)
 
 
-class TrainSerializer(serializers.ModelSerializer):
+class TrainSerializer(DynamicFieldsModelSerializer):
     train_type = SlugRelatedField(
         many=False,
         read_only=False,
@@ -41,13 +139,13 @@ class TrainSerializer(serializers.ModelSerializer):
         )
 
 
-class StationSerializer(serializers.ModelSerializer):
+class StationSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Station
         fields = ("id", "name", "latitude", "longitude", "square",)
 
 
-class RouteListSerializer(serializers.ModelSerializer):
+class RouteListSerializer(DynamicFieldsModelSerializer):
     source = SlugRelatedField(
         many=False,
         read_only=False,
@@ -70,14 +168,21 @@ class RouteDetailSerializer(RouteListSerializer):
     source = StationSerializer(many=False, read_only=True)
     destination = StationSerializer(many=False, read_only=True)
 
+    collapsed_fields = {
+        "source": lambda: SlugRelatedField(read_only=True, slug_field="name"),
+        "destination": lambda: SlugRelatedField(
+            read_only=True, slug_field="name"
+        ),
+    }
+
 
-class CrewSerializer(serializers.ModelSerializer):
+class CrewSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Crew
         fields = ("id", "name",)
 
 
-class TripSerializer(serializers.ModelSerializer):
+class TripSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Trip
         fields = (
@@ -86,11 +191,40 @@ class TripSerializer(serializers.ModelSerializer):
             "arrival_time",
             "route",
             "train",
-            "crews"
+            "crews",
+            "cancelled_at",
         )
+        read_only_fields = ("cancelled_at",)
+
+    def validate(self, attrs: dict) -> dict:
+        trip = self.instance
+        if trip is not None:
+            attrs.setdefault("departure_time", trip.departure_time)
+            attrs.setdefault("arrival_time", trip.arrival_time)
+            crews = attrs.get("crews", None)
+            if crews is None:
+                crews = list(trip.crews.all())
+        else:
+            crews = attrs.get("crews", [])
+        Trip.validate_crews(
+            crews,
+            attrs["departure_time"],
+            attrs["arrival_time"],
+            ValidationError,
+            exclude_pk=getattr(trip, "pk", None),
+        )
+        Trip.validate_train(
+            attrs.get("train", getattr(trip, "train", None)),
+            attrs.get("route", getattr(trip, "route", None)),
+            attrs["departure_time"],
+            attrs["arrival_time"],
+            ValidationError,
+            exclude_pk=getattr(trip, "pk", None),
+        )
+        return attrs
 
 
-class TripListSerializer(serializers.ModelSerializer):
+class TripListSerializer(DynamicFieldsModelSerializer):
     departure_station = serializers.CharField(
         source="route.source.name", read_only=True
     )
@@ -102,6 +236,7 @@ class TripListSerializer(serializers.ModelSerializer):
         source="train.capacity", read_only=True
     )
     tickets_available = serializers.IntegerField(read_only=True)
+    fare = TripFareField()
 
     class Meta:
         model = Trip
@@ -112,6 +247,7 @@ class TripListSerializer(serializers.ModelSerializer):
             "train_name",
             "train_capacity",
             "tickets_available",
+            "fare",
             "departure_time",
             "arrival_time",
         )
@@ -123,16 +259,20 @@ class TicketSeatsSerializer(serializers.ModelSerializer):
         fields = ("cargo", "seat",)
 
 
-class TripDetailSerializer(serializers.ModelSerializer):
+class TripDetailSerializer(DynamicFieldsModelSerializer):
     tickets_available = serializers.IntegerField(read_only=True)
     route = RouteDetailSerializer(many=False, read_only=True)
     train = TrainSerializer(many=False, read_only=True)
     crews = SlugRelatedField(
         many=True, read_only=True, slug_field="name",
     )
-    taken_places = TicketSeatsSerializer(
-        source="tickets", many=True, read_only=True
-    )
+    taken_places = serializers.SerializerMethodField()
+    fare = TripFareField()
+
+    collapsed_fields = {
+        "route": lambda: PrimaryKeyRelatedField(read_only=True),
+        "train": lambda: PrimaryKeyRelatedField(read_only=True),
+    }
 
     class Meta:
         model = Trip
@@ -141,14 +281,39 @@ class TripDetailSerializer(serializers.ModelSerializer):
             "departure_time",
             "arrival_time",
             "tickets_available",
+            "fare",
             "taken_places",
             "route",
             "train",
-            "crews"
+            "crews",
+            "cancelled_at",
+        )
+
+    @extend_schema_field(TicketSeatsSerializer(many=True))
+    def get_taken_places(self, trip: Trip) -> list[dict]:
+        """Return sold and currently held seats of the trip"""
+        now = timezone.now()
+        seats = [
+            (ticket.cargo, ticket.seat) for ticket in trip.tickets.all()
+        ]
+        seats.extend(
+            (hold.cargo, hold.seat)
+            for hold in trip.holds.all()
+            if hold.expires_at > now
         )
+        return [
+            {"cargo": cargo, "seat": seat} for cargo, seat in sorted(seats)
+        ]
 
 
-class TicketCreateSerializer(serializers.ModelSerializer):
+class TicketCreateSerializer(
+    TracedValidationMixin,
+    serializers.ModelSerializer
+):
+    trip = PrimaryKeyRelatedField(
+        queryset=Trip.objects.select_related("train")
+    )
+
     class Meta:
         model = Ticket
         fields = (
@@ -156,9 +321,15 @@ class TicketCreateSerializer(serializers.ModelSerializer):
             "cargo",
             "seat",
             "trip",
+            "price",
         )
+        read_only_fields = ("price",)
+        # Taken seats are reported by the insert of the whole order
+        validators = []
 
     def validate(self, attrs: dict) -> dict:
+        if attrs["trip"].cancelled_at is not None:
+            raise ValidationError({"trip": "The trip is cancelled"})
         Ticket.validate_ticket(
             attrs["cargo"],
             attrs["seat"],
@@ -168,9 +339,13 @@ class TicketCreateSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class TicketSerializer(serializers.ModelSerializer):
+class TicketSerializer(DynamicFieldsModelSerializer):
     trip = TripListSerializer(many=False, read_only=True)
 
+    collapsed_fields = {
+        "trip": lambda: PrimaryKeyRelatedField(read_only=True),
+    }
+
     class Meta:
         model = Ticket
         fields = (
@@ -178,10 +353,14 @@ class TicketSerializer(serializers.ModelSerializer):
             "cargo",
             "seat",
             "trip",
+            "price",
         )
 
 
-class OrderCreateSerializer(serializers.ModelSerializer):
+class OrderCreateSerializer(
+    TracedValidationMixin,
+    serializers.ModelSerializer
+):
     tickets = TicketCreateSerializer(
         many=True, read_only=False, allow_empty=False
     )
@@ -190,18 +369,341 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         model = Order
         fields = ("id", "created_at", "tickets")
 
+    def validate(self, attrs: dict) -> dict:
+        held_seats = (
+            SeatHold.objects
+            .filter(
+                seats_filter(attrs["tickets"]),
+                expires_at__gt=timezone.now()
+            )
+            .exclude(user=self.context["request"].user)
+            .values_list("trip_id", "cargo", "seat")
+        )
+        messages = [
+            f"Seat {seat} in cargo {cargo} of trip {trip_id} "
+            f"is held by another user"
+            for trip_id, cargo, seat in held_seats
+        ]
+        if messages:
+            raise ValidationError({"tickets": messages})
+        return attrs
+
+    @staticmethod
+    def get_summary(
+            tickets: list[dict], trips: dict, ticket_ids: dict
+    ) -> list[dict]:
+        summary = []
+        for ticket in tickets:
+            trip = trips[ticket["trip"].id]
+            seat = (trip["id"], ticket["cargo"], ticket["seat"])
+            summary.append(
+                {
+                    "id": ticket_ids[seat],
+                    "cargo": ticket["cargo"],
+                    "seat": ticket["seat"],
+                    "price": ticket["price"],
+                    "trip": trip["id"],
+                    "departure_station": trip["route__source__name"],
+                    "arrival_station": trip["route__destination__name"],
+                    "train_name": trip["train__name"],
+                    "departure_time": trip["departure_time"],
+                    "arrival_time": trip["arrival_time"],
+                }
+            )
+        summary.sort(
+            key=lambda item: (item["trip"], item["cargo"], item["seat"])
+        )
+        return summary
+
     @transaction.atomic
     def create(self, validated_data: dict) -> Order:
         tickets = validated_data.pop("tickets")
         order = Order.objects.create(**validated_data)
+        trips = {
+            trip["id"]: trip
+            for trip in Trip.objects.filter(
+                id__in={ticket["trip"].id for ticket in tickets}
+            ).values(
+                "id",
+                "departure_time",
+                "arrival_time",
+                "route__distance",
+                "route__source__name",
+                "route__destination__name",
+                "train__name",
+                "train__train_type_id",
+            )
+        }
         for ticket in tickets:
-            Ticket.objects.create(order=order, **ticket)
+            trip = trips[ticket["trip"].id]
+            ticket["price"] = fare_table.get_price(
+                trip["train__train_type_id"], trip["route__distance"]
+            )
+        ticket_ids = Ticket.insert_free_seats(
+            [Ticket(order=order, **ticket) for ticket in tickets]
+        )
+        # The inserted tickets lock their trips against a cancellation,
+        # so one that passed validation has committed by now and shows
+        cancelled_trip_ids = Trip.objects.filter(
+            id__in=trips, cancelled_at__isnull=False
+        ).values_list("id", flat=True)
+        if cancelled_trip_ids:
+            raise ValidationError(
+                {
+                    "tickets": [
+                        f"Trip {trip_id} is cancelled"
+                        for trip_id in sorted(cancelled_trip_ids)
+                    ]
+                }
+            )
+        taken_seats = Counter(
+            (ticket["trip"].id, ticket["cargo"], ticket["seat"])
+            for ticket in tickets
+        )
+        taken_seats.subtract(ticket_ids.keys())
+        messages = [
+            f"Seat {seat} in cargo {cargo} of trip {trip_id} "
+            f"is already taken"
+            for (trip_id, cargo, seat), count in sorted(taken_seats.items())
+            if count > 0
+        ]
+        if messages:
+            raise ValidationError({"tickets": messages})
+        tickets_created(list(ticket_ids))
+        order.summary = self.get_summary(tickets, trips, ticket_ids)
+        order.save(update_fields=["summary"])
+        # The held seats stay taken, so their holds are removed without
+        # the signals that would report them freed
+        holds = SeatHold.objects.filter(
+            seats_filter(tickets), user=order.user
+        )
+        if delete_rows(holds):
+            ResourceVersion.bump([ResourceVersion.get_key(SeatHold)])
         return order
 
 
-class OrderSerializer(serializers.ModelSerializer):
-    tickets = TicketSerializer(many=True, read_only=True)
+class SeatHoldSerializer(DynamicFieldsModelSerializer):
+    class Meta:
+        model = SeatHold
+        fields = ("id", "cargo", "seat", "trip", "expires_at",)
+        read_only_fields = ("expires_at",)
+        validators = []
+
+    def validate(self, attrs: dict) -> dict:
+        if attrs["trip"].cancelled_at is not None:
+            raise ValidationError({"trip": "The trip is cancelled"})
+        Ticket.validate_ticket(
+            attrs["cargo"],
+            attrs["seat"],
+            attrs["trip"].train,
+            ValidationError
+        )
+        if Ticket.objects.filter(**attrs).exists():
+            raise ValidationError({"seat": "This seat is already taken"})
+        active_holds = SeatHold.objects.filter(
+            user=self.context["request"].user,
+            expires_at__gt=timezone.now()
+        )
+        if active_holds.count() >= settings.SEAT_HOLD_LIMIT:
+            raise ValidationError(
+                f"You can't hold more than "
+                f"{settings.SEAT_HOLD_LIMIT} seats at once"
+            )
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data: dict) -> SeatHold:
+        now = timezone.now()
+        SeatHold.objects.filter(
+            seats_filter([validated_data]), expires_at__lte=now
+        ).delete()
+        try:
+            with transaction.atomic():
+                return SeatHold.objects.create(
+                    expires_at=now + settings.SEAT_HOLD_DURATION,
+                    **validated_data
+                )
+        except IntegrityError:
+            raise ValidationError(
+                {"seat": "This seat is already held"}
+            ) from None
+
+
+class OrderSummaryTicketSerializer(serializers.Serializer):
+    id = serializers.IntegerField()  # noqa: VNE003, API field name
+    cargo = serializers.IntegerField()
+    seat = serializers.IntegerField()
+    price = serializers.DecimalField(
+        max_digits=8, decimal_places=2, allow_null=True
+    )
+    trip = serializers.IntegerField()
+    departure_station = serializers.CharField()
+    arrival_station = serializers.CharField()
+    train_name = serializers.CharField()
+    departure_time = serializers.DateTimeField()
+    arrival_time = serializers.DateTimeField()
+
+
+class OrderHistorySerializer(DynamicFieldsModelSerializer):
+    summary = OrderSummaryTicketSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ("id", "created_at", "tickets")
+        fields = ("id", "created_at", "cancelled_at", "summary")
+
+
+class OrderSerializer(DynamicFieldsModelSerializer):
+    tickets = TicketSerializer(
+        many=True, read_only=True, source="all_tickets"
+    )
+
+    collapsed_fields = {
+        "tickets": lambda: PrimaryKeyRelatedField(
+            many=True, read_only=True, source="all_tickets"
+        ),
+    }
+
+    class Meta:
+        model = Order
+        fields = ("id", "created_at", "cancelled_at", "tickets")
+
+
+class SeatStreamTokenSerializer(serializers.Serializer):
+    token = serializers.CharField()
+
+
+class CancellationSerializer(serializers.Serializer):
+    cancelled_orders = serializers.ListField(
+        child=serializers.IntegerField()
+    )
+    released_tickets = serializers.IntegerField()
+
+
+class DateRangeSerializer(TracedValidationMixin, serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+
+    def validate(self, attrs: dict) -> dict:
+        if attrs["date_from"] > attrs["date_to"]:
+            raise ValidationError(
+                {"date_to": "date_to must not be earlier than date_from"}
+            )
+        return attrs
+
+
+class RouteFilterSerializer(TracedValidationMixin, serializers.Serializer):
+    routes = serializers.CharField(required=False)
+
+    def validate_routes(self, value: str) -> list[int]:
+        try:
+            return [int(route_id) for route_id in value.split(",")]
+        except ValueError:
+            raise ValidationError(
+                "routes must be comma-separated ids of the routes"
+            ) from None
+
+
+class TripSearchSerializer(TracedValidationMixin, serializers.Serializer):
+    route = serializers.IntegerField(required=False)
+    train = serializers.IntegerField(required=False)
+    source = serializers.IntegerField(required=False)
+    destination = serializers.IntegerField(required=False)
+    departure_from = serializers.DateTimeField(required=False)
+    departure_to = serializers.DateTimeField(required=False)
+
+
+class TripAvailabilitySerializer(
+    TracedValidationMixin,
+    serializers.Serializer
+):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.TRIP_AVAILABILITY_MAX_IDS,
+    )
+    by_cargo = serializers.BooleanField(default=False)
+
+
+class CrewConflictSerializer(serializers.Serializer):
+    crew = serializers.IntegerField()
+    crew_name = serializers.CharField()
+    trip = serializers.IntegerField()
+    conflicting_trip = serializers.IntegerField()
+    overlap_start = serializers.DateTimeField()
+    overlap_end = serializers.DateTimeField()
+
+
+class TrainConflictSerializer(serializers.Serializer):
+    trip = serializers.IntegerField()
+    conflicting_trip = serializers.IntegerField()
+    turnaround = serializers.DurationField()
+
+
+class TripDelaySerializer(TracedValidationMixin, serializers.Serializer):
+    delay_minutes = serializers.IntegerField(
+        min_value=1, max_value=settings.TRIP_DELAY_MAX_MINUTES
+    )
+
+
+class DelayedTripSerializer(serializers.Serializer):
+    id = serializers.IntegerField()  # noqa: VNE003, API field name
+    route = serializers.IntegerField()
+    departure_time = serializers.DateTimeField()
+    arrival_time = serializers.DateTimeField()
+    shift = serializers.DurationField()
+
+
+class DelayResultSerializer(serializers.Serializer):
+    trips = DelayedTripSerializer(many=True)
+    crew_conflicts = CrewConflictSerializer(many=True)
+    train_conflicts = TrainConflictSerializer(many=True)
+
+
+class RotationTripSerializer(serializers.Serializer):
+    id = serializers.IntegerField()  # noqa: VNE003, API field name
+    departure_station = serializers.CharField()
+    arrival_station = serializers.CharField()
+    departure_time = serializers.DateTimeField()
+    arrival_time = serializers.DateTimeField()
+    connected = serializers.BooleanField()
+
+
+class TrainRotationSerializer(serializers.Serializer):
+    train = serializers.IntegerField()
+    train_name = serializers.CharField()
+    trips = RotationTripSerializer(many=True)
+
+
+class RouteDailyLoadSerializer(DynamicFieldsModelSerializer):
+    load_factor = serializers.FloatField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = RouteDailyLoad
+        fields = (
+            "route",
+            "date",
+            "trips_count",
+            "seats_offered",
+            "tickets_sold",
+            "load_factor",
+        )
+
+
+class TripForecastSerializer(DynamicFieldsModelSerializer):
+    route = serializers.IntegerField(source="trip.route_id", read_only=True)
+    departure_time = serializers.DateTimeField(
+        source="trip.departure_time", read_only=True
+    )
+
+    class Meta:
+        model = TripForecast
+        fields = (
+            "trip",
+            "route",
+            "departure_time",
+            "tickets_sold",
+            "projected_load_factor",
+            "projected_sellout_at",
+            "history_trips",
+            "computed_at",
+        )
@@ -0,0 +1,272 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.db import models, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from railway.fares import fare_table
+from railway.models import (
+    Fare,
+    TrainType,
+    Train,
+    Crew,
+    Station,
+    Route,
+    Trip,
+    Ticket,
+    SeatHold,
+    RouteDailyLoad,
+    ResourceVersion,
+)
+from railway.streams import publish_seat_changes
+
+VERSIONED_MODELS = (
+    TrainType, Train, Fare, Crew, Station, Route, Trip, SeatHold
+)
+
+
+def get_load_key(route_id: int, departure_time: datetime) -> tuple:
+    return route_id, timezone.localdate(departure_time)
+
+
+def new_load_changes() -> defaultdict:
+    return defaultdict(lambda: [0, 0, 0])
+
+
+def count_tickets(seats: list[tuple[int, int, int]], sign: int) -> None:
+    tickets_per_trip = Counter(trip_id for trip_id, _, _ in seats)
+    changes = new_load_changes()
+    for trip_id, route_id, departure_time in Trip.objects.filter(
+        id__in=tickets_per_trip
+    ).values_list("id", "route_id", "departure_time"):
+        key = get_load_key(route_id, departure_time)
+        changes[key][2] += sign * tickets_per_trip[trip_id]
+    RouteDailyLoad.apply_changes(changes)
+
+
+def bump_ticket_versions(seats: list[tuple[int, int, int]]) -> None:
+    ResourceVersion.bump(
+        [ResourceVersion.get_key(Ticket)]
+        + [ResourceVersion.get_key(Trip, trip_id) for trip_id, _, _ in seats]
+    )
+
+
+def tickets_created(seats: list[tuple[int, int, int]]) -> None:
+    """Update data derived from tickets after (trip, cargo, seat) inserts.
+
+    Called by the ticket signals and by every bulk write path that
+    bypasses them.
+    """
+    count_tickets(seats, 1)
+    bump_ticket_versions(seats)
+    publish_seat_changes(seats, "taken")
+
+
+def tickets_deleted(seats: list[tuple[int, int, int]]) -> None:
+    """Update data derived from tickets after (trip, cargo, seat) deletes"""
+    count_tickets(seats, -1)
+    bump_ticket_versions(seats)
+    publish_seat_changes(seats, "freed")
+
+
+def get_version_keys(instance: models.Model) -> list[str]:
+    keys = [ResourceVersion.get_key(type(instance))]
+    if isinstance(instance, Trip):
+        keys.append(ResourceVersion.get_key(Trip, instance.pk))
+        # Per-route keys tell the GTFS export which routes to rebuild
+        route_ids = {instance.route_id}
+        previous_load = getattr(instance, "_previous_load", None)
+        if previous_load:
+            route_ids.add(previous_load[0])
+        keys.extend(
+            ResourceVersion.get_key(Route, route_id) for route_id in route_ids
+        )
+    elif isinstance(instance, Route):
+        keys.append(ResourceVersion.get_key(Route, instance.pk))
+    elif isinstance(instance, SeatHold):
+        keys.append(ResourceVersion.get_key(Trip, instance.trip_id))
+    return keys
+
+
+def model_changed(sender, instance: models.Model, **kwargs) -> None:
+    ResourceVersion.bump(get_version_keys(instance))
+
+
+for versioned_model in VERSIONED_MODELS:
+    post_save.connect(
+        model_changed,
+        sender=versioned_model,
+        dispatch_uid=f"{versioned_model.__name__}_version_saved",
+    )
+    post_delete.connect(
+        model_changed,
+        sender=versioned_model,
+        dispatch_uid=f"{versioned_model.__name__}_version_deleted",
+    )
+
+
+@receiver(post_save, sender=Fare)
+@receiver(post_delete, sender=Fare)
+def fare_changed(sender, instance: Fare, **kwargs) -> None:
+    transaction.on_commit(fare_table.invalidate)
+
+
+@receiver(m2m_changed, sender=Trip.crews.through)
+def trip_crews_changed(
+        sender,
+        instance: models.Model,
+        action: str,
+        reverse: bool,
+        pk_set: set | None,
+        **kwargs
+) -> None:
+    if not action.startswith("post_"):
+        return
+    keys = [ResourceVersion.get_key(Trip), ResourceVersion.get_key(Crew)]
+    if not reverse:
+        keys.append(ResourceVersion.get_key(Trip, instance.pk))
+    else:
+        trip_ids = pk_set
+        if trip_ids is None:
+            trip_ids = instance.trips.values_list("id", flat=True)
+        keys.extend(
+            ResourceVersion.get_key(Trip, trip_id) for trip_id in trip_ids
+        )
+    ResourceVersion.bump(keys)
+
+
+@receiver(pre_save, sender=Ticket)
+def remember_ticket(sender, instance: Ticket, **kwargs) -> None:
+    instance._previous_seat = None
+    if not instance._state.adding:
+        instance._previous_seat = Ticket.objects.filter(
+            pk=instance.pk
+        ).values_list("trip_id", "cargo", "seat").first()
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_saved(sender, instance: Ticket, created: bool, **kwargs) -> None:
+    seat = (instance.trip_id, instance.cargo, instance.seat)
+    previous_seat = getattr(instance, "_previous_seat", None)
+    if created:
+        tickets_created([seat])
+    elif previous_seat and previous_seat != seat:
+        tickets_deleted([previous_seat])
+        tickets_created([seat])
+
+
+@receiver(post_delete, sender=Ticket)
+def ticket_deleted(sender, instance: Ticket, **kwargs) -> None:
+    tickets_deleted([(instance.trip_id, instance.cargo, instance.seat)])
+
+
+@receiver(post_save, sender=SeatHold)
+def seat_hold_saved(
+        sender, instance: SeatHold, created: bool, **kwargs
+) -> None:
+    if created:
+        publish_seat_changes(
+            [(instance.trip_id, instance.cargo, instance.seat)], "taken"
+        )
+
+
+@receiver(post_delete, sender=SeatHold)
+def seat_hold_deleted(sender, instance: SeatHold, **kwargs) -> None:
+    publish_seat_changes(
+        [(instance.trip_id, instance.cargo, instance.seat)], "freed"
+    )
+
+
+@receiver(pre_save, sender=Trip)
+def remember_trip(sender, instance: Trip, **kwargs) -> None:
+    instance._previous_load = None
+    if not instance._state.adding:
+        instance._previous_load = Trip.objects.filter(
+            pk=instance.pk
+        ).values_list(
+            "route_id",
+            "departure_time",
+            "train__cargo_num",
+            "train__places_in_cargo",
+        ).first()
+
+
+@receiver(post_save, sender=Trip)
+def trip_saved(sender, instance: Trip, created: bool, **kwargs) -> None:
+    # Cancelled trips were taken out of the loads by their cancellation
+    if instance.cancelled_at is not None:
+        return
+    key = get_load_key(instance.route_id, instance.departure_time)
+    capacity = instance.train.capacity
+    changes = new_load_changes()
+    previous_load = getattr(instance, "_previous_load", None)
+    if created:
+        changes[key][0] += 1
+        changes[key][1] += capacity
+    elif previous_load:
+        route_id, departure_time, cargo_num, places_in_cargo = previous_load
+        previous_key = get_load_key(route_id, departure_time)
+        previous_capacity = cargo_num * places_in_cargo
+        if (previous_key, previous_capacity) == (key, capacity):
+            return
+        sold = instance.tickets.count()
+        for load_key, sign, seats in (
+            (previous_key, -1, previous_capacity),
+            (key, 1, capacity),
+        ):
+            changes[load_key][0] += sign
+            changes[load_key][1] += sign * seats
+            changes[load_key][2] += sign * sold
+    RouteDailyLoad.apply_changes(changes)
+
+
+@receiver(post_delete, sender=Trip)
+def trip_deleted(sender, instance: Trip, **kwargs) -> None:
+    if instance.cancelled_at is not None:
+        return
+    capacity = Train.objects.filter(pk=instance.train_id).values_list(
+        "cargo_num", "places_in_cargo"
+    ).first()
+    key = get_load_key(instance.route_id, instance.departure_time)
+    RouteDailyLoad.apply_changes(
+        {key: [-1, -capacity[0] * capacity[1] if capacity else 0, 0]}
+    )
+
+
+@receiver(pre_save, sender=Train)
+def remember_train(sender, instance: Train, **kwargs) -> None:
+    instance._previous_capacity = None
+    if not instance._state.adding:
+        previous = Train.objects.filter(pk=instance.pk).values_list(
+            "cargo_num", "places_in_cargo"
+        ).first()
+        if previous:
+            instance._previous_capacity = previous[0] * previous[1]
+
+
+@receiver(post_save, sender=Train)
+def train_saved(sender, instance: Train, created: bool, **kwargs) -> None:
+    previous_capacity = getattr(instance, "_previous_capacity", None)
+    if previous_capacity is None or previous_capacity == instance.capacity:
+        return
+    delta = instance.capacity - previous_capacity
+    changes = new_load_changes()
+    for route_id, day, trips_count in (
+        Trip.objects.active()
+        .filter(train=instance)
+        .annotate(day=TruncDate("departure_time"))
+        .values("route_id", "day")
+        .annotate(trips_count=Count("id"))
+        .values_list("route_id", "day", "trips_count")
+    ):
+        changes[(route_id, day)][1] += delta * trips_count
+    RouteDailyLoad.apply_changes(changes)
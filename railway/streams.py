@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import AsyncIterator
+
+from django.db import connection, connections, transaction
+from django.db.models.functions import Now
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.tokens import Token
+
+from Railway_Service_API import settings
+from railway.models import Ticket, SeatHold
+
+logger = logging.getLogger(__name__)
+
+
+def encode_event(event: str, data) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    """Queue of the seat events of one trip for one watcher"""
+
+    def __init__(self, trip_id: int) -> None:
+        self.trip_id = trip_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.SEAT_STREAM_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message: bytes) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The stream is closed, so the client reconnects
+            # and starts over from a fresh snapshot
+            self.overflowed = True
+
+
+class InProcessBackend:
+    """Deliver events to the watchers of the publishing process only.
+
+    Enough when the whole site runs in a single ASGI process.
+    """
+
+    # Longest encoded event in bytes the transport can carry, if limited
+    max_message_size = None
+
+    def __init__(self, broker: "SeatEventBroker") -> None:
+        self.broker = broker
+
+    def start(self) -> None:
+        pass
+
+    def publish(self, trip_id: int, message: str) -> None:
+        self.broker.dispatch(trip_id, message)
+
+
+class PostgresBackend(InProcessBackend):
+    """Deliver events to every process through Postgres LISTEN/NOTIFY.
+
+    Each process that has watchers keeps one listening connection, so a
+    published event costs a single NOTIFY however many workers there are.
+    """
+
+    channel = "railway_seat_events"
+    # NOTIFY payloads are limited to 8000 bytes, trip id prefix included
+    max_message_size = 7900
+
+    def __init__(self, broker: "SeatEventBroker") -> None:
+        super().__init__(broker)
+        self.lock = threading.Lock()
+        self.listener = None
+
+    def start(self) -> None:
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(
+                    target=self.listen, name="seat-events", daemon=True
+                )
+                self.listener.start()
+
+    def publish(self, trip_id: int, message: str) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)",
+                [self.channel, f"{trip_id}:{message}"],
+            )
+
+    def listen(self) -> None:
+        while True:
+            try:
+                self.receive_notifications()
+            except Exception:
+                logger.exception("Seat events listener failed, reconnecting")
+                time.sleep(1)
+
+    def receive_notifications(self) -> None:
+        wrapper = connections.create_connection("default")
+        listener = wrapper.get_new_connection(wrapper.get_connection_params())
+        listener.autocommit = True
+        try:
+            with listener.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+            while True:
+                if select.select([listener], [], [], 60) == ([], [], []):
+                    continue
+                listener.poll()
+                while listener.notifies:
+                    notification = listener.notifies.pop(0)
+                    trip_id, _, message = notification.payload.partition(":")
+                    self.broker.dispatch(int(trip_id), message)
+        finally:
+            listener.close()
+
+
+class SeatEventBroker:
+    """Fan out seat events of a trip to all its watchers in this process.
+
+    An event is encoded once and the same bytes are queued for every
+    watcher of the trip. Transport between processes is left to the
+    backend set in SEAT_STREAM_BACKEND.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+        self._backend = None
+
+    @property
+    def backend(self) -> InProcessBackend:
+        with self.lock:
+            if self._backend is None:
+                backend_class = import_string(settings.SEAT_STREAM_BACKEND)
+                self._backend = backend_class(self)
+        return self._backend
+
+    def subscribe(self, trip_id: int) -> Subscription:
+        self.backend.start()
+        subscription = Subscription(trip_id)
+        with self.lock:
+            self.subscriptions[trip_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            subscriptions = self.subscriptions[subscription.trip_id]
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.trip_id]
+
+    def publish(self, trip_id: int, event: str, places: list[dict]) -> None:
+        """Publish an event about ``places``, split if it's too long.
+
+        Halves of a change are sent as separate events of the same kind,
+        each small enough for the backend.
+        """
+        message = encode_event(event, places)
+        max_size = self.backend.max_message_size
+        if (
+            max_size is not None
+            and len(places) > 1
+            and len(message.encode()) > max_size
+        ):
+            middle = len(places) // 2
+            self.publish(trip_id, event, places[:middle])
+            self.publish(trip_id, event, places[middle:])
+            return
+        self.backend.publish(trip_id, message)
+
+    def dispatch(self, trip_id: int, message: str) -> None:
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(trip_id, ()))
+        if not subscriptions:
+            return
+        encoded_message = message.encode()
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.put, encoded_message
+                )
+            except RuntimeError:
+                # The event loop of the watcher is already closed
+                self.unsubscribe(subscription)
+
+
+seat_event_broker = SeatEventBroker()
+
+
+class SeatStreamToken(Token):
+    """Opens the seat stream of one trip, never the rest of the API"""
+
+    token_type = "seat_stream"
+    lifetime = settings.SEAT_STREAM_TOKEN_LIFETIME
+
+    @classmethod
+    def for_trip(cls, user, trip_id: int) -> "SeatStreamToken":
+        token = cls.for_user(user)
+        token["trip_id"] = trip_id
+        return token
+
+
+def publish_seat_changes(
+        seats: list[tuple[int, int, int]], event: str
+) -> None:
+    """Push "taken" or "freed" (trip, cargo, seat) changes on commit"""
+    places_per_trip = defaultdict(list)
+    for trip_id, cargo, seat in seats:
+        places_per_trip[trip_id].append({"cargo": cargo, "seat": seat})
+
+    def publish() -> None:
+        for trip_id, places in places_per_trip.items():
+            seat_event_broker.publish(trip_id, event, places)
+
+    transaction.on_commit(publish, robust=True)
+
+
+async def get_taken_places(trip_id: int) -> list[dict]:
+    sold_seats = (
+        Ticket.objects
+        .filter(trip_id=trip_id)
+        .order_by()
+        .values_list("cargo", "seat")
+    )
+    held_seats = (
+        SeatHold.objects
+        .filter(trip_id=trip_id, expires_at__gt=Now())
+        .order_by()
+        .values_list("cargo", "seat")
+    )
+    return [
+        {"cargo": cargo, "seat": seat}
+        async for cargo, seat in sold_seats.union(held_seats, all=True)
+        .order_by("cargo", "seat")
+    ]
+
+
+async def stream_seat_events(trip_id: int) -> AsyncIterator[bytes]:
+    """Yield a snapshot of the taken places of a trip, then its changes.
+
+    Watchers subscribe before the snapshot is read, so no change is
+    missed in between; a change may repeat the snapshot instead.
+    """
+    subscription = seat_event_broker.subscribe(trip_id)
+    try:
+        yield encode_event(
+            "snapshot", await get_taken_places(trip_id)
+        ).encode()
+        while not subscription.overflowed:
+            try:
+                yield await asyncio.wait_for(
+                    subscription.queue.get(),
+                    settings.SEAT_STREAM_HEARTBEAT,
+                )
+            except TimeoutError:
+                yield b": heartbeat\n\n"
+    finally:
+        seat_event_broker.unsubscribe(subscription)
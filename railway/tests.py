@@ -1,3 +1,2506 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import re
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from django.test import Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework.throttling import UserRateThrottle
+from rest_framework_simplejwt.tokens import AccessToken
+
+from Railway_Service_API import settings
+from Railway_Service_API.profiling import ProfilingMiddleware
+from Railway_Service_API.schema import PrecompiledSchemaView, build_schema
+from Railway_Service_API.tracing import TracingMiddleware
+from railway.admin import OrderAdmin
+from railway.fares import fare_table
+from railway.forecasting import (
+    DAY_SECONDS,
+    TICKET_DTYPE,
+    TRIP_DTYPE,
+    fit_booking_curves,
+    project_sellouts,
+)
+from railway.gtfs import build_gtfs
+from railway.models import (
+    TrainType,
+    Train,
+    Fare,
+    Crew,
+    Station,
+    Route,
+    Trip,
+    Order,
+    IdempotencyKey,
+    Ticket,
+    SeatHold,
+    RouteDailyLoad,
+    ResourceVersion,
+    TripForecast,
+    ArchivedTrip,
+    ArchivedTicket,
+)
+from railway.paginations import OrderPagination
+from railway.streams import SeatEventBroker, SeatStreamToken
+from railway.timetable import build_timetable
+
+SNAPSHOT_DIR = Path(__file__).resolve().parent / "query_snapshots"
+
+LARGE_TABLES = {
+    "railway_trip",
+    "railway_order",
+    "railway_ticket",
+    "railway_seathold",
+    "railway_archivedtrip",
+    "railway_archivedticket",
+}
+
+START = datetime(2030, 1, 7, 6, tzinfo=timezone.get_current_timezone())
+
+
+def normalize_sql(sql: str) -> str:
+    """Replace literals of a query, so snapshots don't depend on data.
+
+    Lists of values are folded whether they are written as IN (?, ?),
+    IN ((?), (?)) or an OR chain of equalities on one column, as the
+    form depends on the database version.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r'"(?:s\d+_x\d+|_django_curs_\w+)"', "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\s+", " ", sql).strip()
+    column = r'((?:"\w+"\.)?"\w+")'
+    sql = re.sub(
+        rf"\({column} = \?(?: OR \1 = \?)+\)", r"\1 IN (...)", sql
+    )
+    sql = re.sub(rf"{column} = \?(?: OR \1 = \?)+", r"\1 IN (...)", sql)
+    value = r"(?:\?|\(\?\))"
+    return re.sub(rf"\bIN \((?:{value}, )*{value}\)", "IN (...)", sql)
+
+
+def find_seq_scans(plan: dict) -> set[str]:
+    tables = set()
+    if plan.get("Node Type") == "Seq Scan":
+        tables.add(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        tables |= find_seq_scans(child)
+    return tables
+
+
+class QueryRegressionTest(TestCase):
+    """Record the queries of every endpoint against seeded data.
+
+    Query counts and normalized SQL are compared with the snapshots in
+    ``query_snapshots/<database vendor>/``. A missing snapshot fails
+    the test; UPDATE_QUERY_SNAPSHOTS=1 writes all of them after an
+    intended change, to be committed with it. On Postgres, filtered
+    queries on LARGE_TABLES must not fall back to sequential scans;
+    other databases skip that check.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.admin = get_user_model().objects.create_user(
+            username="admin", password="admin12345", is_staff=True
+        )
+        cls.user = get_user_model().objects.create_user(
+            username="user", password="user12345"
+        )
+        train_types = [
+            TrainType.objects.create(name=name)
+            for name in ("Intercity", "Regional")
+        ]
+        for train_type in train_types:
+            Fare.objects.create(
+                train_type=train_type, distance_from=0, price="10.00"
+            )
+            Fare.objects.create(
+                train_type=train_type, distance_from=300, price="25.00"
+            )
+        cls.trains = [
+            Train.objects.create(
+                name=f"Train {index}",
+                cargo_num=3,
+                places_in_cargo=10,
+                train_type=train_types[index % 2],
+            )
+            for index in range(3)
+        ]
+        stations = [
+            Station.objects.create(
+                name=name, latitude=50 + index, longitude=30 - index
+            )
+            for index, name in enumerate(("Kyiv", "Lviv", "Odesa"))
+        ]
+        cls.routes = [
+            Route.objects.create(
+                source=source, destination=destination, distance=450
+            )
+            for source, destination in (
+                (stations[0], stations[1]),
+                (stations[1], stations[0]),
+                (stations[0], stations[2]),
+            )
+        ]
+        crews = [Crew.objects.create(name=f"Crew {index}") for index in (1, 2)]
+        cls.trips = []
+        for day in range(3):
+            for train, route in zip(cls.trains, cls.routes, strict=True):
+                departure_time = START + timedelta(
+                    days=day, hours=route.id % 2 * 8
+                )
+                trip = Trip.objects.create(
+                    route=route,
+                    train=train,
+                    departure_time=departure_time,
+                    arrival_time=departure_time + timedelta(hours=6),
+                )
+                trip.crews.set(crews)
+                cls.trips.append(trip)
+        for user in (cls.user, cls.admin):
+            for trip in cls.trips[:3]:
+                order = Order.objects.create(user=user)
+                for seat in (1, 2):
+                    Ticket.objects.create(
+                        order=order,
+                        trip=trip,
+                        cargo=1 if user == cls.user else 2,
+                        seat=seat,
+                    )
+        for trip in cls.trips:
+            TripForecast.objects.create(
+                trip=trip,
+                tickets_sold=4,
+                projected_load_factor=0.5,
+                history_trips=3,
+                computed_at=START,
+            )
+        SeatHold.objects.create(
+            trip=cls.trips[0],
+            user=cls.user,
+            cargo=3,
+            seat=1,
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+    def get_cases(self) -> list[tuple]:
+        """Return (name, user, method, url, data) of the recorded requests"""
+        trip, route, train = self.trips[0], self.routes[0], self.trains[0]
+        period = "?date_from=2030-01-07&date_to=2030-01-09"
+        cases = [
+            (f"{name}_list", self.user, "get", reverse(f"railway:{name}-list"))
+            for name in (
+                "train_type",
+                "train",
+                "crew",
+                "station",
+                "routes",
+                "trip",
+                "order",
+                "hold",
+            )
+        ]
+        cases += [
+            (
+                "train_type_detail",
+                self.user,
+                "get",
+                reverse(
+                    "railway:train_type-detail", args=[train.train_type_id]
+                ),
+            ),
+            (
+                "train_detail",
+                self.user,
+                "get",
+                reverse("railway:train-detail", args=[train.id]),
+            ),
+            (
+                "crew_detail",
+                self.user,
+                "get",
+                reverse("railway:crew-detail", args=[trip.crews.first().id]),
+            ),
+            (
+                "station_detail",
+                self.user,
+                "get",
+                reverse("railway:station-detail", args=[route.source_id]),
+            ),
+            (
+                "route_detail",
+                self.user,
+                "get",
+                reverse("railway:routes-detail", args=[route.id]),
+            ),
+            (
+                "trip_detail",
+                self.user,
+                "get",
+                reverse("railway:trip-detail", args=[trip.id]),
+            ),
+            (
+                "trip_list_sparse",
+                self.user,
+                "get",
+                reverse("railway:trip-list") + "?fields=id,departure_time",
+            ),
+            (
+                "trip_detail_collapsed",
+                self.user,
+                "get",
+                reverse("railway:trip-detail", args=[trip.id]) + "?expand=",
+            ),
+            (
+                "trip_availability",
+                self.user,
+                "post",
+                reverse("railway:trip-availability"),
+                {"ids": [trip.id for trip in self.trips]},
+            ),
+            (
+                "trip_availability_by_cargo",
+                self.user,
+                "post",
+                reverse("railway:trip-availability"),
+                {"ids": [trip.id for trip in self.trips], "by_cargo": True},
+            ),
+            (
+                "trip_create",
+                self.admin,
+                "post",
+                reverse("railway:trip-list"),
+                {
+                    "route": self.routes[1].id,
+                    "train": train.id,
+                    "departure_time": START + timedelta(days=5),
+                    "arrival_time": START + timedelta(days=5, hours=6),
+                    "crews": [],
+                },
+            ),
+            (
+                "train_rotations",
+                self.admin,
+                "get",
+                reverse("railway:train-rotations") + period,
+            ),
+            (
+                "crew_conflicts",
+                self.admin,
+                "get",
+                reverse("railway:crew-conflicts") + period,
+            ),
+            (
+                "load_factor_list",
+                self.admin,
+                "get",
+                reverse("railway:load_factor-list") + period,
+            ),
+            (
+                "forecast_list",
+                self.admin,
+                "get",
+                reverse("railway:forecast-list") + period,
+            ),
+            (
+                "order_history",
+                self.user,
+                "get",
+                reverse("railway:order-list") + "?view=history",
+            ),
+            (
+                "order_create",
+                self.user,
+                "post",
+                reverse("railway:order-list"),
+                {
+                    "tickets": [
+                        {"trip": trip.id, "cargo": 3, "seat": seat}
+                        for trip in self.trips[:3]
+                        for seat in (1, 2)
+                    ]
+                },
+            ),
+            (
+                "hold_create",
+                self.user,
+                "post",
+                reverse("railway:hold-list"),
+                {"trip": self.trips[1].id, "cargo": 3, "seat": 5},
+            ),
+            (
+                "order_cancel",
+                self.user,
+                "post",
+                reverse(
+                    "railway:order-cancel",
+                    args=[
+                        Order.objects.filter(
+                            user=self.user, tickets__trip=self.trips[1]
+                        ).values_list("id", flat=True).first()
+                    ],
+                ),
+            ),
+            (
+                "trip_cancel_bookings",
+                self.admin,
+                "post",
+                reverse(
+                    "railway:trip-cancel-bookings", args=[self.trips[2].id]
+                ),
+            ),
+            (
+                "trip_delay",
+                self.admin,
+                "post",
+                reverse("railway:trip-delay", args=[self.trips[3].id]),
+                {"delay_minutes": 30},
+            ),
+            (
+                "trip_stream_token",
+                self.user,
+                "post",
+                reverse("railway:trip-stream-token", args=[trip.id]),
+            ),
+            ("user_me", self.user, "get", reverse("user:manage_user")),
+        ]
+        return cases
+
+    def record_queries(
+            self, user, method: str, url: str, data: dict | None = None
+    ) -> list[str]:
+        cache.clear()
+        fare_table.invalidate()
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(url, data, format="json")
+        self.assertLess(response.status_code, 400, response.content)
+        return [query["sql"] for query in context.captured_queries]
+
+    def assert_matches_snapshot(self, name: str, queries: list[str]) -> None:
+        path = SNAPSHOT_DIR / connection.vendor / f"{name}.json"
+        snapshot = {
+            "count": len(queries),
+            "queries": [normalize_sql(sql) for sql in queries],
+        }
+        if os.environ.get("UPDATE_QUERY_SNAPSHOTS"):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(snapshot, indent=2) + "\n")
+            return
+        self.assertTrue(
+            path.exists(),
+            f"Query snapshot {path} is missing, "
+            f"run the tests with UPDATE_QUERY_SNAPSHOTS=1 to write it",
+        )
+        expected = json.loads(path.read_text())
+        self.assertEqual(
+            snapshot["count"],
+            expected["count"],
+            f"{name} runs {snapshot['count']} queries "
+            f"instead of {expected['count']}",
+        )
+        self.assertEqual(snapshot["queries"], expected["queries"])
+
+    def assert_no_seq_scans(self, queries: list[str]) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            for sql in queries:
+                if not sql.startswith("SELECT") or " WHERE " not in sql:
+                    continue
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                seq_scans = find_seq_scans(plan[0]["Plan"]) & LARGE_TABLES
+                self.assertFalse(
+                    seq_scans, f"Sequential scan of {seq_scans} in {sql}"
+                )
+            cursor.execute("RESET enable_seqscan")
+
+    def test_query_snapshots(self) -> None:
+        for name, user, method, url, *data in self.get_cases():
+            with self.subTest(name):
+                queries = self.record_queries(user, method, url, *data)
+                self.assert_matches_snapshot(name, queries)
+
+    @unittest.skipUnless(
+        connection.vendor == "postgresql", "Query plans of Postgres only"
+    )
+    def test_no_seq_scans(self) -> None:
+        for name, user, method, url, *data in self.get_cases():
+            with self.subTest(name):
+                queries = self.record_queries(user, method, url, *data)
+                self.assert_no_seq_scans(queries)
+
+
+def get_time(hours: float, days: int = 0) -> datetime:
+    """Return a moment of the day START falls on, or of a later day"""
+    midnight = START.replace(hour=0)
+    return midnight + timedelta(days=days, hours=hours)
+
+
+class RailwayTestCase(TestCase):
+    """Two stations served in both directions by two small trains.
+
+    Requests are sent by the admin unless a test logs in another user.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.admin = get_user_model().objects.create_user(
+            username="admin", password="admin12345", is_staff=True
+        )
+        cls.user = get_user_model().objects.create_user(
+            username="user", password="user12345"
+        )
+        cls.other_user = get_user_model().objects.create_user(
+            username="other", password="other12345"
+        )
+        train_type = TrainType.objects.create(name="Intercity")
+        cls.train, cls.other_train = (
+            Train.objects.create(
+                name=name,
+                cargo_num=2,
+                places_in_cargo=3,
+                train_type=train_type,
+            )
+            for name in ("Train 1", "Train 2")
+        )
+        cls.kyiv, cls.lviv = (
+            Station.objects.create(name=name, latitude=50, longitude=30)
+            for name in ("Kyiv", "Lviv")
+        )
+        cls.route = Route.objects.create(
+            source=cls.kyiv, destination=cls.lviv, distance=450
+        )
+        cls.return_route = Route.objects.create(
+            source=cls.lviv, destination=cls.kyiv, distance=450
+        )
+        cls.crew = Crew.objects.create(name="Crew 1")
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_trip(
+            self,
+            departure_time: datetime,
+            arrival_time: datetime,
+            route: Route | None = None,
+            train: Train | None = None,
+            crews: tuple = (),
+    ) -> Trip:
+        trip = Trip.objects.create(
+            route=route or self.route,
+            train=train or self.train,
+            departure_time=departure_time,
+            arrival_time=arrival_time,
+        )
+        trip.crews.set(crews)
+        return trip
+
+    def post_trip(self, **data) -> Response:
+        return self.client.post(
+            reverse("railway:trip-list"),
+            {"route": self.route.id, "train": self.train.id, **data},
+            format="json",
+        )
+
+
+class CrewAssignmentTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(
+            get_time(8), get_time(10), crews=(self.crew,)
+        )
+
+    def test_overlapping_crew_is_rejected(self) -> None:
+        response = self.post_trip(
+            route=self.return_route.id,
+            train=self.other_train.id,
+            departure_time=get_time(9),
+            arrival_time=get_time(11),
+            crews=[self.crew.id],
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["crews"],
+            [
+                f"Crew {self.crew.name} is already assigned "
+                f"to overlapping trip {self.trip.id}"
+            ],
+        )
+
+    def test_crew_can_take_trip_after_arrival(self) -> None:
+        response = self.post_trip(
+            route=self.return_route.id,
+            train=self.other_train.id,
+            departure_time=get_time(10),
+            arrival_time=get_time(12),
+            crews=[self.crew.id],
+        )
+
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_trip_update_does_not_conflict_with_itself(self) -> None:
+        response = self.client.patch(
+            reverse("railway:trip-detail", args=[self.trip.id]),
+            {"arrival_time": get_time(9)},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_arrival_before_departure_is_rejected(self) -> None:
+        response = self.client.patch(
+            reverse("railway:trip-detail", args=[self.trip.id]),
+            {"arrival_time": get_time(7)},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("arrival_time", response.data)
+
+    def test_conflicts_report_overlapping_assignments(self) -> None:
+        other_trip = self.create_trip(
+            get_time(9),
+            get_time(12),
+            route=self.return_route,
+            train=self.other_train,
+            crews=(self.crew,),
+        )
+        self.create_trip(
+            get_time(13),
+            get_time(14),
+            train=self.other_train,
+            crews=(self.crew,),
+        )
+
+        response = self.client.get(
+            reverse("railway:crew-conflicts"),
+            {"date_from": START.date(), "date_to": START.date()},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "crew": self.crew.id,
+                    "crew_name": self.crew.name,
+                    "trip": self.trip.id,
+                    "conflicting_trip": other_trip.id,
+                    "overlap_start": "2030-01-07T09:00:00Z",
+                    "overlap_end": "2030-01-07T10:00:00Z",
+                }
+            ],
+        )
+
+    def test_conflicts_are_for_staff_only(self) -> None:
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(
+            reverse("railway:crew-conflicts"),
+            {"date_from": START.date(), "date_to": START.date()},
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+
+class TrainAssignmentTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+
+    def test_train_still_on_trip_is_rejected(self) -> None:
+        response = self.post_trip(
+            route=self.return_route.id,
+            departure_time=get_time(9),
+            arrival_time=get_time(11),
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["train"],
+            [
+                f"Train {self.train.name} is still on trip "
+                f"{self.trip.id} at departure time"
+            ],
+        )
+
+    def test_train_leaving_from_another_station_is_rejected(self) -> None:
+        response = self.post_trip(
+            departure_time=get_time(11), arrival_time=get_time(13)
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["train"],
+            [
+                f"Train {self.train.name} arrives at another station "
+                f"after previous trip {self.trip.id}"
+            ],
+        )
+
+    def test_next_trip_must_leave_from_arrival_station(self) -> None:
+        response = self.post_trip(
+            departure_time=get_time(5), arrival_time=get_time(7)
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["train"],
+            [
+                f"Next trip {self.trip.id} of train {self.train.name} "
+                f"leaves from another station"
+            ],
+        )
+
+    def test_connected_trip_is_accepted(self) -> None:
+        response = self.post_trip(
+            route=self.return_route.id,
+            departure_time=get_time(11),
+            arrival_time=get_time(13),
+        )
+
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_rotations_mark_disconnected_trips(self) -> None:
+        connected_trip = self.create_trip(
+            get_time(11), get_time(13), route=self.return_route
+        )
+        disconnected_trip = self.create_trip(
+            get_time(14), get_time(16), route=self.return_route
+        )
+
+        response = self.client.get(
+            reverse("railway:train-rotations"),
+            {"date_from": START.date(), "date_to": START.date()},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (rotation["train"], [
+                    (trip["id"], trip["connected"])
+                    for trip in rotation["trips"]
+                ])
+                for rotation in response.data
+            ],
+            [
+                (
+                    self.train.id,
+                    [
+                        (self.trip.id, True),
+                        (connected_trip.id, True),
+                        (disconnected_trip.id, False),
+                    ],
+                )
+            ],
+        )
+
+    def test_rotations_are_for_staff_only(self) -> None:
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(
+            reverse("railway:train-rotations"),
+            {"date_from": START.date(), "date_to": START.date()},
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+
+class IdempotencyKeyTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        self.client.force_authenticate(self.user)
+        self.order_data = {
+            "tickets": [{"trip": self.trip.id, "cargo": 1, "seat": 1}]
+        }
+
+    def post_order(self, data: dict, key: str = "attempt-1") -> Response:
+        return self.client.post(
+            reverse("railway:order-list"),
+            data,
+            format="json",
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_retry_replays_stored_response(self) -> None:
+        response = self.post_order(self.order_data)
+        retry_response = self.post_order(self.order_data)
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(retry_response.status_code, 201)
+        self.assertEqual(retry_response.json(), response.json())
+        self.assertEqual(retry_response["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_key_reused_with_another_body_is_rejected(self) -> None:
+        self.post_order(self.order_data)
+
+        response = self.post_order(
+            {"tickets": [{"trip": self.trip.id, "cargo": 1, "seat": 2}]}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Idempotency-Key", response.data)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_keys_are_scoped_to_the_user(self) -> None:
+        self.post_order(self.order_data)
+        self.client.force_authenticate(self.other_user)
+
+        response = self.post_order(
+            {"tickets": [{"trip": self.trip.id, "cargo": 1, "seat": 2}]}
+        )
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_expired_key_creates_new_order(self) -> None:
+        self.post_order(self.order_data)
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+        response = self.post_order(
+            {"tickets": [{"trip": self.trip.id, "cargo": 1, "seat": 2}]}
+        )
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_failed_attempt_is_not_stored(self) -> None:
+        Ticket.objects.create(
+            order=Order.objects.create(user=self.other_user),
+            trip=self.trip,
+            cargo=1,
+            seat=1,
+        )
+
+        response = self.post_order(self.order_data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_expired_keys_are_cleared(self) -> None:
+        self.post_order(self.order_data)
+        self.post_order(
+            {"tickets": [{"trip": self.trip.id, "cargo": 1, "seat": 2}]},
+            key="attempt-2",
+        )
+        IdempotencyKey.objects.filter(key="attempt-1").update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+        call_command("clear_idempotency_keys", stdout=StringIO())
+
+        self.assertQuerySetEqual(
+            IdempotencyKey.objects.values_list("key", flat=True),
+            ["attempt-2"],
+        )
+
+
+class SeatHoldTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        self.client.force_authenticate(self.user)
+
+    def hold_seat(self, seat: int = 1) -> Response:
+        return self.client.post(
+            reverse("railway:hold-list"),
+            {"trip": self.trip.id, "cargo": 1, "seat": seat},
+            format="json",
+        )
+
+    def order_seat(self, seat: int = 1) -> Response:
+        return self.client.post(
+            reverse("railway:order-list"),
+            {"tickets": [{"trip": self.trip.id, "cargo": 1, "seat": seat}]},
+            format="json",
+        )
+
+    def expire_holds(self) -> None:
+        SeatHold.objects.update(expires_at=timezone.now())
+
+    def test_held_seat_is_taken_for_others(self) -> None:
+        response = self.hold_seat()
+        self.client.force_authenticate(self.other_user)
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.hold_seat().status_code, 400)
+        order_response = self.order_seat()
+        self.assertEqual(order_response.status_code, 400)
+        self.assertEqual(
+            order_response.data["tickets"],
+            [
+                f"Seat 1 in cargo 1 of trip {self.trip.id} "
+                f"is held by another user"
+            ],
+        )
+        detail = self.client.get(
+            reverse("railway:trip-detail", args=[self.trip.id])
+        )
+        self.assertEqual(detail.data["tickets_available"], 5)
+        self.assertEqual(
+            detail.data["taken_places"], [{"cargo": 1, "seat": 1}]
+        )
+
+    def test_order_of_holder_takes_over_the_hold(self) -> None:
+        self.hold_seat()
+
+        response = self.order_seat()
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_expired_hold_frees_the_seat(self) -> None:
+        self.hold_seat()
+        self.expire_holds()
+        self.client.force_authenticate(self.other_user)
+
+        detail = self.client.get(
+            reverse("railway:trip-detail", args=[self.trip.id])
+        )
+        self.assertEqual(detail.data["tickets_available"], 6)
+        self.assertEqual(self.hold_seat().status_code, 201)
+        self.assertEqual(
+            list(SeatHold.objects.values_list("user", flat=True)),
+            [self.other_user.id],
+        )
+
+    def test_sold_seat_can_not_be_held(self) -> None:
+        self.order_seat()
+
+        response = self.hold_seat()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["seat"], ["This seat is already taken"]
+        )
+
+    def test_active_holds_are_limited(self) -> None:
+        with mock.patch.object(settings, "SEAT_HOLD_LIMIT", 2):
+            responses = [self.hold_seat(seat) for seat in (1, 2, 3)]
+
+        self.assertEqual(
+            [response.status_code for response in responses], [201, 201, 400]
+        )
+
+    def test_sweeper_releases_expired_holds_only(self) -> None:
+        self.hold_seat(1)
+        self.expire_holds()
+        self.hold_seat(2)
+
+        call_command("release_expired_holds", stdout=StringIO())
+
+        self.assertQuerySetEqual(
+            SeatHold.objects.values_list("seat", flat=True), [2]
+        )
+
+
+class RouteDailyLoadTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        order = Order.objects.create(user=self.user)
+        for seat in (1, 2):
+            Ticket.objects.create(
+                order=order, trip=self.trip, cargo=1, seat=seat
+            )
+
+    def get_loads(self) -> list[tuple]:
+        return list(
+            RouteDailyLoad.objects
+            .order_by("route", "date")
+            .values_list(
+                "route", "date", "trips_count", "seats_offered", "tickets_sold"
+            )
+        )
+
+    def test_trips_and_tickets_are_counted(self) -> None:
+        self.create_trip(get_time(12), get_time(14), train=self.other_train)
+
+        self.assertEqual(
+            self.get_loads(), [(self.route.id, START.date(), 2, 12, 2)]
+        )
+
+    def test_moved_trip_takes_its_load_along(self) -> None:
+        response = self.client.patch(
+            reverse("railway:trip-detail", args=[self.trip.id]),
+            {
+                "route": self.return_route.id,
+                "departure_time": get_time(8, days=1),
+                "arrival_time": get_time(10, days=1),
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        next_day = get_time(0, days=1).date()
+        self.assertEqual(
+            self.get_loads(),
+            [
+                (self.route.id, START.date(), 0, 0, 0),
+                (self.return_route.id, next_day, 1, 6, 2),
+            ],
+        )
+
+    def test_deleted_trip_and_tickets_are_subtracted(self) -> None:
+        Ticket.objects.filter(seat=2).delete()
+        self.assertEqual(
+            self.get_loads(), [(self.route.id, START.date(), 1, 6, 1)]
+        )
+
+        response = self.client.delete(
+            reverse("railway:trip-detail", args=[self.trip.id])
+        )
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            self.get_loads(), [(self.route.id, START.date(), 0, 0, 0)]
+        )
+
+    def test_train_capacity_change_updates_seats(self) -> None:
+        self.train.places_in_cargo = 5
+        self.train.save()
+
+        self.assertEqual(
+            self.get_loads(), [(self.route.id, START.date(), 1, 10, 2)]
+        )
+
+    def test_rebuild_matches_loads_after_cancellation(self) -> None:
+        self.create_trip(get_time(12), get_time(14), train=self.other_train)
+        self.client.post(
+            reverse("railway:trip-cancel-bookings", args=[self.trip.id])
+        )
+        loads = self.get_loads()
+
+        call_command("rebuild_route_loads", stdout=StringIO())
+
+        self.assertEqual(loads, [(self.route.id, START.date(), 1, 6, 0)])
+        self.assertEqual(self.get_loads(), loads)
+
+    def test_load_factors_are_filtered_by_routes(self) -> None:
+        self.create_trip(
+            get_time(12), get_time(14), route=self.return_route
+        )
+
+        response = self.client.get(
+            reverse("railway:load_factor-list"),
+            {
+                "date_from": START.date(),
+                "date_to": START.date(),
+                "routes": f"{self.return_route.id}",
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (load["route"], load["tickets_sold"], load["load_factor"])
+                for load in response.data
+            ],
+            [(self.return_route.id, 0, 0.0)],
+        )
+
+    def test_malformed_routes_are_rejected(self) -> None:
+        response = self.client.get(
+            reverse("railway:load_factor-list"),
+            {
+                "date_from": START.date(),
+                "date_to": START.date(),
+                "routes": "1,a",
+            },
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("routes", response.data)
+
+
+class ConditionalGetTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        self.url = reverse("railway:trip-detail", args=[self.trip.id])
+        self.etag = self.client.get(self.url)["ETag"]
+
+    def get_status(self, if_none_match: str) -> int:
+        return self.client.get(
+            self.url, headers={"If-None-Match": if_none_match}
+        ).status_code
+
+    def test_matching_etag_is_not_modified(self) -> None:
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                self.url, headers={"If-None-Match": self.etag}
+            )
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], self.etag)
+        self.assertFalse(response.content)
+
+    def test_lists_wildcard_and_weak_etags_match(self) -> None:
+        self.assertEqual(self.get_status(f'"other", {self.etag}'), 304)
+        self.assertEqual(self.get_status(f"W/{self.etag}"), 304)
+        self.assertEqual(self.get_status("*"), 304)
+        self.assertEqual(self.get_status('"other"'), 200)
+
+    def test_write_changes_etag(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                self.url, {"arrival_time": get_time(11)}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.get_status(self.etag), 200)
+
+    def test_expired_hold_changes_etag(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            SeatHold.objects.create(
+                trip=self.trip,
+                user=self.user,
+                cargo=1,
+                seat=1,
+                expires_at=timezone.now() + timedelta(minutes=5),
+            )
+        etag = self.client.get(self.url)["ETag"]
+
+        SeatHold.objects.update(expires_at=timezone.now())
+
+        self.assertNotEqual(etag, self.etag)
+        self.assertEqual(self.get_status(etag), 200)
+
+    def test_expired_hold_changes_last_modified(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            SeatHold.objects.create(
+                trip=self.trip,
+                user=self.user,
+                cargo=1,
+                seat=1,
+                expires_at=timezone.now() + timedelta(minutes=5),
+            )
+        ResourceVersion.objects.update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        last_modified = self.client.get(self.url)["Last-Modified"]
+
+        SeatHold.objects.update(expires_at=timezone.now())
+        response = self.client.get(
+            self.url, headers={"If-Modified-Since": last_modified}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["taken_places"], [])
+        self.assertGreater(
+            parse_http_date(response["Last-Modified"]),
+            parse_http_date(last_modified),
+        )
+
+    def test_unchanged_list_is_not_modified_since(self) -> None:
+        url = reverse("railway:station-list")
+        with self.captureOnCommitCallbacks(execute=True):
+            Station.objects.create(name="Odesa", latitude=46, longitude=30)
+        last_modified = self.client.get(url)["Last-Modified"]
+
+        response = self.client.get(
+            url, headers={"If-Modified-Since": last_modified}
+        )
+
+        self.assertEqual(response.status_code, 304)
+
+
+class SparseFieldsTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(
+            get_time(8), get_time(10), crews=(self.crew,)
+        )
+        self.detail_url = reverse("railway:trip-detail", args=[self.trip.id])
+
+    def test_fields_limit_list_and_its_queries(self) -> None:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse("railway:trip-list"), {"fields": "id,train_name"}
+            )
+
+        self.assertEqual(
+            response.json(), [{"id": self.trip.id, "train_name": "Train 1"}]
+        )
+        sql = " ".join(query["sql"] for query in context.captured_queries)
+        self.assertNotIn("railway_ticket", sql)
+        self.assertNotIn("railway_station", sql)
+
+    def test_nested_fields_are_expanded_by_default(self) -> None:
+        data = self.client.get(self.detail_url).json()
+
+        self.assertEqual(data["route"]["source"]["name"], "Kyiv")
+        self.assertEqual(data["train"]["name"], "Train 1")
+        self.assertEqual(data["crews"], ["Crew 1"])
+
+    def test_expand_collapses_unlisted_nested_fields(self) -> None:
+        collapsed = self.client.get(self.detail_url, {"expand": ""}).json()
+        expanded = self.client.get(
+            self.detail_url, {"expand": "route"}
+        ).json()
+
+        self.assertEqual(
+            (collapsed["route"], collapsed["train"]),
+            (self.route.id, self.train.id),
+        )
+        self.assertEqual(
+            expanded["route"]["source"]["name"], self.kyiv.name
+        )
+        self.assertEqual(expanded["train"], self.train.id)
+
+    def test_fields_and_expand_of_route_detail(self) -> None:
+        response = self.client.get(
+            reverse("railway:routes-detail", args=[self.route.id]),
+            {"fields": "id,source", "expand": ""},
+        )
+
+        self.assertEqual(
+            response.json(), {"id": self.route.id, "source": "Kyiv"}
+        )
+
+    def test_writes_ignore_fields(self) -> None:
+        response = self.client.patch(
+            f"{self.detail_url}?fields=id",
+            {"arrival_time": get_time(11)},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertIn("arrival_time", response.data)
+
+
+@mock.patch.object(settings, "DATABASE_REPLICAS", ["replica_0"])
+@mock.patch(
+    "Railway_Service_API.db_routers.random.choice", return_value="default"
+)
+class ReplicaReadTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        self.client.force_authenticate(self.user)
+
+    def order_seat(self) -> None:
+        response = self.client.post(
+            reverse("railway:order-list"),
+            {"tickets": [{"trip": self.trip.id, "cargo": 1, "seat": 1}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_lists_are_read_from_replica(self, choice: mock.Mock) -> None:
+        self.client.get(reverse("railway:order-list"))
+
+        choice.assert_called_with(["replica_0"])
+
+    def test_writer_is_pinned_to_primary(self, choice: mock.Mock) -> None:
+        self.order_seat()
+        choice.reset_mock()
+
+        self.client.get(reverse("railway:order-list"))
+
+        choice.assert_not_called()
+
+    def test_pin_belongs_to_writer(self, choice: mock.Mock) -> None:
+        self.order_seat()
+        choice.reset_mock()
+        self.client.force_authenticate(self.other_user)
+
+        self.client.get(reverse("railway:order-list"))
+
+        choice.assert_called_with(["replica_0"])
+
+
+class ArchiveTripsTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        departure_time = timezone.now() - timedelta(days=100)
+        self.old_trip = self.create_trip(
+            departure_time,
+            departure_time + timedelta(hours=2),
+            crews=(self.crew,),
+        )
+        self.recent_trip = self.create_trip(get_time(8), get_time(10))
+        self.order = Order.objects.create(user=self.user)
+        self.ticket = Ticket.objects.create(
+            order=self.order, trip=self.old_trip, cargo=1, seat=1
+        )
+        SeatHold.objects.create(
+            trip=self.old_trip,
+            user=self.other_user,
+            cargo=1,
+            seat=2,
+            expires_at=timezone.now(),
+        )
+
+    def test_departed_trips_are_moved_to_archive(self) -> None:
+        loads = list(RouteDailyLoad.objects.values_list("tickets_sold"))
+        out = StringIO()
+
+        call_command("archive_trips", batch_size=1, stdout=out)
+
+        self.assertIn("Archived 1 trips and 1 tickets", out.getvalue())
+        self.assertEqual(
+            list(Trip.objects.values_list("id", flat=True)),
+            [self.recent_trip.id],
+        )
+        self.assertFalse(Ticket.objects.exists())
+        self.assertFalse(SeatHold.objects.exists())
+        archived_trip = ArchivedTrip.objects.get()
+        self.assertEqual(archived_trip.id, self.old_trip.id)
+        self.assertEqual(list(archived_trip.crews.all()), [self.crew])
+        self.assertEqual(
+            list(ArchivedTicket.objects.values_list("id", "order")),
+            [(self.ticket.id, self.order.id)],
+        )
+        self.assertEqual(
+            list(RouteDailyLoad.objects.values_list("tickets_sold")), loads
+        )
+
+
+class AdminChangelistTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.admin_client = Client()
+        self.admin_client.force_login(
+            get_user_model().objects.create_superuser(
+                username="root", password="root12345"
+            )
+        )
+        self.rows = 0
+
+    def add_rows(self, count: int) -> None:
+        """Add a trip, an order and a ticket, current and archived"""
+        for day in range(self.rows, self.rows + count):
+            order = Order.objects.create(user=self.user)
+            trip = self.create_trip(
+                get_time(8, days=day), get_time(10, days=day)
+            )
+            Ticket.objects.create(order=order, trip=trip, cargo=1, seat=1)
+            archived_trip = ArchivedTrip.objects.create(
+                id=1000 + day,
+                route=self.route,
+                train=self.train,
+                departure_time=get_time(8, days=day - 100),
+                arrival_time=get_time(10, days=day - 100),
+            )
+            ArchivedTicket.objects.create(
+                id=1000 + day,
+                order=order,
+                trip=archived_trip,
+                cargo=1,
+                seat=1,
+            )
+        self.rows += count
+
+    def count_queries(self, url: str) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.admin_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self) -> None:
+        urls = {
+            name: reverse(f"admin:railway_{name}_changelist")
+            for name in (
+                "trip", "order", "ticket", "archivedtrip", "archivedticket"
+            )
+        }
+        self.add_rows(1)
+        counts = {name: self.count_queries(url) for name, url in urls.items()}
+
+        self.add_rows(6)
+
+        for name, url in urls.items():
+            with self.subTest(name):
+                self.assertEqual(self.count_queries(url), counts[name])
+
+    def test_search_matches_whole_names(self) -> None:
+        self.add_rows(1)
+        url = reverse("admin:railway_order_changelist")
+
+        matches = self.admin_client.get(url, {"q": self.user.username})
+        prefix_matches = self.admin_client.get(url, {"q": "us"})
+
+        self.assertEqual(matches.context["cl"].result_count, 1)
+        self.assertEqual(prefix_matches.context["cl"].result_count, 0)
+
+
+class OrderHistoryTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        self.client.force_authenticate(self.user)
+        self.orders = []
+        for seat in (1, 2, 3):
+            ticket = {"trip": self.trip.id, "cargo": 1, "seat": seat}
+            response = self.client.post(
+                reverse("railway:order-list"),
+                {"tickets": [ticket]},
+                format="json",
+            )
+            order = Order.objects.get(id=response.data["id"])
+            Order.objects.filter(id=order.id).update(
+                created_at=get_time(seat)
+            )
+            self.orders.append(order)
+        Order.objects.create(user=self.other_user)
+
+    def get_history(self, **params) -> Response:
+        return self.client.get(
+            reverse("railway:order-list"), {"view": "history", **params}
+        )
+
+    def test_history_shows_tickets_as_booked(self) -> None:
+        self.train.name = "Renamed train"
+        self.train.save()
+        self.kyiv.name = "Renamed station"
+        self.kyiv.save()
+        ticket = self.orders[0].tickets.get()
+
+        response = self.get_history()
+
+        self.assertEqual(response.status_code, 200)
+        order = response.data["results"][-1]
+        self.assertEqual(
+            set(order), {"id", "created_at", "cancelled_at", "summary"}
+        )
+        self.assertEqual(
+            [
+                (
+                    item["id"],
+                    item["trip"],
+                    item["cargo"],
+                    item["seat"],
+                    item["departure_station"],
+                    item["arrival_station"],
+                    item["train_name"],
+                )
+                for item in order["summary"]
+            ],
+            [(ticket.id, self.trip.id, 1, 1, "Kyiv", "Lviv", "Train 1")],
+        )
+
+    def test_history_is_paginated_newest_first(self) -> None:
+        with mock.patch.object(OrderPagination, "page_size", 2):
+            first_page = self.get_history()
+            second_page = self.get_history(page=2)
+
+        self.assertEqual(first_page.data["count"], 3)
+        self.assertEqual(
+            [order["id"] for order in first_page.data["results"]],
+            [self.orders[2].id, self.orders[1].id],
+        )
+        self.assertIsNone(second_page.data["next"])
+        self.assertEqual(
+            [order["id"] for order in second_page.data["results"]],
+            [self.orders[0].id],
+        )
+
+
+class OrderSummaryBackfillTest(RailwayTestCase):
+    migration = import_module("railway.migrations.0012_order_summary")
+
+    def test_summaries_are_built_from_current_and_archived_tickets(
+            self
+    ) -> None:
+        trip = self.create_trip(get_time(8), get_time(10))
+        archived_trip = ArchivedTrip.objects.create(
+            id=1000,
+            route=self.return_route,
+            train=self.other_train,
+            departure_time=get_time(8, days=-100),
+            arrival_time=get_time(10, days=-100),
+        )
+        order, other_order, empty_order = (
+            Order.objects.create(user=user)
+            for user in (self.user, self.other_user, self.user)
+        )
+        tickets = [
+            Ticket.objects.create(order=order, trip=trip, cargo=2, seat=1),
+            Ticket.objects.create(order=order, trip=trip, cargo=1, seat=3),
+            Ticket.objects.create(
+                order=other_order, trip=trip, cargo=1, seat=1
+            ),
+        ]
+        archived_ticket = ArchivedTicket.objects.create(
+            id=1000, order=order, trip=archived_trip, cargo=1, seat=2
+        )
+
+        with mock.patch.object(self.migration, "BATCH_SIZE", 1):
+            self.migration.build_order_summaries(apps, None)
+
+        summaries = {
+            order.id: [
+                (item["id"], item["departure_station"], item["train_name"])
+                for item in order.summary
+            ]
+            for order in Order.objects.all()
+        }
+        self.assertEqual(
+            summaries,
+            {
+                order.id: [
+                    (tickets[1].id, "Kyiv", "Train 1"),
+                    (tickets[0].id, "Kyiv", "Train 1"),
+                    (archived_ticket.id, "Lviv", "Train 2"),
+                ],
+                other_order.id: [(tickets[2].id, "Kyiv", "Train 1")],
+                empty_order.id: [],
+            },
+        )
+
+
+class TripAvailabilityTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        self.other_trip = self.create_trip(
+            get_time(8), get_time(10), train=self.other_train
+        )
+        order = Order.objects.create(user=self.user)
+        for cargo, seat in ((1, 1), (1, 2), (2, 1)):
+            Ticket.objects.create(
+                order=order, trip=self.trip, cargo=cargo, seat=seat
+            )
+        for seat, minutes in ((3, 5), (2, -5)):
+            SeatHold.objects.create(
+                trip=self.trip,
+                user=self.other_user,
+                cargo=2,
+                seat=seat,
+                expires_at=timezone.now() + timedelta(minutes=minutes),
+            )
+
+    def get_availability(self, **data) -> dict:
+        response = self.client.post(
+            reverse("railway:trip-availability"),
+            {"ids": [self.trip.id, self.other_trip.id, 9999], **data},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.json()
+
+    def test_sold_and_active_held_seats_are_taken(self) -> None:
+        self.assertEqual(
+            self.get_availability(),
+            {str(self.trip.id): 2, str(self.other_trip.id): 6},
+        )
+
+    def test_availability_by_cargo(self) -> None:
+        self.assertEqual(
+            self.get_availability(by_cargo=True),
+            {
+                str(self.trip.id): {
+                    "tickets_available": 2,
+                    "cargos": {"1": 1, "2": 1},
+                },
+                str(self.other_trip.id): {
+                    "tickets_available": 6,
+                    "cargos": {"1": 3, "2": 3},
+                },
+            },
+        )
+
+
+class FareTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.train_type = self.train.train_type
+        for distance_from, price in ((0, "10.00"), (300, "25.00")):
+            Fare.objects.create(
+                train_type=self.train_type,
+                distance_from=distance_from,
+                price=price,
+            )
+        self.other_train_type = TrainType.objects.create(name="Regional")
+        Fare.objects.create(
+            train_type=self.other_train_type, distance_from=100, price="5.00"
+        )
+        fare_table.invalidate()
+        self.addCleanup(fare_table.invalidate)
+        self.trip = self.create_trip(get_time(8), get_time(10))
+
+    def test_price_comes_from_band_containing_distance(self) -> None:
+        for train_type, distance, price in (
+            (self.train_type, 0, Decimal("10.00")),
+            (self.train_type, 299, Decimal("10.00")),
+            (self.train_type, 300, Decimal("25.00")),
+            (self.train_type, 5000, Decimal("25.00")),
+            (self.other_train_type, 99, None),
+            (self.other_train_type, 100, Decimal("5.00")),
+            (TrainType.objects.create(name="Night"), 300, None),
+        ):
+            with self.subTest(train_type=train_type.name, distance=distance):
+                self.assertEqual(
+                    fare_table.get_price(train_type.id, distance), price
+                )
+
+    def test_trips_show_their_fare(self) -> None:
+        self.train.train_type = self.other_train_type
+        self.train.save()
+        self.other_train.train_type = TrainType.objects.create(name="Night")
+        self.other_train.save()
+        other_trip = self.create_trip(
+            get_time(8), get_time(10), train=self.other_train
+        )
+
+        fares = {
+            trip["id"]: trip["fare"]
+            for trip in self.client.get(reverse("railway:trip-list")).data
+        }
+        detail = self.client.get(
+            reverse("railway:trip-detail", args=[self.trip.id])
+        )
+
+        self.assertEqual(fares, {self.trip.id: "5.00", other_trip.id: None})
+        self.assertEqual(detail.data["fare"], "5.00")
+
+    def test_order_stores_ticket_price(self) -> None:
+        self.client.force_authenticate(self.user)
+
+        response = self.client.post(
+            reverse("railway:order-list"),
+            {"tickets": [{"trip": self.trip.id, "cargo": 1, "seat": 1}]},
+            format="json",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Fare.objects.filter(distance_from=300).update(price="30.00")
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Ticket.objects.get().price, Decimal("25.00"))
+
+    def test_fare_changes_reload_table(self) -> None:
+        self.assertEqual(
+            fare_table.get_price(self.train_type.id, 450), Decimal("25.00")
+        )
+        fare = Fare.objects.get(distance_from=300)
+        fare.price = "30.00"
+        with self.captureOnCommitCallbacks(execute=True):
+            fare.save()
+        self.assertEqual(
+            fare_table.get_price(self.train_type.id, 450), Decimal("30.00")
+        )
+
+        # Changes of other processes only bump the version
+        with self.captureOnCommitCallbacks(execute=True):
+            Fare.objects.filter(distance_from=300).update(price="35.00")
+            ResourceVersion.bump([ResourceVersion.get_key(Fare)])
+        self.assertEqual(
+            fare_table.get_price(self.train_type.id, 450), Decimal("30.00")
+        )
+        with mock.patch.object(settings, "FARE_TABLE_CHECK_SECONDS", 0):
+            self.assertEqual(
+                fare_table.get_price(self.train_type.id, 450),
+                Decimal("35.00"),
+            )
+
+
+class SeatEventBrokerTest(TestCase):
+    def setUp(self) -> None:
+        self.broker = SeatEventBroker()
+        self.broker._backend = mock.Mock(max_message_size=None)
+        self.places = [{"cargo": 1, "seat": seat} for seat in range(1, 21)]
+
+    def get_messages(self) -> list[str]:
+        messages = []
+        for publish_call in self.broker._backend.publish.call_args_list:
+            trip_id, message = publish_call.args
+            self.assertEqual(trip_id, 1)
+            messages.append(message)
+        return messages
+
+    @staticmethod
+    def get_places(message: str) -> list[dict]:
+        return json.loads(message.split("data: ", 1)[1])
+
+    def test_event_is_published_at_once(self) -> None:
+        self.broker.publish(1, "taken", self.places)
+
+        self.assertEqual(
+            list(map(self.get_places, self.get_messages())), [self.places]
+        )
+
+    def test_long_event_is_split_to_fit_backend(self) -> None:
+        self.broker._backend.max_message_size = 200
+
+        self.broker.publish(1, "taken", self.places)
+
+        messages = self.get_messages()
+        self.assertGreater(len(messages), 1)
+        self.assertEqual(sum(map(self.get_places, messages), []), self.places)
+        for message in messages:
+            self.assertTrue(message.startswith("event: taken\n"))
+            self.assertLessEqual(len(message.encode()), 200)
+
+
+class SeatStreamAuthTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        self.other_trip = self.create_trip(
+            get_time(12), get_time(14), train=self.other_train
+        )
+
+    def open_stream(self, **kwargs) -> int:
+        response = Client().get(
+            reverse("railway:trip-seats-stream", args=[self.trip.id]),
+            **kwargs,
+        )
+        return response.status_code
+
+    def test_stream_token_opens_stream_of_its_trip(self) -> None:
+        self.client.force_authenticate(self.user)
+
+        response = self.client.post(
+            reverse("railway:trip-stream-token", args=[self.trip.id])
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            self.open_stream(data={"token": response.data["token"]}), 200
+        )
+
+    def test_access_token_is_accepted_in_header_only(self) -> None:
+        access_token = str(AccessToken.for_user(self.user))
+
+        self.assertEqual(
+            self.open_stream(HTTP_AUTHORIZATION=f"Bearer {access_token}"),
+            200,
+        )
+        self.assertEqual(self.open_stream(data={"token": access_token}), 401)
+
+    def test_stream_rejects_tokens_of_other_trips_and_expired(self) -> None:
+        expired_token = SeatStreamToken.for_trip(self.user, self.trip.id)
+        expired_token.set_exp(lifetime=-timedelta(seconds=1))
+        tokens = {
+            "other trip": SeatStreamToken.for_trip(
+                self.user, self.other_trip.id
+            ),
+            "expired": expired_token,
+        }
+
+        for name, token in tokens.items():
+            with self.subTest(name):
+                self.assertEqual(
+                    self.open_stream(data={"token": str(token)}), 401
+                )
+
+
+class TimetableSearchTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trips = [
+            self.create_trip(get_time(hours), get_time(hours + 2))
+            for hours in (8, 12)
+        ]
+        self.create_trip(
+            get_time(16), get_time(18), route=self.return_route
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(
+            settings, "TIMETABLE_SNAPSHOT_DIR", Path(directory.name)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        build_timetable(settings.TIMETABLE_SNAPSHOT_DIR)
+
+    def search(self) -> tuple[list[int], str]:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse("railway:trip-list"), {"route": self.route.id}
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        sql = " ".join(query["sql"] for query in context.captured_queries)
+        return [trip["id"] for trip in response.json()], sql
+
+    def test_search_filters_by_ids_from_timetable(self) -> None:
+        trip_ids, sql = self.search()
+
+        self.assertEqual(trip_ids, [trip.id for trip in self.trips])
+        self.assertIn('"railway_trip"."id" IN', sql)
+
+    @mock.patch.object(settings, "TIMETABLE_SEARCH_MAX_IDS", 1)
+    def test_many_hits_fall_back_to_orm(self) -> None:
+        trip_ids, sql = self.search()
+
+        self.assertEqual(trip_ids, [trip.id for trip in self.trips])
+        self.assertNotIn('"railway_trip"."id" IN', sql)
+
+
+class OrderCreateTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        Ticket.objects.create(
+            order=Order.objects.create(user=self.other_user),
+            trip=self.trip,
+            cargo=1,
+            seat=1,
+        )
+        self.client.force_authenticate(self.user)
+
+    def post_order(self, *seats: tuple[int, int]) -> Response:
+        return self.client.post(
+            reverse("railway:order-list"),
+            {
+                "tickets": [
+                    {"trip": self.trip.id, "cargo": cargo, "seat": seat}
+                    for cargo, seat in seats
+                ]
+            },
+            format="json",
+        )
+
+    def test_taken_seats_reject_whole_order(self) -> None:
+        response = self.post_order((1, 2), (1, 1), (2, 3), (2, 3))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["tickets"],
+            [
+                f"Seat 1 in cargo 1 of trip {self.trip.id} is already taken",
+                f"Seat 3 in cargo 2 of trip {self.trip.id} is already taken",
+            ],
+        )
+        self.assertFalse(self.user.orders.exists())
+        self.assertEqual(Ticket.objects.count(), 1)
+        self.assertEqual(RouteDailyLoad.objects.get().tickets_sold, 1)
+
+    def test_order_takes_over_own_holds(self) -> None:
+        for user, seat in ((self.user, 2), (self.user, 3), (self.admin, 1)):
+            SeatHold.objects.create(
+                trip=self.trip,
+                user=user,
+                cargo=2,
+                seat=seat,
+                expires_at=timezone.now() + timedelta(minutes=5),
+            )
+
+        response = self.post_order((2, 2))
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            sorted(SeatHold.objects.values_list("user", "seat")),
+            [(self.admin.id, 1), (self.user.id, 3)],
+        )
+        self.assertEqual(RouteDailyLoad.objects.get().tickets_sold, 2)
+        self.assertEqual(
+            [
+                (item["cargo"], item["seat"], item["train_name"])
+                for item in Order.objects.get(user=self.user).summary
+            ],
+            [(2, 2, "Train 1")],
+        )
+
+
+class PrecompiledSchemaTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        build_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(build_dir.cleanup)
+        cls.build_dir = Path(build_dir.name)
+        build_schema(cls.build_dir)
+
+    def setUp(self) -> None:
+        PrecompiledSchemaView.cache.clear()
+        patcher = mock.patch.object(
+            settings, "SCHEMA_BUILD_DIR", self.build_dir
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_schema(self, **headers) -> HttpResponse:
+        return self.client.get(reverse("schema"), headers=headers)
+
+    def test_encodings_have_their_own_etags(self) -> None:
+        compressed = self.get_schema(accept_encoding="gzip")
+        identity = self.get_schema()
+
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(
+            gzip.decompress(compressed.content), identity.content
+        )
+        self.assertNotIn("Content-Encoding", identity)
+        self.assertTrue(identity.content.startswith(b"openapi"))
+        self.assertNotEqual(compressed["ETag"], identity["ETag"])
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+
+    def test_gzip_follows_q_values(self) -> None:
+        for accept_encoding, encoding in (
+            ("gzip;q=0", None),
+            ("gzip; q=0, *", None),
+            ("br, gzip;q=0.5", "gzip"),
+            ("*", "gzip"),
+            ("*;q=0", None),
+            ("identity", None),
+        ):
+            with self.subTest(accept_encoding):
+                response = self.get_schema(accept_encoding=accept_encoding)
+
+                self.assertEqual(response.get("Content-Encoding"), encoding)
+
+    def test_if_none_match_compares_whole_etags(self) -> None:
+        etag = self.get_schema()["ETag"]
+        compressed_etag = self.get_schema(accept_encoding="gzip")["ETag"]
+
+        for if_none_match, accept_encoding, status in (
+            (f'"other", {etag}', "", 304),
+            (f"W/{etag}", "", 304),
+            ("*", "", 304),
+            (etag, "gzip", 200),
+            (compressed_etag, "", 200),
+            (compressed_etag, "gzip", 304),
+            (f'{etag[:-1]}-other"', "", 200),
+        ):
+            with self.subTest(if_none_match, encoding=accept_encoding):
+                response = self.get_schema(
+                    if_none_match=if_none_match,
+                    accept_encoding=accept_encoding,
+                )
+
+                self.assertEqual(response.status_code, status)
+
+
+@mock.patch("Railway_Service_API.tracing.get_exporter")
+class TracingMiddlewareTest(TestCase):
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    parent_id = "b7ad6b7169203331"
+
+    def setUp(self) -> None:
+        self.request = RequestFactory().get(
+            "/api/v1/railway/stations/",
+            headers={
+                "traceparent": f"00-{self.trace_id}-{self.parent_id}-01"
+            },
+        )
+
+    def assert_traced(
+            self, response: HttpResponse, get_exporter: mock.Mock
+    ) -> None:
+        spans = get_exporter.return_value.export.call_args.args[0]
+        root, query = spans
+        self.assertEqual(
+            (root.trace_id, root.parent_id), (self.trace_id, self.parent_id)
+        )
+        self.assertEqual(
+            response["traceparent"], f"00-{self.trace_id}-{root.span_id}-01"
+        )
+        self.assertEqual(root.attributes["http.status_code"], 200)
+        self.assertEqual(
+            (query.name, query.parent_id), ("db.query", root.span_id)
+        )
+
+    def test_sync_request_is_traced(self, get_exporter: mock.Mock) -> None:
+        def get_response(request: HttpRequest) -> HttpResponse:
+            Station.objects.count()
+            return HttpResponse()
+
+        middleware = TracingMiddleware(get_response)
+
+        response = middleware(self.request)
+
+        self.assertFalse(iscoroutinefunction(middleware))
+        self.assert_traced(response, get_exporter)
+
+    def test_async_request_is_traced(self, get_exporter: mock.Mock) -> None:
+        async def get_response(request: HttpRequest) -> HttpResponse:
+            await Station.objects.acount()
+            return HttpResponse()
+
+        middleware = TracingMiddleware(get_response)
+
+        response = async_to_sync(middleware)(self.request)
+
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assert_traced(response, get_exporter)
+
+    def test_unsampled_request_is_not_traced(
+            self, get_exporter: mock.Mock
+    ) -> None:
+        middleware = TracingMiddleware(lambda request: HttpResponse())
+        self.request.META["HTTP_TRACEPARENT"] = (
+            f"00-{self.trace_id}-{self.parent_id}-00"
+        )
+
+        response = middleware(self.request)
+
+        self.assertNotIn("traceparent", response)
+        get_exporter.assert_not_called()
+
+
+class ProfilingTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(
+            settings, "PROFILING_DIR", Path(directory.name)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def get_trips(self, user) -> HttpResponse:
+        return self.client.get(
+            reverse("railway:trip-list"),
+            headers={
+                "Authorization": f"Bearer {AccessToken.for_user(user)}",
+                settings.PROFILING_HEADER: "1",
+            },
+        )
+
+    def test_staff_request_is_profiled(self) -> None:
+        name = self.get_trips(self.admin)["X-Profile-Name"]
+        self.client.force_authenticate(self.admin)
+
+        profiles = self.client.get(reverse("profile-list")).json()
+        response = self.client.get(reverse("profile-detail", args=[name]))
+
+        self.assertIn("-TripViewSet-list-", name)
+        self.assertEqual([profile["name"] for profile in profiles], [name])
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_requests_are_not_profiled(self) -> None:
+        self.assertNotIn("X-Profile-Name", self.get_trips(self.user))
+
+    def test_missing_profile_is_not_found(self) -> None:
+        self.client.force_authenticate(self.admin)
+
+        response = self.client.get(
+            reverse(
+                "profile-detail",
+                args=["20300107T060000-TripViewSet-list-1ms-0123abcd.prof"],
+            )
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+    @mock.patch.object(settings, "PROFILING_SAMPLE_RATE", 1)
+    def test_async_request_passes_through(self) -> None:
+        async def get_response(request: HttpRequest) -> HttpResponse:
+            return HttpResponse()
+
+        middleware = ProfilingMiddleware(get_response)
+
+        response = async_to_sync(middleware)(RequestFactory().get("/"))
+
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Name", response)
+
+
+class BatchTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        self.client.force_authenticate(self.user)
+
+    def post_batch(self, *urls: str, **data) -> Response:
+        return self.client.post(
+            reverse("batch"),
+            {"requests": [{"url": url} for url in urls], **data},
+            format="json",
+        )
+
+    def test_sub_requests_are_answered_in_order(self) -> None:
+        response = self.post_batch(
+            reverse("railway:trip-detail", args=[self.trip.id]),
+            reverse("user:manage_user"),
+            reverse("railway:trip-detail", args=[9999]),
+            reverse("profile-list"),
+            "/missing/",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        results = response.json()["responses"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            [200, 200, 404, 400, 404],
+        )
+        self.assertEqual(results[0]["body"]["id"], self.trip.id)
+        self.assertEqual(results[1]["body"]["username"], "user")
+
+    def test_sub_request_etag_is_not_modified(self) -> None:
+        url = reverse("railway:station-list")
+        etag = self.post_batch(url).json()["responses"][0]["etag"]
+
+        response = self.client.post(
+            reverse("batch"),
+            {"requests": [{"url": url, "etag": etag}]},
+            format="json",
+        )
+
+        self.assertEqual(response.json()["responses"][0]["status"], 304)
+
+    def test_file_responses_are_rejected_and_closed(self) -> None:
+        url = reverse("railway:gtfs-feed")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        feed_files = []
+
+        def open_feed(*args, **kwargs):
+            feed_files.append(open(*args, **kwargs))
+            return feed_files[-1]
+
+        with mock.patch.object(
+            settings, "GTFS_EXPORT_DIR", Path(directory.name)
+        ):
+            build_gtfs(settings.GTFS_EXPORT_DIR)
+            for headers in ({}, {"Range": "bytes=0-9"}):
+                with self.subTest(headers):
+                    feed_files.clear()
+
+                    with mock.patch("railway.gtfs.open", open_feed):
+                        response = self.client.post(
+                            reverse("batch"),
+                            {"requests": [{"url": url}]},
+                            format="json",
+                            headers=headers,
+                        )
+
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(
+                        response.json()["responses"][0]["status"], 400
+                    )
+                    self.assertEqual(len(feed_files), 1)
+                    self.assertTrue(feed_files[0].closed)
+
+    @mock.patch.dict(UserRateThrottle.THROTTLE_RATES, {"user": "3/day"})
+    def test_sub_requests_count_against_user_rate(self) -> None:
+        url = reverse("railway:station-list")
+
+        responses = [
+            self.post_batch(url, url),
+            self.post_batch(url, url),
+            self.client.get(url),
+            self.client.get(url),
+        ]
+
+        self.assertEqual(
+            [response.status_code for response in responses],
+            [200, 429, 200, 429],
+        )
+
+
+class ForecastingTest(TestCase):
+    now = 100 * DAY_SECONDS
+
+    def test_curves_average_trips_of_group(self) -> None:
+        departure = self.now - 10 * DAY_SECONDS
+        trips = np.array(
+            [
+                (1, 7, departure, 4),
+                (2, 7, departure, 4),
+                (3, 8, departure, 2),
+            ],
+            dtype=TRIP_DTYPE,
+        )
+        tickets = np.array(
+            [
+                (1, departure - 3 * DAY_SECONDS),
+                (1, departure - DAY_SECONDS - 100),
+                (1, departure - 100),
+                (2, departure - DAY_SECONDS),
+                (4, departure - DAY_SECONDS),
+            ],
+            dtype=TICKET_DTYPE,
+        )
+
+        groups, curves, counts = fit_booking_curves(trips, tickets, 2)
+
+        np.testing.assert_array_equal(groups, [7, 8])
+        np.testing.assert_allclose(curves, [[0.5, 0.375, 0.125], [0, 0, 0]])
+        np.testing.assert_array_equal(counts, [2, 1])
+
+    def test_sellouts_follow_pickup_of_curve(self) -> None:
+        trips = np.array(
+            [
+                (1, 7, self.now + DAY_SECONDS, 4),
+                (2, 7, self.now + DAY_SECONDS, 4),
+                (3, 9, self.now + 2 * DAY_SECONDS + 3600, 4),
+            ],
+            dtype=TRIP_DTYPE,
+        )
+
+        sellout_at, load_factors, history_trips = project_sellouts(
+            trips,
+            np.array([2, 3, 4]),
+            self.now,
+            np.array([7]),
+            np.array([[0.5, 0.25, 0]]),
+            np.array([4]),
+            2,
+        )
+
+        np.testing.assert_array_equal(
+            sellout_at, [-1, self.now + DAY_SECONDS, self.now + 3600]
+        )
+        np.testing.assert_allclose(load_factors, [0.75, 1, 1])
+        np.testing.assert_array_equal(history_trips, [4, 4, 0])
+
+
+class TripForecastViewTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trips = [
+            self.create_trip(get_time(8), get_time(10), route=route)
+            for route in (self.route, self.return_route)
+        ]
+        for trip in self.trips:
+            TripForecast.objects.create(
+                trip=trip,
+                tickets_sold=0,
+                projected_load_factor=0.5,
+                history_trips=1,
+                computed_at=timezone.now(),
+            )
+
+    def get_forecasts(self, routes: str) -> Response:
+        return self.client.get(
+            reverse("railway:forecast-list"),
+            {
+                "date_from": START.date(),
+                "date_to": START.date(),
+                "routes": routes,
+            },
+        )
+
+    def test_forecasts_are_filtered_by_routes(self) -> None:
+        response = self.get_forecasts(f"{self.return_route.id}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [forecast["trip"] for forecast in response.data],
+            [self.trips[1].id],
+        )
+
+    def test_malformed_routes_are_rejected(self) -> None:
+        response = self.get_forecasts("a")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("routes", response.data)
+
+
+class GtfsFeedTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.create_trip(get_time(8), get_time(10))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(
+            settings, "GTFS_EXPORT_DIR", Path(directory.name)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.etag = build_gtfs(settings.GTFS_EXPORT_DIR)[0]["etag"]
+        self.client = APIClient()
+        self.url = reverse("railway:gtfs-feed")
+
+    def get_feed(self, **headers) -> HttpResponse:
+        return self.client.get(
+            self.url, headers={"Accept": "application/zip", **headers}
+        )
+
+    def test_feed_is_public(self) -> None:
+        response = self.get_feed()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], self.etag)
+        feed = b"".join(response.streaming_content)
+        self.assertTrue(zipfile.is_zipfile(BytesIO(feed)))
+
+    def test_matching_etag_is_not_modified(self) -> None:
+        for if_none_match in (self.etag, f'"other", W/{self.etag}', "*"):
+            with self.subTest(if_none_match):
+                response = self.get_feed(**{"If-None-Match": if_none_match})
+
+                self.assertEqual(response.status_code, 304)
+
+    def test_range_is_partial_content(self) -> None:
+        feed = b"".join(self.get_feed().streaming_content)
+
+        response = self.get_feed(Range="bytes=10-19")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), feed[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(feed)}")
+
+    def test_unsatisfiable_ranges_are_rejected(self) -> None:
+        for byte_range in ("bytes=-0", "bytes=9999999-", "bytes=5-1"):
+            with self.subTest(byte_range):
+                response = self.get_feed(Range=byte_range)
+
+                self.assertEqual(response.status_code, 416)
+
+
+class TripCancellationTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.trip = self.create_trip(get_time(8), get_time(10))
+        self.order = Order.objects.create(user=self.user)
+        for seat in (1, 2):
+            Ticket.objects.create(
+                order=self.order, trip=self.trip, cargo=1, seat=seat
+            )
+        SeatHold.objects.create(
+            trip=self.trip,
+            user=self.other_user,
+            cargo=2,
+            seat=1,
+            expires_at=timezone.now() + timedelta(minutes=5),
+        )
+
+    def cancel(self, trip: Trip) -> Response:
+        return self.client.post(
+            reverse("railway:trip-cancel-bookings", args=[trip.id])
+        )
+
+    def test_cancel_releases_seats_and_load(self) -> None:
+        response = self.cancel(self.trip)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            response.data,
+            {"cancelled_orders": [self.order.id], "released_tickets": 2},
+        )
+        self.trip.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertIsNotNone(self.trip.cancelled_at)
+        self.assertIsNotNone(self.order.cancelled_at)
+        self.assertFalse(Ticket.objects.exists())
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(
+            list(
+                RouteDailyLoad.objects.values_list(
+                    "trips_count", "seats_offered", "tickets_sold"
+                )
+            ),
+            [(0, 0, 0)],
+        )
+
+    def test_cancelled_trip_is_hidden_and_not_bookable(self) -> None:
+        self.cancel(self.trip)
+        self.client.force_authenticate(self.user)
+        seat = {"trip": self.trip.id, "cargo": 1, "seat": 3}
+
+        trips = self.client.get(reverse("railway:trip-list")).json()
+        availability = self.client.post(
+            reverse("railway:trip-availability"),
+            {"ids": [self.trip.id]},
+            format="json",
+        )
+        order = self.client.post(
+            reverse("railway:order-list"), {"tickets": [seat]}, format="json"
+        )
+        hold = self.client.post(
+            reverse("railway:hold-list"), seat, format="json"
+        )
+
+        self.assertEqual(trips, [])
+        self.assertEqual(availability.json(), {})
+        self.assertEqual(
+            order.data["tickets"][0]["trip"], ["The trip is cancelled"]
+        )
+        self.assertEqual(hold.data["trip"], ["The trip is cancelled"])
+
+    def test_departed_and_cancelled_trips_are_rejected(self) -> None:
+        departed_trip = self.create_trip(
+            timezone.now() - timedelta(hours=1),
+            timezone.now() + timedelta(hours=1),
+            train=self.other_train,
+        )
+        self.cancel(self.trip)
+
+        for trip, message in (
+            (departed_trip, "Departed trips can't be cancelled"),
+            (self.trip, "The trip is already cancelled"),
+        ):
+            with self.subTest(message):
+                response = self.cancel(trip)
+
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data["trip"], message)
+        departed_trip.refresh_from_db()
+        self.assertIsNone(departed_trip.cancelled_at)
+
+    def test_cancelled_trip_frees_its_train(self) -> None:
+        self.cancel(self.trip)
+
+        response = self.post_trip(
+            departure_time=get_time(8), arrival_time=get_time(10)
+        )
+
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_admin_delete_releases_seats(self) -> None:
+        OrderAdmin(Order, admin.site).delete_queryset(
+            RequestFactory().post("/"), Order.objects.filter(id=self.order.id)
+        )
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(RouteDailyLoad.objects.get().tickets_sold, 0)
+
+
+class TripDelayTest(RailwayTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.first_trip = self.create_trip(get_time(8), get_time(10))
+        self.second_trip = self.create_trip(
+            get_time(10.5),
+            get_time(12.5),
+            route=self.return_route,
+            crews=(self.crew,),
+        )
+        self.last_trip = self.create_trip(get_time(20), get_time(22))
+
+    def delay(self, trip: Trip, delay_minutes: int) -> Response:
+        return self.client.post(
+            reverse("railway:trip-delay", args=[trip.id]),
+            {"delay_minutes": delay_minutes},
+            format="json",
+        )
+
+    def get_loads(self) -> list[tuple]:
+        return list(
+            RouteDailyLoad.objects.order_by("route_id", "date").values_list(
+                "route_id", "date", "trips_count", "tickets_sold"
+            )
+        )
+
+    def test_delay_moves_trips_until_slack_absorbs_it(self) -> None:
+        response = self.delay(self.first_trip, 30)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [(trip["id"], trip["shift"]) for trip in response.data["trips"]],
+            [
+                (self.first_trip.id, "00:30:00"),
+                (self.second_trip.id, "00:20:00"),
+            ],
+        )
+        for trip, departure_time in (
+            (self.first_trip, get_time(8.5)),
+            (self.second_trip, get_time(10.5 + 20 / 60)),
+            (self.last_trip, get_time(20)),
+        ):
+            trip.refresh_from_db()
+            self.assertEqual(trip.departure_time, departure_time)
+        self.assertEqual(response.data["train_conflicts"], [])
+
+    def test_short_turnaround_passes_delay_on_unchanged(self) -> None:
+        third_trip = self.create_trip(get_time(12.75), get_time(14.75))
+
+        response = self.delay(self.second_trip, 1)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [(trip["id"], trip["shift"]) for trip in response.data["trips"]],
+            [
+                (self.second_trip.id, "00:01:00"),
+                (third_trip.id, "00:01:00"),
+            ],
+        )
+        third_trip.refresh_from_db()
+        self.assertEqual(third_trip.departure_time, get_time(12.75 + 1 / 60))
+
+    def test_delay_moves_load_to_next_day(self) -> None:
+        trip = self.create_trip(
+            get_time(23), get_time(25), train=self.other_train
+        )
+        Ticket.objects.create(
+            order=Order.objects.create(user=self.user),
+            trip=trip,
+            cargo=1,
+            seat=1,
+        )
+        day = get_time(0).date()
+        next_day = get_time(0, days=1).date()
+
+        response = self.delay(trip, 90)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            self.get_loads(),
+            [
+                (self.route.id, day, 2, 0),
+                (self.route.id, next_day, 1, 1),
+                (self.return_route.id, day, 1, 0),
+            ],
+        )
+
+    def test_delay_reports_crew_conflicts(self) -> None:
+        self.create_trip(
+            get_time(12.75),
+            get_time(14),
+            train=self.other_train,
+            crews=(self.crew,),
+        )
+
+        response = self.delay(self.first_trip, 30)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [
+                (conflict["crew"], conflict["trip"])
+                for conflict in response.data["crew_conflicts"]
+            ],
+            [(self.crew.id, self.second_trip.id)],
+        )
+
+    def test_invalid_delays_are_rejected(self) -> None:
+        self.client.post(
+            reverse("railway:trip-cancel-bookings", args=[self.last_trip.id])
+        )
+
+        zero_delay = self.delay(self.first_trip, 0)
+        cancelled_delay = self.delay(self.last_trip, 30)
+        self.client.force_authenticate(self.user)
+        user_delay = self.delay(self.first_trip, 30)
+
+        self.assertEqual(zero_delay.status_code, 400)
+        self.assertEqual(cancelled_delay.status_code, 400)
+        self.assertEqual(
+            cancelled_delay.data["trip"], "Cancelled trips can't be delayed"
+        )
+        self.assertEqual(user_delay.status_code, 403)
+        self.first_trip.refresh_from_db()
+        self.assertEqual(self.first_trip.departure_time, get_time(8))
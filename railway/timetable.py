@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from Railway_Service_API import settings
+from Railway_Service_API.schema import read_manifest, write_atomically
+from railway.models import ResourceVersion, Route, Trip
+
+MANIFEST_NAME = "manifest.json"
+
+TIMETABLE_DTYPE = np.dtype(
+    [
+        ("id", "<i8"),
+        ("route", "<i8"),
+        ("source", "<i8"),
+        ("destination", "<i8"),
+        ("departure", "<i8"),
+        ("arrival", "<i8"),
+        ("train", "<i8"),
+    ]
+)
+
+VERSION_MODELS = (Trip, Route)
+
+
+def get_current_versions() -> dict[str, int]:
+    keys = [ResourceVersion.get_key(model) for model in VERSION_MODELS]
+    versions = dict(
+        ResourceVersion.objects
+        .filter(key__in=keys)
+        .values_list("key", "version")
+    )
+    return {key: versions.get(key, 0) for key in keys}
+
+
+def build_timetable(directory: Path) -> dict:
+    """Write all trips, sorted by departure, into a new ``.npy`` file.
+
+    The manifest naming the current file is replaced last, so workers
+    switch to the new file atomically, and mappings of the previous
+    file stay valid after it is unlinked.
+    """
+    versions = get_current_versions()
+    trips = (
+        Trip.objects
+        .active()
+        .order_by("departure_time", "id")
+        .values_list(
+            "id",
+            "route_id",
+            "route__source_id",
+            "route__destination_id",
+            "departure_time",
+            "arrival_time",
+            "train_id",
+        )
+    )
+    timetable = np.fromiter(
+        (
+            (
+                trip_id,
+                route_id,
+                source_id,
+                destination_id,
+                int(departure_time.timestamp()),
+                int(arrival_time.timestamp()),
+                train_id,
+            )
+            for (
+                trip_id,
+                route_id,
+                source_id,
+                destination_id,
+                departure_time,
+                arrival_time,
+                train_id,
+            ) in trips.iterator(chunk_size=10000)
+        ),
+        dtype=TIMETABLE_DTYPE,
+    )
+    directory.mkdir(parents=True, exist_ok=True)
+    file_name = f"timetable-{uuid.uuid4().hex}.npy"
+    np.save(directory / file_name, timetable)
+    manifest = {
+        "file": file_name,
+        "versions": versions,
+        "trips": len(timetable),
+    }
+    write_atomically(
+        directory / MANIFEST_NAME, json.dumps(manifest).encode()
+    )
+    for path in directory.glob("timetable-*.npy"):
+        if path.name != file_name:
+            path.unlink(missing_ok=True)
+    return manifest
+
+
+def is_stale(manifest: dict | None) -> bool:
+    return not manifest or manifest["versions"] != get_current_versions()
+
+
+class TimetableSnapshot:
+    """Read-only memory map of the timetable of this process.
+
+    All workers map the same file, so they share one copy of it in the
+    page cache. The manifest is checked with a ``stat`` call per search
+    and the file is remapped once a rebuild has replaced it.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.manifest_stat = None
+        self.manifest = None
+        self.timetable = None
+
+    def load(self) -> None:
+        directory = settings.TIMETABLE_SNAPSHOT_DIR
+        try:
+            stat = os.stat(directory / MANIFEST_NAME)
+        except OSError:
+            self.manifest = self.timetable = self.manifest_stat = None
+            return
+        manifest_stat = (stat.st_ino, stat.st_mtime_ns)
+        if manifest_stat == self.manifest_stat:
+            return
+        with self.lock:
+            manifest = read_manifest(directory)
+            try:
+                timetable = np.load(
+                    directory / manifest["file"], mmap_mode="r"
+                )
+            except (OSError, ValueError, KeyError, TypeError):
+                manifest = timetable = None
+            self.manifest, self.timetable = manifest, timetable
+            self.manifest_stat = manifest_stat
+
+    def get_fresh(self) -> np.ndarray | None:
+        """Return the timetable if no trip or route changed since its build"""
+        self.load()
+        if self.timetable is None or is_stale(self.manifest):
+            return None
+        return self.timetable
+
+
+timetable_snapshot = TimetableSnapshot()
+
+
+def search_trips(
+        timetable: np.ndarray,
+        route: int | None = None,
+        train: int | None = None,
+        source: int | None = None,
+        destination: int | None = None,
+        departure_from: datetime | None = None,
+        departure_to: datetime | None = None,
+) -> np.ndarray:
+    """Return ids of the trips matching all given filters"""
+    start, end = 0, len(timetable)
+    departures = timetable["departure"]
+    if departure_from is not None:
+        start = np.searchsorted(
+            departures, int(departure_from.timestamp()), side="left"
+        )
+    if departure_to is not None:
+        end = np.searchsorted(
+            departures, int(departure_to.timestamp()), side="left"
+        )
+    trips = timetable[start:end]
+    mask = np.ones(len(trips), dtype=bool)
+    for column, value in (
+        ("route", route),
+        ("train", train),
+        ("source", source),
+        ("destination", destination),
+    ):
+        if value is not None:
+            mask &= trips[column] == value
+    return trips["id"][mask]
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from railway.gtfs import GtfsFeedView
 from railway.views import (
     OrderViewSet,
     TrainTypeViewSet,
@@ -8,7 +9,11 @@ from railway.views import (
     CrewViewSet,
     StationViewSet,
     RouteViewSet,
-    TripViewSet
+    TripViewSet,
+    SeatHoldViewSet,
+    RouteDailyLoadViewSet,
+    TripForecastViewSet,
+    trip_seats_stream,
 )
 
 app_name = "railway"
@@ -22,5 +27,18 @@ router.register("stations", StationViewSet, basename="station")
 router.register("routes", RouteViewSet, basename="routes")
 router.register("trips", TripViewSet, basename="trip")
 router.register("orders", OrderViewSet, basename="order")
+router.register("holds", SeatHoldViewSet, basename="hold")
+router.register(
+    "load_factors", RouteDailyLoadViewSet, basename="load_factor"
+)
+router.register("forecasts", TripForecastViewSet, basename="forecast")
 
-urlpatterns = [path("", include(router.urls))]
+urlpatterns = [
+    path("gtfs.zip", GtfsFeedView.as_view(), name="gtfs-feed"),
+    path(
+        "trips/<int:pk>/seats/stream/",
+        trip_seats_stream,
+        name="trip-seats-stream",
+    ),
+    path("", include(router.urls)),
+]
@@ -1,24 +1,59 @@
-from django.db.models import QuerySet, F, Count
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Max, Min, QuerySet, Prefetch
+from django.db.models.functions import Now
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiParameter,
     OpenApiExample
 )
 from rest_framework import viewsets, mixins
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.serializers import ModelSerializer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
 
 from railway.models import (
     TrainType,
     Train, Crew,
+    Fare,
     Station,
     Route,
     Trip,
-    Order
+    Order,
+    IdempotencyKey,
+    SeatHold,
+    RouteDailyLoad,
+    TripForecast,
+    Ticket,
+    ResourceVersion,
+)
+from Railway_Service_API import settings
+from Railway_Service_API.tracing import TracedViewMixin
+from railway.mixins import (
+    ConditionalGetMixin,
+    ReplicaReadMixin,
+    SparseFieldsMixin,
 )
+from railway.cancellations import cancel_order, cancel_trip_bookings
 from railway.paginations import OrderPagination
+from railway.scheduling import (
+    find_crew_conflicts,
+    get_train_rotations,
+    propagate_delay,
+)
+from railway.streams import SeatStreamToken, stream_seat_events
+from railway.timetable import search_trips, timetable_snapshot
 from railway.serializers import (
     TrainTypeSerializer,
     TrainSerializer,
@@ -30,22 +65,158 @@ from railway.serializers import (
     TripListSerializer,
     TripDetailSerializer,
     OrderSerializer,
+    OrderHistorySerializer,
     OrderCreateSerializer,
+    DateRangeSerializer,
+    RouteFilterSerializer,
+    TripAvailabilitySerializer,
+    TripSearchSerializer,
+    CrewConflictSerializer,
+    TrainRotationSerializer,
+    SeatHoldSerializer,
+    RouteDailyLoadSerializer,
+    TripForecastSerializer,
+    CancellationSerializer,
+    SeatStreamTokenSerializer,
+    TripDelaySerializer,
+    DelayResultSerializer,
+)
+
+
+def get_period(request: Request) -> tuple[datetime, datetime]:
+    serializer = DateRangeSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    start = timezone.make_aware(
+        datetime.combine(serializer.validated_data["date_from"], time.min)
+    )
+    end = timezone.make_aware(
+        datetime.combine(serializer.validated_data["date_to"], time.min)
+    ) + timedelta(days=1)
+    return start, end
+
+
+def get_route_ids(request: Request) -> list[int] | None:
+    """Return ids of the comma-separated ``?routes=`` parameter"""
+    serializer = RouteFilterSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data.get("routes", None)
+
+
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        name="fields",
+        type=str,
+        location=OpenApiParameter.QUERY,
+        description="Comma-separated fields to include in the response",
+        required=False,
+        examples=[
+            OpenApiExample(
+                name="fields",
+                value="id,departure_time,tickets_available"
+            )
+        ]
+    ),
+    OpenApiParameter(
+        name="expand",
+        type=str,
+        location=OpenApiParameter.QUERY,
+        description="Comma-separated nested fields to render in full. "
+                    "Other nested fields are rendered as ids or names",
+        required=False,
+        examples=[
+            OpenApiExample(
+                name="expand",
+                value="route"
+            )
+        ]
+    ),
+]
+
+
+DATE_RANGE_PARAMETERS = [
+    OpenApiParameter(
+        name="date_from",
+        type=OpenApiTypes.DATE,
+        location=OpenApiParameter.QUERY,
+        description="First day of the period",
+        required=True,
+        examples=[
+            OpenApiExample(
+                name="date_from",
+                value="2026-06-01"
+            )
+        ]
+    ),
+    OpenApiParameter(
+        name="date_to",
+        type=OpenApiTypes.DATE,
+        location=OpenApiParameter.QUERY,
+        description="Last day of the period",
+        required=True,
+        examples=[
+            OpenApiExample(
+                name="date_to",
+                value="2026-08-31"
+            )
+        ]
+    ),
+]
+
+
+ROUTES_PARAMETER = OpenApiParameter(
+    name="routes",
+    type=str,
+    location=OpenApiParameter.QUERY,
+    description="Filter by comma-separated ids of the routes",
+    required=False,
+    examples=[
+        OpenApiExample(
+            name="routes",
+            value="1,4"
+        )
+    ]
 )
 
 
-class TrainTypeViewSet(viewsets.ModelViewSet):
+TRIP_SEARCH_LOOKUPS = {
+    "route": "route_id",
+    "train": "train_id",
+    "source": "route__source_id",
+    "destination": "route__destination_id",
+    "departure_from": "departure_time__gte",
+    "departure_to": "departure_time__lt",
+}
+
+
+class TrainTypeViewSet(
+    TracedViewMixin,
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    viewsets.ModelViewSet
+):
     queryset = TrainType.objects.all()
     serializer_class = TrainTypeSerializer
+    version_models = (TrainType,)
 
 
-class TrainViewSet(viewsets.ModelViewSet):
+class TrainViewSet(
+    TracedViewMixin,
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    viewsets.ModelViewSet
+):
     queryset = Train.objects.all()
     serializer_class = TrainSerializer
+    version_models = (Train, TrainType)
+    replica_actions = ("list", "retrieve", "rotations")
 
     def get_queryset(self) -> QuerySet:
-        queryset = self.queryset
-        if self.action in ("list", "retrieve"):
+        queryset = self.queryset.all()
+        if (
+            self.action in ("list", "retrieve")
+            and self.is_field_requested("train_type")
+        ):
             queryset = queryset.select_related("train_type")
         train_name = self.request.query_params.get("name", None)
         if train_name:
@@ -72,18 +243,67 @@ class TrainViewSet(viewsets.ModelViewSet):
     def list(self, request: Request, *args, **kwargs) -> Response:
         return super().list(request, *args, **kwargs)
 
+    @extend_schema(
+        parameters=DATE_RANGE_PARAMETERS,
+        responses=TrainRotationSerializer(many=True),
+    )
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="rotations",
+        permission_classes=(IsAdminUser,),
+    )
+    def rotations(self, request: Request) -> Response:
+        """Return the ordered trip chain of every train in a period"""
+        start, end = get_period(request)
+        serializer = TrainRotationSerializer(
+            get_train_rotations(start, end), many=True
+        )
+        return Response(serializer.data)
+
 
-class CrewViewSet(viewsets.ModelViewSet):
+class CrewViewSet(
+    TracedViewMixin,
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    viewsets.ModelViewSet
+):
     queryset = Crew.objects.all()
     serializer_class = CrewSerializer
+    version_models = (Crew,)
+    replica_actions = ("list", "retrieve", "conflicts")
 
+    @extend_schema(
+        parameters=DATE_RANGE_PARAMETERS,
+        responses=CrewConflictSerializer(many=True),
+    )
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="conflicts",
+        permission_classes=(IsAdminUser,),
+    )
+    def conflicts(self, request: Request) -> Response:
+        """Report crews assigned to overlapping trips in a period"""
+        start, end = get_period(request)
+        serializer = CrewConflictSerializer(
+            find_crew_conflicts(start, end), many=True
+        )
+        return Response(serializer.data)
 
-class StationViewSet(viewsets.ModelViewSet):
+
+class StationViewSet(
+    TracedViewMixin,
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    viewsets.ModelViewSet
+):
     queryset = Station.objects.all()
     serializer_class = StationSerializer
+    version_models = (Station,)
 
     def get_queryset(self) -> QuerySet:
-        queryset = self.queryset
+        queryset = self.queryset.all()
         station_name = self.request.query_params.get("name", None)
         if station_name:
             queryset = queryset.filter(name__icontains=station_name)
@@ -110,14 +330,23 @@ class StationViewSet(viewsets.ModelViewSet):
         return super().list(request, *args, **kwargs)
 
 
-class RouteViewSet(viewsets.ModelViewSet):
+class RouteViewSet(
+    TracedViewMixin,
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    viewsets.ModelViewSet
+):
     queryset = Route.objects.all()
     serializer_class = RouteListSerializer
+    version_models = (Route, Station)
 
     def get_queryset(self) -> QuerySet:
-        queryset = self.queryset
+        queryset = self.queryset.all()
         if self.action in ("list", "retrieve"):
-            queryset = queryset.select_related("source", "destination")
+            for station in ("source", "destination"):
+                if self.is_field_requested(station):
+                    queryset = queryset.select_related(station)
         return queryset
 
     def get_serializer_class(self) -> ModelSerializer:
@@ -127,35 +356,125 @@ class RouteViewSet(viewsets.ModelViewSet):
         return serializer_class
 
 
-class TripViewSet(viewsets.ModelViewSet):
-    queryset = (
-        Trip.objects.all()
-        .annotate(
-            tickets_available=F("train__cargo_num")
-            * F("train__places_in_cargo")
-            - Count("tickets")
-        )
-    )
+class TripViewSet(
+    TracedViewMixin,
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    viewsets.ModelViewSet
+):
+    queryset = Trip.objects.all()
     serializer_class = TripSerializer
+    version_models = (
+        Trip, Ticket, SeatHold, Route, Station, Train, TrainType, Fare, Crew
+    )
+    replica_actions = ("list", "retrieve", "availability")
 
-    def get_queryset(self) -> QuerySet:
-        queryset = self.queryset
-        if self.action == "list":
-            queryset = queryset.select_related("route", "train")
-        elif self.action == "retrieve":
-            queryset = (
-                queryset.
-                select_related("route", "train").
-                prefetch_related("crews")
+    def get_version_keys(self) -> list[str]:
+        if self.action != "retrieve":
+            return super().get_version_keys()
+        return [
+            ResourceVersion.get_key(Trip, self.kwargs["pk"]),
+            *(
+                ResourceVersion.get_key(model)
+                for model in (Route, Station, Train, TrainType, Fare, Crew)
+            ),
+        ]
+
+    def get_unversioned_state(self) -> tuple[str, datetime | None]:
+        """Return when the next active seat hold of the trips expires.
+
+        Lapsing holds free seats without a write, so the ETag changes
+        once the next one expires, even before the sweeper removes it.
+        The last lapsed hold the sweeper left dates Last-Modified;
+        removing it bumps the SeatHold version.
+        """
+        holds = SeatHold.objects.all()
+        trip_id = self.kwargs.get("pk", None)
+        if self.action == "retrieve" and str(trip_id).isdigit():
+            holds = holds.filter(trip_id=trip_id)
+        next_expiry = holds.filter(expires_at__gt=Now()).aggregate(
+            next_expiry=Min("expires_at")
+        )
+        last_expiry = holds.filter(expires_at__lte=Now()).aggregate(
+            last_expiry=Max("expires_at")
+        )
+        return str(next_expiry["next_expiry"]), last_expiry["last_expiry"]
+
+    def get_list_queryset(self, queryset: QuerySet) -> QuerySet:
+        queryset = queryset.active()
+        if self.is_field_requested("departure_station"):
+            queryset = queryset.select_related("route__source")
+        if self.is_field_requested("arrival_station"):
+            queryset = queryset.select_related("route__destination")
+        if (
+            self.is_field_requested("train_name")
+            or self.is_field_requested("train_capacity")
+        ):
+            queryset = queryset.select_related("train")
+        if self.is_field_requested("fare"):
+            queryset = queryset.select_related("train", "route")
+        return queryset
+
+    def get_retrieve_queryset(self, queryset: QuerySet) -> QuerySet:
+        if self.is_field_expanded("route"):
+            queryset = queryset.select_related(
+                "route__source", "route__destination"
+            )
+        if self.is_field_expanded("train"):
+            queryset = queryset.select_related("train__train_type")
+        if self.is_field_requested("fare"):
+            queryset = queryset.select_related("train", "route")
+        if self.is_field_requested("crews"):
+            queryset = queryset.prefetch_related("crews")
+        if self.is_field_requested("taken_places"):
+            queryset = queryset.prefetch_related(
+                "tickets",
+                Prefetch(
+                    "holds",
+                    queryset=SeatHold.objects.filter(expires_at__gt=Now())
+                ),
             )
-        route_id = self.request.query_params.get("route", None)
-        train_id = self.request.query_params.get("train", None)
-        if route_id:
-            queryset = queryset.filter(route_id=int(route_id))
-        if train_id:
-            queryset = queryset.filter(train_id=int(train_id))
         return queryset
 
+    def get_queryset(self) -> QuerySet:
+        queryset = self.queryset.all()
+        if self.action in ("list", "retrieve"):
+            if self.is_field_requested("tickets_available"):
+                queryset = queryset.with_tickets_available()
+            if self.action == "list":
+                queryset = self.get_list_queryset(queryset)
+            else:
+                queryset = self.get_retrieve_queryset(queryset)
+        return self.search(queryset)
+
+    def search(self, queryset: QuerySet) -> QuerySet:
+        """Filter trips by the search query parameters.
+
+        While the timetable snapshot is fresh, the list is filtered by
+        vectorized scans of it. Other actions, a stale snapshot and
+        searches matching more than TIMETABLE_SEARCH_MAX_IDS trips fall
+        back to the ORM, so the ids never make an unbounded IN list.
+        """
+        serializer = TripSearchSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = serializer.validated_data
+        if not filters:
+            return queryset
+        if self.action == "list":
+            timetable = timetable_snapshot.get_fresh()
+            if timetable is not None:
+                trip_ids = search_trips(timetable, **filters)
+                if len(trip_ids) <= settings.TIMETABLE_SEARCH_MAX_IDS:
+                    return queryset.filter(id__in=trip_ids.tolist())
+        return queryset.filter(
+            **{
+                lookup: filters[name]
+                for name, lookup in TRIP_SEARCH_LOOKUPS.items()
+                if name in filters
+            }
+        )
+
     def get_serializer_class(self) -> ModelSerializer:
         serializer_class = self.serializer_class
         if self.action == "list":
@@ -191,14 +510,205 @@ class TripViewSet(viewsets.ModelViewSet):
                         value=7
                     )
                 ]
-            )
+            ),
+            OpenApiParameter(
+                name="source",
+                type=int,
+                location=OpenApiParameter.QUERY,
+                description="Filter by id of the departure station",
+                required=False,
+                examples=[
+                    OpenApiExample(
+                        name="source",
+                        value=2
+                    )
+                ]
+            ),
+            OpenApiParameter(
+                name="destination",
+                type=int,
+                location=OpenApiParameter.QUERY,
+                description="Filter by id of the arrival station",
+                required=False,
+                examples=[
+                    OpenApiExample(
+                        name="destination",
+                        value=5
+                    )
+                ]
+            ),
+            OpenApiParameter(
+                name="departure_from",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description="Filter by trips departing at or after "
+                            "this time",
+                required=False,
+                examples=[
+                    OpenApiExample(
+                        name="departure_from",
+                        value="2026-03-01T06:00:00Z"
+                    )
+                ]
+            ),
+            OpenApiParameter(
+                name="departure_to",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description="Filter by trips departing before this time",
+                required=False,
+                examples=[
+                    OpenApiExample(
+                        name="departure_to",
+                        value="2026-03-02T06:00:00Z"
+                    )
+                ]
+            ),
+            *SPARSE_FIELDS_PARAMETERS,
         ]
     )
     def list(self, request: Request, *args, **kwargs) -> Response:
         return super().list(request, *args, **kwargs)
 
+    @extend_schema(parameters=SPARSE_FIELDS_PARAMETERS)
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        return super().retrieve(request, *args, **kwargs)
+
+    @extend_schema(
+        request=TripAvailabilitySerializer,
+        responses=OpenApiTypes.OBJECT,
+        examples=[
+            OpenApiExample(
+                name="availability",
+                value={"ids": [4, 7], "by_cargo": False},
+                request_only=True,
+            ),
+            OpenApiExample(
+                name="tickets available",
+                value={"4": 118, "7": 0},
+                response_only=True,
+            ),
+            OpenApiExample(
+                name="tickets available by cargo",
+                value={
+                    "4": {
+                        "tickets_available": 118,
+                        "cargos": {"1": 58, "2": 60},
+                    }
+                },
+                response_only=True,
+            ),
+        ],
+    )
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="availability",
+        permission_classes=(IsAuthenticated,),
+    )
+    def availability(self, request: Request) -> Response:
+        """Return available tickets of many trips, keyed by trip id.
+
+        Unknown and cancelled trip ids are left out of the response.
+        """
+        serializer = TripAvailabilitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        trips = Trip.objects.active().filter(
+            id__in=serializer.validated_data["ids"]
+        )
+        if not serializer.validated_data["by_cargo"]:
+            return Response(
+                dict(
+                    trips.with_tickets_available().values_list(
+                        "id", "tickets_available"
+                    )
+                )
+            )
+        taken_seats = trips.get_taken_seats_by_cargo()
+        availability = {}
+        for trip_id, cargo_num, places_in_cargo in trips.values_list(
+            "id", "train__cargo_num", "train__places_in_cargo"
+        ):
+            cargos = {
+                cargo: places_in_cargo - taken_seats[(trip_id, cargo)]
+                for cargo in range(1, cargo_num + 1)
+            }
+            availability[trip_id] = {
+                "tickets_available": sum(cargos.values()),
+                "cargos": cargos,
+            }
+        return Response(availability)
+
+    @extend_schema(
+        request=TripDelaySerializer, responses=DelayResultSerializer
+    )
+    @action(
+        detail=True,
+        methods=["POST"],
+        url_path="delay",
+        permission_classes=(IsAdminUser,),
+    )
+    def delay(self, request: Request, pk: int = None) -> Response:
+        """Delay a trip and shift the later trips of its train.
+
+        Later trips move by what their turnaround time beyond
+        TRAIN_TURNAROUND_BUFFER doesn't absorb. Crew and train conflicts
+        of the moved trips are reported, not resolved.
+        """
+        serializer = TripDelaySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = propagate_delay(
+            self.get_object(),
+            timedelta(minutes=serializer.validated_data["delay_minutes"]),
+            ValidationError,
+        )
+        return Response(DelayResultSerializer(result).data)
+
+    @extend_schema(request=None, responses=CancellationSerializer)
+    @action(
+        detail=True,
+        methods=["POST"],
+        url_path="cancel_bookings",
+        permission_classes=(IsAdminUser,),
+    )
+    def cancel_bookings(self, request: Request, pk: int = None) -> Response:
+        """Cancel a trip that has not departed and release its seats.
+
+        All its tickets and holds are released, and orders left without
+        tickets are cancelled.
+        """
+        cancelled_orders, released_tickets = cancel_trip_bookings(
+            self.get_object(), ValidationError
+        )
+        serializer = CancellationSerializer(
+            {
+                "cancelled_orders": cancelled_orders,
+                "released_tickets": released_tickets,
+            }
+        )
+        return Response(serializer.data)
+
+    @extend_schema(request=None, responses=SeatStreamTokenSerializer)
+    @action(
+        detail=True,
+        methods=["POST"],
+        url_path="seats/stream_token",
+        permission_classes=(IsAuthenticated,),
+    )
+    def stream_token(self, request: Request, pk: int = None) -> Response:
+        """Issue a token for ``?token=`` of the seat stream of the trip.
+
+        It opens that stream only and expires in
+        SEAT_STREAM_TOKEN_LIFETIME.
+        """
+        token = SeatStreamToken.for_trip(request.user, self.get_object().id)
+        return Response(SeatStreamTokenSerializer({"token": str(token)}).data)
+
 
 class OrderViewSet(
+    TracedViewMixin,
+    ReplicaReadMixin,
+    SparseFieldsMixin,
     viewsets.GenericViewSet,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
@@ -211,18 +721,278 @@ class OrderViewSet(
     def perform_create(self, serializer: ModelSerializer) -> None:
         serializer.save(user=self.request.user)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="Idempotency-Key",
+                type=str,
+                location=OpenApiParameter.HEADER,
+                description="Unique key of the order attempt. Retries "
+                            "with the same key and body return the "
+                            "stored response",
+                required=False,
+            )
+        ]
+    )
+    def create(self, request: Request, *args, **kwargs) -> Response:
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            raise ValidationError(
+                {"Idempotency-Key": "Idempotency-Key is too long"}
+            )
+        request_hash = IdempotencyKey.get_request_hash(request.data)
+        with transaction.atomic():
+            # The key is inserted before the order, so a concurrent retry
+            # waits on its row until this request commits, then replays
+            # the stored response
+            idempotency_key, created = (
+                IdempotencyKey.objects
+                .select_for_update()
+                .get_or_create(
+                    user=request.user,
+                    key=key,
+                    defaults={"request_hash": request_hash},
+                )
+            )
+            if not created and idempotency_key.created_at >= (
+                timezone.now() - settings.IDEMPOTENCY_KEY_TTL
+            ):
+                if idempotency_key.request_hash != request_hash:
+                    raise ValidationError(
+                        {
+                            "Idempotency-Key": "Idempotency-Key was "
+                            "already used with another request body"
+                        }
+                    )
+                return Response(
+                    idempotency_key.response_body,
+                    status=idempotency_key.response_status,
+                    headers={"Idempotent-Replayed": "true"},
+                )
+            response = super().create(request, *args, **kwargs)
+            idempotency_key.request_hash = request_hash
+            idempotency_key.response_status = response.status_code
+            idempotency_key.response_body = response.data
+            idempotency_key.created_at = timezone.now()
+            idempotency_key.save()
+        return response
+
+    def is_history_view(self) -> bool:
+        return (
+            self.action == "list"
+            and self.request.query_params.get("view", None) == "history"
+        )
+
     def get_queryset(self) -> QuerySet:
         queryset = self.queryset.filter(user=self.request.user)
-        if self.action in ("list", "retrieve"):
-            queryset = queryset.prefetch_related(
-                "tickets__trip__route__source",
-                "tickets__trip__route__destination",
-                "tickets__trip__train",
+        if self.is_history_view():
+            return queryset.only(
+                "id", "created_at", "cancelled_at", "summary"
             )
+        if self.action in ("list", "retrieve"):
+            if self.is_field_expanded("tickets"):
+                queryset = queryset.prefetch_related(
+                    "tickets__trip__route__source",
+                    "tickets__trip__route__destination",
+                    "tickets__trip__train",
+                    "archived_tickets__trip__route__source",
+                    "archived_tickets__trip__route__destination",
+                    "archived_tickets__trip__train",
+                )
+            elif self.is_field_requested("tickets"):
+                queryset = queryset.prefetch_related(
+                    "tickets", "archived_tickets"
+                )
         return queryset
 
     def get_serializer_class(self) -> ModelSerializer:
         serializer_class = self.serializer_class
         if self.action == "create":
             return OrderCreateSerializer
+        if self.is_history_view():
+            return OrderHistorySerializer
         return serializer_class
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="view",
+                type=str,
+                location=OpenApiParameter.QUERY,
+                description="'history' returns the summaries stored "
+                            "at booking time instead of the tickets",
+                required=False,
+                enum=["history"],
+                examples=[
+                    OpenApiExample(
+                        name="view",
+                        value="history"
+                    )
+                ]
+            ),
+            *SPARSE_FIELDS_PARAMETERS,
+        ]
+    )
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        return super().list(request, *args, **kwargs)
+
+    @extend_schema(request=None, responses=CancellationSerializer)
+    @action(detail=True, methods=["POST"], url_path="cancel")
+    def cancel(self, request: Request, pk: int = None) -> Response:
+        """Cancel an order before its trips depart and release its seats"""
+        cancelled_orders, released_tickets = cancel_order(
+            self.get_object(), ValidationError
+        )
+        serializer = CancellationSerializer(
+            {
+                "cancelled_orders": cancelled_orders,
+                "released_tickets": released_tickets,
+            }
+        )
+        return Response(serializer.data)
+
+
+class SeatHoldViewSet(
+    TracedViewMixin,
+    viewsets.GenericViewSet,
+    mixins.ListModelMixin,
+    mixins.CreateModelMixin,
+    mixins.DestroyModelMixin,
+):
+    queryset = SeatHold.objects.all()
+    serializer_class = SeatHoldSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def perform_create(self, serializer: ModelSerializer) -> None:
+        serializer.save(user=self.request.user)
+
+    def get_queryset(self) -> QuerySet:
+        return self.queryset.filter(
+            user=self.request.user, expires_at__gt=timezone.now()
+        )
+
+
+class RouteDailyLoadViewSet(
+    TracedViewMixin,
+    ReplicaReadMixin,
+    viewsets.GenericViewSet,
+    mixins.ListModelMixin
+):
+    queryset = RouteDailyLoad.objects.all()
+    serializer_class = RouteDailyLoadSerializer
+    permission_classes = (IsAdminUser,)
+
+    def get_queryset(self) -> QuerySet:
+        period = DateRangeSerializer(data=self.request.query_params)
+        period.is_valid(raise_exception=True)
+        queryset = self.queryset.filter(
+            date__range=(
+                period.validated_data["date_from"],
+                period.validated_data["date_to"],
+            )
+        )
+        route_ids = get_route_ids(self.request)
+        if route_ids:
+            queryset = queryset.filter(route_id__in=route_ids)
+        return queryset
+
+    @extend_schema(
+        parameters=[
+            *DATE_RANGE_PARAMETERS,
+            ROUTES_PARAMETER,
+        ]
+    )
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        """Load factors by route and day from pre-aggregated rows"""
+        return super().list(request, *args, **kwargs)
+
+
+class TripForecastViewSet(
+    TracedViewMixin,
+    ReplicaReadMixin,
+    viewsets.GenericViewSet,
+    mixins.ListModelMixin
+):
+    queryset = TripForecast.objects.select_related("trip")
+    serializer_class = TripForecastSerializer
+    permission_classes = (IsAdminUser,)
+
+    def get_queryset(self) -> QuerySet:
+        start, end = get_period(self.request)
+        queryset = self.queryset.filter(
+            trip__departure_time__gte=start,
+            trip__departure_time__lt=end,
+            trip__cancelled_at__isnull=True,
+        )
+        route_ids = get_route_ids(self.request)
+        if route_ids:
+            queryset = queryset.filter(trip__route_id__in=route_ids)
+        return queryset.order_by("trip__departure_time", "trip_id")
+
+    @extend_schema(
+        parameters=[
+            *DATE_RANGE_PARAMETERS,
+            ROUTES_PARAMETER,
+        ]
+    )
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        """Projected sell-outs of trips departing in the period.
+
+        Computed by ``manage.py forecast_sellouts``.
+        """
+        return super().list(request, *args, **kwargs)
+
+
+async def get_stream_user(request: HttpRequest, trip_id: int):
+    """Authenticate by the Authorization header or ``?token=``.
+
+    EventSource in browsers can't send headers, hence the parameter. It
+    takes a token of the stream_token action for this trip rather than
+    an access token, as query strings end up in access logs.
+    """
+    authentication = JWTAuthentication()
+    raw_token = request.GET.get("token", None)
+    try:
+        if raw_token:
+            validated_token = SeatStreamToken(raw_token)
+            if validated_token.get("trip_id", None) != trip_id:
+                return None
+            return await sync_to_async(authentication.get_user)(
+                validated_token
+            )
+        user_and_token = await sync_to_async(authentication.authenticate)(
+            request
+        )
+    except (AuthenticationFailed, TokenError):
+        return None
+    return user_and_token[0] if user_and_token else None
+
+
+@require_GET
+async def trip_seats_stream(
+        request: HttpRequest, pk: int
+) -> StreamingHttpResponse | JsonResponse:
+    """Stream taken and freed seats of a trip as server-sent events.
+
+    The first "snapshot" event lists all taken places like
+    ``taken_places`` of the trip detail, then "taken" and "freed" events
+    list the places that changed. Needs an ASGI server, as WSGI ones
+    like ``runserver`` buffer the endless response.
+    """
+    user = await get_stream_user(request, pk)
+    if user is None or not user.is_active:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=401,
+        )
+    if not await Trip.objects.filter(pk=pk).aexists():
+        return JsonResponse(
+            {"detail": "No Trip matches the given query."}, status=404
+        )
+    return StreamingHttpResponse(
+        stream_seat_events(pk),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,10 +1,12 @@
 from django.contrib.auth import get_user_model
 from rest_framework.serializers import ModelSerializer
 
+from Railway_Service_API.tracing import TracedValidationMixin
+
 from user.models import User
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(TracedValidationMixin, ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = (
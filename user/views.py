@@ -1,17 +1,22 @@
 from rest_framework import generics
 from rest_framework.permissions import AllowAny, IsAuthenticated
 
+from Railway_Service_API.tracing import TracedViewMixin
+
 from user.models import User
 from user.serializers import UserSerializer
 
 
-class UserCreateView(generics.CreateAPIView):
+class UserCreateView(TracedViewMixin, generics.CreateAPIView):
     serializer_class = UserSerializer
     authentication_classes = ()
     permission_classes = (AllowAny,)
 
 
-class UserManageView(generics.RetrieveUpdateAPIView):
+class UserManageView(
+    TracedViewMixin,
+    generics.RetrieveUpdateAPIView
+):
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
 